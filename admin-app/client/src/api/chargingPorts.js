@@ -48,6 +48,52 @@ export const fetchChargingStatus = async (stationId) => {
   }
 };
 
+// Live charging status over Server-Sent Events. onUpdate receives the full
+// list of charging vehicles after every snapshot or delta; returns a function
+// that closes the stream. EventSource reconnects by itself after errors, but
+// gives up on a refused stream (503 when the server is at its stream limit),
+// so that case is retried here after STREAM_RETRY_MS.
+const STREAM_RETRY_MS = 5000;
+
+export const subscribeChargingStatus = (stationId, onUpdate) => {
+  let source;
+  let retryTimer;
+  let vehicles = new Map();
+
+  const publish = () => onUpdate(Array.from(vehicles.values()));
+
+  const connect = () => {
+    source = new EventSource(`${API_BASE_URL}/${stationId}/charging-status/stream/`);
+
+    source.addEventListener("snapshot", (event) => {
+      const data = JSON.parse(event.data);
+      vehicles = new Map(data.charging_vehicles.map((v) => [v.vehicle_id, v]));
+      publish();
+    });
+
+    source.addEventListener("delta", (event) => {
+      const data = JSON.parse(event.data);
+      data.removed.forEach((vehicleId) => vehicles.delete(vehicleId));
+      data.changed.forEach((v) => vehicles.set(v.vehicle_id, v));
+      publish();
+    });
+
+    source.onerror = (error) => {
+      console.error("Charging status stream error:", error);
+      if (source.readyState === EventSource.CLOSED) {
+        retryTimer = setTimeout(connect, STREAM_RETRY_MS);
+      }
+    };
+  };
+
+  connect();
+
+  return () => {
+    clearTimeout(retryTimer);
+    source.close();
+  };
+};
+
 export const assignVehicleToPort = async (stationId, portId, vehicleId) => {
   try {
     const res = await fetch(`${API_BASE_URL}/${stationId}/assign/`, {
@@ -1,9 +1,16 @@
 const API_BASE_URL = "http://127.0.0.1:8000/api/payments";
 
+const withQuery = (url, params) => {
+  const query = new URLSearchParams(params).toString();
+  return query ? `${url}?${query}` : url;
+};
+
+// params (optional): { limit, after, before, from, to } for cursor pagination;
+// paged responses include `page.next_cursor` / `page.prev_cursor`
 export const paymentsAPI = {
-  getPaymentsByStation: async (stationId) => {
+  getPaymentsByStation: async (stationId, params = {}) => {
     try {
-      const response = await fetch(`${API_BASE_URL}/${stationId}/`);
+      const response = await fetch(withQuery(`${API_BASE_URL}/${stationId}/`, params));
       
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
@@ -17,9 +24,9 @@ export const paymentsAPI = {
     }
   },
 
-  getAllPayments: async () => {
+  getAllPayments: async (params = {}) => {
     try {
-      const response = await fetch(`${API_BASE_URL}/`);
+      const response = await fetch(withQuery(`${API_BASE_URL}/`, params));
       
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
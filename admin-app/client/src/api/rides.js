@@ -1,8 +1,11 @@
 const API_BASE_URL = "http://127.0.0.1:8000/api/rides";
 
-export const fetchRides = async (station_id) => {
+// params (optional): { limit, after, before, from, to } for cursor pagination;
+// paged responses include `page.next_cursor` / `page.prev_cursor`
+export const fetchRides = async (station_id, params = {}) => {
   try {
-    const res = await fetch(`${API_BASE_URL}/${station_id}/`);
+    const query = new URLSearchParams(params).toString();
+    const res = await fetch(`${API_BASE_URL}/${station_id}/${query ? `?${query}` : ""}`);
     
     if (!res.ok) {
       throw new Error(`HTTP error! status: ${res.status}`);
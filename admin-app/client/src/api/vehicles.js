@@ -369,6 +369,29 @@ export const bulkUpdateVehicles = async (vehicles) => {
   }
 }
 
+// Set the status of many vehicles: selection is { vehicle_ids } and/or { filter: { station_id, model, type, status } }
+export const bulkUpdateVehicleStatus = async (status, selection) => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/vehicles/bulk-status/`, {
+      method: "PATCH",
+      headers: {
+        "Content-Type": "application/json",
+        "Accept": "application/json"
+      },
+      body: JSON.stringify({ status, ...selection }),
+    });
+
+    const data = await response.json();
+    if (!response.ok) {
+      throw new Error(data.message || `HTTP error! status: ${response.status}`);
+    }
+    return data;
+  } catch (error) {
+    console.error("Error bulk updating vehicle status:", error);
+    return { status: "error", message: error.message };
+  }
+}
+
 export const getVehicleHistory = async (vehicleId) => {
   try {
     console.log("Fetching vehicle history:", `${API_BASE_URL}/vehicles/history/${vehicleId}/`);
@@ -642,6 +665,7 @@ const vehicleApi = {
   getStationDetails,
   updateVehicleStatus,
   bulkUpdateVehicles,
+  bulkUpdateVehicleStatus,
   getVehicleHistory,
   searchVehicles,
   exportVehicles,
@@ -3,6 +3,7 @@ import {
   fetchChargingPorts, 
   fetchAvailableVehicles, 
   fetchChargingStatus,
+  subscribeChargingStatus,
   assignVehicleToPort, 
   removeVehicleFromPort,
   stopCharging
@@ -25,14 +26,18 @@ export default function ChargingPorts() {
   const [selectedPort, setSelectedPort] = useState(null);
   const [assigningVehicle, setAssigningVehicle] = useState(false);
 
-  // Auto-refresh charging status every 5 seconds
+  // Live charging status: stream when the browser supports it, else poll every 5 seconds
   useEffect(() => {
+    if (!stationId) return;
+
+    if (window.EventSource) {
+      return subscribeChargingStatus(stationId, setChargingVehicles);
+    }
+
     const interval = setInterval(async () => {
-      if (stationId) {
-        const chargingData = await fetchChargingStatus(stationId);
-        if (chargingData.status === "success") {
-          setChargingVehicles(chargingData.charging_vehicles || []);
-        }
+      const chargingData = await fetchChargingStatus(stationId);
+      if (chargingData.status === "success") {
+        setChargingVehicles(chargingData.charging_vehicles || []);
       }
     }, 5000);
 
@@ -311,6 +316,19 @@ export default function ChargingPorts() {
                         </span>
                       </div>
                       
+                      {vehicle.battery_level < 100 && vehicle.eta_minutes != null && (
+                        <div className="flex justify-between text-sm text-gray-600">
+                          <span>{vehicle.charging_power_kw} kW • {vehicle.energy_delivered_kwh} kWh</span>
+                          <span>Full in {vehicle.eta_minutes}m</span>
+                        </div>
+                      )}
+                      
+                      {vehicle.throttled && (
+                        <div className="text-xs text-orange-600">
+                          ⚡ Throttled by station power budget ({vehicle.charging_power_kw} of {vehicle.rated_power_kw} kW)
+                        </div>
+                      )}
+                      
                       {vehicle.battery_level >= 100 && (
                         <div className="text-center text-green-600 font-semibold">
                           🎉 Fully Charged!
@@ -91,6 +91,7 @@ export default function SettingsPage() {
     autoLock: true, 
     emergencyContact: "+91 98765 43210" 
   };
+  const charging = stationSettings.charging || { powerBudgetKw: null, allocation: "equal" };
 
   if (loading) return <div className="p-4">Loading...</div>;
   if (!stationSettings) return <div className="p-4">No settings found</div>;
@@ -463,6 +464,57 @@ export default function SettingsPage() {
               </div>
             </div>
           </div>
+
+          {/* Charging Power Budget */}
+          <div className="bg-white rounded-lg shadow-sm p-6 lg:col-span-2">
+            <div className="flex items-center gap-2 mb-4">
+              <div className="p-2 bg-yellow-100 rounded-lg">
+                <svg className="w-5 h-5 text-yellow-600" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+                  <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M13 10V3L4 14h7v7l9-11h-7z" />
+                </svg>
+              </div>
+              <h2 className="text-xl font-semibold text-gray-900">Charging Power</h2>
+            </div>
+
+            <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
+              <div>
+                <label className="block text-sm font-medium text-gray-700 mb-2">Station Power Budget (kW)</label>
+                <input
+                  type="number"
+                  min="0"
+                  step="0.1"
+                  className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent"
+                  value={charging.powerBudgetKw ?? ""}
+                  onChange={(e) =>
+                    setStationSettings({
+                      ...stationSettings,
+                      charging: { ...charging, powerBudgetKw: e.target.value === "" ? null : parseFloat(e.target.value) || 0 },
+                    })
+                  }
+                  placeholder="Unlimited"
+                />
+                <p className="text-xs text-gray-500 mt-1">Grid connection limit shared by all charging ports; empty for no limit</p>
+              </div>
+
+              <div>
+                <label className="block text-sm font-medium text-gray-700 mb-2">Allocation</label>
+                <select
+                  className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 focus:border-transparent"
+                  value={charging.allocation}
+                  onChange={(e) =>
+                    setStationSettings({
+                      ...stationSettings,
+                      charging: { ...charging, allocation: e.target.value },
+                    })
+                  }
+                >
+                  <option value="equal">Equal share</option>
+                  <option value="soc_priority">Lowest battery first</option>
+                </select>
+                <p className="text-xs text-gray-500 mt-1">How the budget is shared when sessions want more than it allows</p>
+              </div>
+            </div>
+          </div>
         </div>
       </div>
     </div>
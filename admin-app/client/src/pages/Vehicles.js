@@ -160,6 +160,9 @@ export default function Vehicles() {
     
     if (result.status === "success") {
       loadVehicles(); // Reload to get updated data
+    } else if (result.status === "queued") {
+      // All ports busy: the vehicle starts charging when one frees up
+      alert(result.message);
     } else {
       alert(result.message || "Failed to update vehicle status");
     }
@@ -544,6 +547,9 @@ export default function Vehicles() {
                       <div>Port: {vehicle.charging_port_info.port_id}</div>
                       <div>Type: {vehicle.charging_port_info.connector_type}</div>
                       <div>Power: {vehicle.charging_port_info.max_power_kw} kW</div>
+                      {vehicle.charging_port_info.eta_minutes != null && (
+                        <div>Full in: {vehicle.charging_port_info.eta_minutes} min</div>
+                      )}
                     </div>
                   </div>
                 )}
@@ -996,6 +1002,9 @@ export default function Vehicles() {
                         <div>
                           <h4 className="font-medium">{station.station_name || station.station_id}</h4>
                           <p className="text-sm text-gray-500">{formatLocation(station.location)}</p>
+                          {station.distance_km != null && (
+                            <p className="text-xs text-gray-400">{station.distance_km} km away</p>
+                          )}
                         </div>
                         <div className="text-right">
                           <div className="text-sm font-medium text-green-600">
@@ -0,0 +1,72 @@
+"""
+Atomic charging port allocation.
+
+A port is claimed with one conditional find_one_and_update on
+{"status": "available"}, so two concurrent requests can never both get it.
+The vehicle side is then updated conditionally too; if that fails the port
+claim is undone (release_port) before the error is returned. A crash
+between the two writes is repaired by charging recovery (recovery.py).
+"""
+from pymongo import ASCENDING
+
+from charging_ports import clock
+from charging_ports.model import port_power_kw
+from server.db import get_collection
+
+ports_collection = get_collection("charging_ports")
+
+PORT_RELEASE = {
+    "$set": {"status": "available", "current_vehicle_id": None, "vehicle_id": None},
+    "$unset": {"occupied_at": "", "charging_started_at": ""},
+}
+
+
+def claim_port(station_id, vehicle_id, port_id=None, now=None):
+    """
+    Occupy an available port for vehicle_id: the given port_id, or the lowest
+    numbered free port at the station. Returns the claimed port, or None if
+    there was no such free port.
+    """
+    now = now or clock.now()
+    query = {"station_id": station_id, "status": "available"}
+    if port_id is not None:
+        query["port_id"] = port_id
+    return ports_collection.find_one_and_update(
+        query,
+        {
+            "$set": {
+                "status": "occupied",
+                "vehicle_id": vehicle_id,  # Store vehicle_id in charging port
+                "current_vehicle_id": vehicle_id,
+                "occupied_at": now,
+                "charging_started_at": now
+            },
+            "$inc": {"usage_count": 1}
+        },
+        projection={"_id": 0, "port_id": 1, "station_id": 1, "max_power_kw": 1, "power_rating": 1},
+        sort=[("port_id", ASCENDING)]
+    )
+
+
+def has_free_port(station_id):
+    return ports_collection.count_documents({"station_id": station_id, "status": "available"}, limit=1) > 0
+
+
+def charging_fields(port, now=None):
+    """Vehicle fields that start a charging session on a claimed port"""
+    return {
+        "status": "charging",
+        "charging_port_id": port["port_id"],
+        "charging_started_at": now or clock.now(),
+        "port_power_kw": port_power_kw(port),
+        "allocated_power_kw": None,
+        "charging_energy_kwh": 0
+    }
+
+
+def release_port(station_id, port_id, vehicle_id=None):
+    """Free a port; with vehicle_id, only if that vehicle still holds it"""
+    query = {"station_id": station_id, "port_id": port_id}
+    if vehicle_id is not None:
+        query["$or"] = [{"current_vehicle_id": vehicle_id}, {"vehicle_id": vehicle_id}]
+    return ports_collection.update_one(query, PORT_RELEASE).modified_count > 0
@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
+
+
+def start_charging_scheduler(**kwargs):
+    from charging_ports.scheduler import scheduler
+    scheduler.start()
 
 
 class ChargingPortsConfig(AppConfig):
     name = 'charging_ports'
+
+    def ready(self):
+        # Serving workers run the scheduler; management commands never do
+        request_started.connect(start_charging_scheduler, dispatch_uid="start_charging_scheduler")
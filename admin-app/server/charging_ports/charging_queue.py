@@ -0,0 +1,176 @@
+"""
+Per-station charging queue.
+
+A vehicle asked to charge while every port at its station is busy is put
+in charging_queue instead of being turned away. Entries are served lowest
+battery first, then longest waiting. Whatever frees a port (stop_charging,
+remove_vehicle_from_port, a status change away from charging, the scheduler
+completing a session at 100%, recovery) calls dispatch(station_id), which
+hands free ports to the head of the queue:
+
+1. pop the head entry with find_one_and_delete, so two workers never
+   dispatch the same vehicle;
+2. claim a free port for it (allocation.claim_port); if there is none left
+   the entry is put back unchanged and dispatch stops, unless a port was
+   freed meanwhile (that port's dispatch found the queue without the entry);
+3. start the session with a conditional vehicle update; if the vehicle can
+   no longer charge (rented, moved, already charging) the port is released
+   and the entry dropped.
+
+Dispatch latency (port freed -> session started) and queue waits are kept
+per process and served with the queue state.
+"""
+import threading
+import time
+from collections import deque
+
+from pymongo import ASCENDING, ReturnDocument
+
+from charging_ports import clock
+from charging_ports.allocation import charging_fields, claim_port, has_free_port, release_port
+from server.db import get_collection
+
+queue_collection = get_collection("charging_queue")
+vehicles_collection = get_collection("vehicle_details")
+
+QUEUE_ORDER = [("battery_level", ASCENDING), ("enqueued_at", ASCENDING)]
+
+# Vehicles in these states are not started from the queue
+NOT_DISPATCHABLE = ["charging", "in_use"]
+
+_stats_lock = threading.Lock()
+_stats = {"dispatched": 0, "latency_ms": deque(maxlen=1000), "wait_seconds": deque(maxlen=1000)}
+
+
+def enqueue(vehicle, now=None):
+    """Queue a vehicle at its station (again: keeps its place); returns its queue entry"""
+    now = now or clock.now()
+    # The entry is returned by the upsert itself: a dispatch may pop it before a second read
+    return queue_collection.find_one_and_update(
+        {"vehicle_id": vehicle["vehicle_id"]},
+        {
+            "$set": {
+                "station_id": vehicle.get("station_id"),
+                "battery_level": vehicle.get("battery_level", vehicle.get("battery", 0)) or 0
+            },
+            "$setOnInsert": {"enqueued_at": now}
+        },
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def dequeue(vehicle_id):
+    """Take a vehicle out of any queue; returns whether it was queued"""
+    return queue_collection.delete_one({"vehicle_id": vehicle_id}).deleted_count > 0
+
+
+def dequeue_many(vehicle_ids):
+    """Take several vehicles out of any queue; returns how many were queued"""
+    return queue_collection.delete_many({"vehicle_id": {"$in": list(vehicle_ids)}}).deleted_count
+
+
+def queue_position(entry):
+    """1-based position of a queue entry at its station"""
+    ahead = queue_collection.count_documents({
+        "station_id": entry["station_id"],
+        "$or": [
+            {"battery_level": {"$lt": entry["battery_level"]}},
+            {"battery_level": entry["battery_level"], "enqueued_at": {"$lt": entry["enqueued_at"]}}
+        ]
+    })
+    return ahead + 1
+
+
+def dispatch(station_id, freed_at=None):
+    """
+    Start queued vehicles on the station's free ports. freed_at is the
+    time.monotonic() at which the caller freed a port, for latency stats.
+    Returns [(vehicle_id, port_id)] for the sessions started.
+    """
+    started = []
+    while True:
+        entry = queue_collection.find_one_and_delete({"station_id": station_id}, sort=QUEUE_ORDER)
+        if not entry:
+            break
+
+        port = claim_port(station_id, entry["vehicle_id"])
+        if not port:
+            # Still full: the entry goes back with its original priority
+            queue_collection.update_one(
+                {"vehicle_id": entry["vehicle_id"]},
+                {"$setOnInsert": {k: v for k, v in entry.items() if k not in ("_id", "vehicle_id")}},
+                upsert=True
+            )
+            # A port freed while the entry was out was dispatched against a queue
+            # without it, and nobody else will wake up for it
+            if has_free_port(station_id):
+                continue
+            break
+
+        now = clock.now()
+        result = vehicles_collection.update_one(
+            {"vehicle_id": entry["vehicle_id"], "station_id": station_id, "status": {"$nin": NOT_DISPATCHABLE}},
+            {"$set": {**charging_fields(port, now), "updated_at": now.isoformat()}}
+        )
+        if not result.matched_count:
+            release_port(station_id, port["port_id"], entry["vehicle_id"])
+            continue
+
+        started.append((entry["vehicle_id"], port["port_id"]))
+        _record(freed_at, (now - entry["enqueued_at"]).total_seconds())
+        print(f"🚦 Dispatched queued vehicle {entry['vehicle_id']} to port {port['port_id']}")
+    return started
+
+
+def dispatch_all():
+    """Dispatch at every station with a queue, e.g. after recovery freed ports"""
+    started = []
+    for station_id in queue_collection.distinct("station_id"):
+        started.extend(dispatch(station_id))
+    return started
+
+
+def _record(freed_at, wait_seconds):
+    with _stats_lock:
+        _stats["dispatched"] += 1
+        _stats["wait_seconds"].append(wait_seconds)
+        if freed_at is not None:
+            _stats["latency_ms"].append((time.monotonic() - freed_at) * 1000)
+
+
+def _summary(values):
+    if not values:
+        return {"mean": None, "p95": None}
+    ordered = sorted(values)
+    return {
+        "mean": round(sum(ordered) / len(ordered), 1),
+        "p95": round(ordered[max(0, int(len(ordered) * 0.95) - 1)], 1)
+    }
+
+
+def dispatch_stats():
+    """Dispatches by this process, with latency and wait over the last 1000"""
+    with _stats_lock:
+        return {
+            "dispatched": _stats["dispatched"],
+            "latency_ms": _summary(_stats["latency_ms"]),
+            "wait_seconds": _summary(_stats["wait_seconds"]),
+        }
+
+
+def queue_state(station_id, now=None):
+    """The station's queue in dispatch order"""
+    now = now or clock.now()
+    entries = queue_collection.find({"station_id": station_id}, {"_id": 0}).sort(QUEUE_ORDER)
+    return [
+        {
+            "position": position,
+            "vehicle_id": entry["vehicle_id"],
+            "battery_level": entry["battery_level"],
+            "enqueued_at": entry["enqueued_at"].isoformat(),
+            "waiting_seconds": int((now - entry["enqueued_at"]).total_seconds())
+        }
+        for position, entry in enumerate(entries, 1)
+    ]
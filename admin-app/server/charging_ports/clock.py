@@ -0,0 +1,84 @@
+"""
+Clock for the charging engine.
+
+The scheduler, recovery, port allocation, the live feeds and the charging
+durations/ETAs in the vehicle and charging status views read time through
+this module rather than datetime.now() and sleeps, so charging can run
+faster than real time:
+
+- WallClock(scale): real time when scale is 1, otherwise time running
+  `scale` times faster from the moment the clock was made. The configured
+  clock uses CHARGING_TIME_SCALE; at 60, a 10 second tick is waited for in
+  1/6 s and a car charges from empty in a few minutes.
+- ManualClock(start): time that only moves when advance() is called, for
+  harnesses that drive scheduler ticks themselves.
+
+Each process starts its own scaled clock, so accelerated time is meant for a
+single worker. Leases (server/leases.py) use the database server's clock:
+they track whether a worker is alive, not how far charging has got.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+
+class WallClock:
+    def __init__(self, scale=1.0):
+        if scale <= 0:
+            raise ValueError("Time scale must be positive")
+        self.scale = float(scale)
+        self._origin = datetime.now()
+        self._started = time.monotonic()
+
+    def now(self):
+        if self.scale == 1:
+            return datetime.now()
+        return self._origin + timedelta(seconds=(time.monotonic() - self._started) * self.scale)
+
+    def wait(self, event, seconds):
+        """Wait `seconds` of clock time or until event is set; returns whether it was set"""
+        return event.wait(seconds / self.scale)
+
+
+class ManualClock:
+    def __init__(self, start=None):
+        self._now = start or datetime.now()
+        self._moved = threading.Condition()
+
+    def now(self):
+        return self._now
+
+    def advance(self, seconds):
+        with self._moved:
+            self._now += timedelta(seconds=seconds)
+            self._moved.notify_all()
+        return self._now
+
+    def wait(self, event, seconds):
+        """Wait until advance() has moved time on by `seconds`, or event is set"""
+        deadline = self._now + timedelta(seconds=seconds)
+        with self._moved:
+            while self._now < deadline and not event.is_set():
+                # Events cannot notify the condition, so check them now and then
+                self._moved.wait(0.05)
+        return event.is_set()
+
+
+_clock = WallClock(settings.CHARGING["TIME_SCALE"])
+
+
+def get_clock():
+    return _clock
+
+
+def set_clock(clock):
+    """Swap the charging clock (e.g. for a ManualClock); returns the previous one"""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+
+def now():
+    return _clock.now()
@@ -0,0 +1,211 @@
+"""
+Live charging status over Server-Sent Events.
+
+Each worker process keeps at most one StationFeed per station, however many
+browser tabs are watching it. The feed reloads the station's charging rows
+once per charging tick (immediately when this process's scheduler has just
+ticked) and fans the difference out to its subscribers as "delta" events.
+
+Every subscriber has a bounded queue. A client too slow to drain it is not
+buffered without limit: its queue is dropped and it is sent one fresh
+"snapshot" event instead. Idle connections get a comment line every
+HEARTBEAT_SECONDS so proxies keep them open, and streams end after
+MAX_STREAM_SECONDS; EventSource reconnects on its own (after RETRY_MS).
+
+Each open stream holds a worker thread, so a process serves at most
+CHARGING_MAX_LIVE_STREAMS of them (open_stream returns None beyond that)
+and a feed is dropped when its last subscriber leaves.
+"""
+import json
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from charging_ports import clock
+
+HEARTBEAT_SECONDS = 15
+MAX_STREAM_SECONDS = 300
+RETRY_MS = 3000
+QUEUE_SIZE = 16
+
+# Row fields recomputed from the clock on every load; a change in these alone is not sent
+VOLATILE_FIELDS = ("estimated_completion",)
+
+_feeds = {}
+# Guards _feeds and _open_streams; taken before a feed's own lock
+_feeds_lock = threading.Lock()
+_open_streams = 0
+
+
+class Subscriber:
+    def __init__(self):
+        self.events = queue.Queue(maxsize=QUEUE_SIZE)
+        self.needs_snapshot = threading.Event()
+
+    def offer(self, event):
+        if self.needs_snapshot.is_set():
+            return  # The snapshot it is owed supersedes any delta
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            # Too slow: drop what is queued and resync with a snapshot
+            while True:
+                try:
+                    self.events.get_nowait()
+                except queue.Empty:
+                    break
+            self.needs_snapshot.set()
+
+
+class StationFeed:
+    def __init__(self, station_id, load, interval):
+        self.station_id = station_id
+        self.load = load
+        self.interval = interval
+        self.rows = {}
+        self.subscribers = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.rows.values())
+
+    def start(self):
+        """Load the rows and start refreshing, unless the feed is already running"""
+        with self._lock:
+            if self._thread is None:
+                # First load happens here so the new subscriber starts from real data
+                self.rows = {row["vehicle_id"]: row for row in self.load(self.station_id)}
+                self._thread = threading.Thread(
+                    target=self._run, name=f"charging-feed-{self.station_id}", daemon=True
+                )
+                self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            clock.get_clock().wait(self._wake, self.interval)
+            self._wake.clear()
+            with self._lock:
+                if not self.subscribers:
+                    self._thread = None
+                    return
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"❌ Charging feed for station {self.station_id} failed: {e}")
+
+    def refresh(self):
+        rows = {row["vehicle_id"]: row for row in self.load(self.station_id)}
+        with self._lock:
+            changed = [row for vehicle_id, row in rows.items() if not _same(self.rows.get(vehicle_id), row)]
+            removed = [vehicle_id for vehicle_id in self.rows if vehicle_id not in rows]
+            self.rows = rows
+            subscribers = list(self.subscribers)
+        if changed or removed:
+            event = {"changed": changed, "removed": removed, "total_charging": len(rows)}
+            for subscriber in subscribers:
+                subscriber.offer(event)
+
+
+def _same(old, new):
+    if old is None:
+        return False
+    return all(old.get(key) == value for key, value in new.items() if key not in VOLATILE_FIELDS)
+
+
+def open_stream(station_id, load):
+    """
+    Subscribe a client to the station's feed, creating it if needed.
+    Returns (feed, subscriber), or None if this process already serves
+    CHARGING_MAX_LIVE_STREAMS streams. Pair with close_stream().
+    """
+    global _open_streams
+    with _feeds_lock:
+        if _open_streams >= settings.CHARGING["MAX_LIVE_STREAMS"]:
+            return None
+        feed = _feeds.get(station_id)
+        if feed is None:
+            feed = _feeds[station_id] = StationFeed(station_id, load, settings.CHARGING["TICK_SECONDS"])
+        subscriber = Subscriber()
+        with feed._lock:
+            feed.subscribers.add(subscriber)
+        _open_streams += 1
+    try:
+        feed.start()
+    except Exception:
+        close_stream(feed, subscriber)
+        raise
+    return feed, subscriber
+
+
+def close_stream(feed, subscriber):
+    """Unsubscribe (once); the feed is dropped with its last subscriber"""
+    global _open_streams
+    with _feeds_lock:
+        with feed._lock:
+            if subscriber not in feed.subscribers:
+                return
+            feed.subscribers.discard(subscriber)
+            idle = not feed.subscribers
+        _open_streams -= 1
+        if idle and _feeds.get(feed.station_id) is feed:
+            del _feeds[feed.station_id]
+    if idle:
+        # Its thread sees no subscribers and exits
+        feed.wake()
+
+
+def notify_tick():
+    """Called after a scheduler tick in this process: refresh watched stations now"""
+    with _feeds_lock:
+        feeds = list(_feeds.values())
+    for feed in feeds:
+        feed.wake()
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+class EventStream:
+    """
+    SSE body for one subscribed client. The response closes it when the
+    client goes away (even before the first read), which gives back the
+    subscription and the stream slot.
+    """
+
+    def __init__(self, feed, subscriber):
+        self.feed = feed
+        self.subscriber = subscriber
+
+    def __iter__(self):
+        feed, subscriber = self.feed, self.subscriber
+        try:
+            yield f"retry: {RETRY_MS}\n"
+            rows = feed.snapshot()
+            yield _sse("snapshot", {"charging_vehicles": rows, "total_charging": len(rows)})
+            deadline = time.monotonic() + MAX_STREAM_SECONDS
+            while time.monotonic() < deadline:
+                if subscriber.needs_snapshot.is_set():
+                    subscriber.needs_snapshot.clear()
+                    rows = feed.snapshot()
+                    yield _sse("snapshot", {"charging_vehicles": rows, "total_charging": len(rows)})
+                try:
+                    event = subscriber.events.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield _sse("delta", event)
+        finally:
+            self.close()
+
+    def close(self):
+        close_stream(self.feed, self.subscriber)
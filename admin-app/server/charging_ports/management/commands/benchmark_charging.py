@@ -0,0 +1,68 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from charging_ports.scheduler import ChargingScheduler
+from server.db import get_collection, track_round_trips
+
+BENCHMARK_COLLECTION = "charging_benchmark_vehicles"
+
+
+class Command(BaseCommand):
+    help = "Time charging scheduler ticks against simulated sessions in a scratch collection"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sessions", type=int, default=1000)
+        parser.add_argument("--ticks", type=int, default=20)
+        parser.add_argument("--interval", type=float, default=settings.CHARGING["TICK_SECONDS"],
+                            help="Simulated seconds of charging per tick")
+        parser.add_argument("--keep", action="store_true", help=f"Keep the {BENCHMARK_COLLECTION} collection")
+
+    def handle(self, *args, **options):
+        sessions, ticks = options["sessions"], options["ticks"]
+        if sessions <= 0 or ticks <= 0:
+            raise CommandError("--sessions and --ticks must be positive")
+
+        collection = get_collection(BENCHMARK_COLLECTION)
+        collection.drop()
+        collection.create_index("vehicle_id", unique=True)
+        collection.create_index([("status", 1), ("battery_level", 1)])
+        collection.insert_many([
+            {
+                "vehicle_id": f"BENCH{i:06d}",
+                "station_id": 9000 + i % 10,
+                "type": ("Scooter", "Bike", "Auto", "Car")[i % 4],
+                "status": "charging",
+                "battery_level": 0,
+                "port_power_kw": 22,
+                "charging_port_id": f"P{i:06d}",
+            }
+            for i in range(sessions)
+        ])
+
+        scheduler = ChargingScheduler(collection, options["interval"])
+
+        durations = []
+        round_trips = []
+        writes = 0
+        try:
+            for _ in range(ticks):
+                started = time.perf_counter()
+                with track_round_trips() as counter:
+                    writes += scheduler.tick()
+                durations.append(time.perf_counter() - started)
+                round_trips.append(counter["round_trips"])
+        finally:
+            if not options["keep"]:
+                collection.drop()
+
+        total = sum(durations)
+        p95 = sorted(durations)[max(0, int(len(durations) * 0.95) - 1)]
+        self.stdout.write(f"Sessions:              {sessions}")
+        self.stdout.write(f"Ticks:                 {ticks}")
+        self.stdout.write(f"Tick time (ms):        mean {statistics.mean(durations) * 1000:.1f}, p95 {p95 * 1000:.1f}")
+        self.stdout.write(f"Vehicle updates/sec:   {writes / total:.0f}" if total else "Vehicle updates/sec:   n/a")
+        self.stdout.write(f"Round trips per tick:  {max(round_trips)} (thread per vehicle: {2 * sessions})")
+        self.stdout.write(self.style.SUCCESS(f"{writes} battery updates written"))
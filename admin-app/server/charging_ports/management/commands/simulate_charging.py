@@ -0,0 +1,112 @@
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import UpdateOne
+
+from charging_ports.clock import ManualClock, set_clock
+from charging_ports.scheduler import ChargingScheduler
+from charging_ports.telemetry import BatteryTelemetry
+from server.db import get_collection, track_round_trips
+
+SIMULATION_COLLECTION = "charging_simulation_vehicles"
+PORT_POWERS_KW = (7.4, 22, 50)
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate hours of continuous station charging in seconds on a manual clock "
+        "and report database write throughput"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=float, default=24, help="Simulated hours of charging")
+        parser.add_argument("--ports", type=int, default=200, help="Ports kept busy throughout")
+        parser.add_argument("--stations", type=int, default=10)
+        parser.add_argument("--interval", type=float, default=settings.CHARGING["TICK_SECONDS"],
+                            help="Simulated seconds per tick")
+        parser.add_argument("--telemetry", action="store_true",
+                            help="Also record battery history, into scratch telemetry collections")
+        parser.add_argument("--keep", action="store_true", help=f"Keep the {SIMULATION_COLLECTION} collection")
+
+    def handle(self, *args, **options):
+        ports, interval = options["ports"], options["interval"]
+        if min(options["hours"], ports, options["stations"], interval) <= 0:
+            raise CommandError("--hours, --ports, --stations and --interval must be positive")
+
+        rng = random.Random(0)
+        clock = ManualClock()
+        start = clock.now()
+        end = start + timedelta(hours=options["hours"])
+
+        collection = get_collection(SIMULATION_COLLECTION)
+        collection.drop()
+        collection.create_index("vehicle_id", unique=True)
+        collection.create_index([("status", 1), ("battery_level", 1)])
+        collection.insert_many([
+            {
+                "vehicle_id": f"SIM{i:06d}",
+                "station_id": 9100 + i % options["stations"],
+                "type": ("Scooter", "Bike", "Auto", "Car")[i % 4],
+                "status": "charging",
+                "battery_level": rng.randint(5, 60),
+                "port_power_kw": PORT_POWERS_KW[i % len(PORT_POWERS_KW)],
+                "charging_port_id": f"P{i:06d}",
+                "charging_started_at": start,
+                "charging_energy_kwh": 0,
+            }
+            for i in range(ports)
+        ])
+
+        telemetry = None
+        if options["telemetry"]:
+            telemetry = BatteryTelemetry(samples=f"{SIMULATION_COLLECTION}_samples",
+                                         rollups=f"{SIMULATION_COLLECTION}_rollups")
+            telemetry.drop()
+        scheduler = ChargingScheduler(collection, interval, clock=clock, telemetry=telemetry)
+        # Timestamps written outside the scheduler (allocation, recovery) follow the simulation too
+        previous = set_clock(clock)
+        ticks = writes = round_trips = sessions = 0
+        energy = 0.0
+        started = time.perf_counter()
+        try:
+            while clock.now() < end:
+                with track_round_trips() as counter:
+                    writes += scheduler.tick()
+                    # A full vehicle leaves and the next one plugs into its port
+                    full = list(collection.find(
+                        {"status": "charging", "battery_level": {"$gte": 100}},
+                        {"_id": 0, "vehicle_id": 1, "charging_energy_kwh": 1}
+                    ))
+                    if full:
+                        collection.bulk_write([
+                            UpdateOne({"vehicle_id": v["vehicle_id"]}, {
+                                "$set": {"battery_level": rng.randint(5, 60), "charging_started_at": clock.now(),
+                                         "charging_energy_kwh": 0},
+                                "$unset": {"charge_level": "", "battery": ""}
+                            })
+                            for v in full
+                        ], ordered=False)
+                round_trips += counter["round_trips"]
+                sessions += len(full)
+                energy += sum(v.get("charging_energy_kwh", 0) for v in full)
+                ticks += 1
+                clock.advance(interval)
+            energy += sum(v.get("charging_energy_kwh", 0) for v in collection.find({}, {"_id": 0, "charging_energy_kwh": 1}))
+        finally:
+            set_clock(previous)
+            if not options["keep"]:
+                collection.drop()
+                if telemetry:
+                    telemetry.drop()
+
+        wall = time.perf_counter() - started
+        simulated = (clock.now() - start).total_seconds()
+        self.stdout.write(f"Simulated:             {simulated / 3600:.1f} h in {wall:.1f} s ({simulated / wall:.0f}x real time)")
+        self.stdout.write(f"Ticks:                 {ticks} of {interval:g} s, {ports} busy ports")
+        self.stdout.write(f"Sessions completed:    {sessions} ({energy:.0f} kWh delivered)")
+        self.stdout.write(f"Battery updates/sec:   {writes / wall:.0f}")
+        self.stdout.write(f"Round trips per tick:  {round_trips / ticks:.1f}")
+        self.stdout.write(self.style.SUCCESS(f"{writes} battery updates written"))
@@ -0,0 +1,211 @@
+"""
+Power-aware charging model.
+
+A vehicle charges at the lower of its port's rating and its on-board
+charger, less CHARGE_EFFICIENCY losses. Up to TAPER_START percent the
+battery fills at that constant power; above it power falls linearly to
+TAPER_FLOOR of full power at 100%, like a constant-current/constant-voltage
+charge. Both phases have closed forms, so the level after any interval and
+the time to full are exact rather than stepped tick by tick.
+
+Battery capacity and on-board charger power come from the vehicle's
+battery_capacity_kwh / max_charge_kw fields when set, otherwise from its
+type in VEHICLE_SPECS.
+"""
+import math
+import re
+from datetime import timedelta
+
+from pymongo import UpdateOne
+
+# type -> (battery capacity kWh, on-board charger kW)
+VEHICLE_SPECS = {
+    "scooter": (2.5, 1.0),
+    "bike": (4.0, 1.5),
+    "auto": (8.0, 3.3),
+    "car": (40.0, 7.4),
+}
+DEFAULT_SPEC = (3.0, 1.2)
+DEFAULT_PORT_POWER_KW = 22.0
+
+CHARGE_EFFICIENCY = 0.9
+TAPER_START = 80.0
+TAPER_FLOOR = 0.2
+
+# Fraction of full power lost per percent above TAPER_START
+_TAPER_SLOPE = (1 - TAPER_FLOOR) / (100 - TAPER_START)
+
+
+def port_power_kw(port):
+    """Rated power of a port from max_power_kw, or a power_rating like "22kW" """
+    power = port.get("max_power_kw")
+    if isinstance(power, (int, float)) and power > 0:
+        return float(power)
+    match = re.search(r"\d+(\.\d+)?", str(port.get("power_rating", "")))
+    return float(match.group()) if match else DEFAULT_PORT_POWER_KW
+
+
+def vehicle_spec(vehicle):
+    """(battery capacity kWh, on-board charger kW) for a vehicle"""
+    capacity, charger = VEHICLE_SPECS.get(str(vehicle.get("type", "")).lower(), DEFAULT_SPEC)
+    capacity = vehicle.get("battery_capacity_kwh") or capacity
+    charger = vehicle.get("max_charge_kw") or charger
+    return float(capacity), float(charger)
+
+
+def charge_level(vehicle):
+    """
+    Exact battery percentage. The scheduler keeps the unrounded level in
+    charge_level next to the displayed battery_level; if battery_level was
+    edited since, it wins.
+    """
+    shown = vehicle.get("battery_level", vehicle.get("battery", 0)) or 0
+    exact = vehicle.get("charge_level")
+    if isinstance(exact, (int, float)) and abs(exact - shown) <= 0.051:
+        return float(exact)
+    return float(shown)
+
+
+def _rate(power_kw, capacity_kwh):
+    """Percent per second at full power"""
+    if power_kw <= 0 or capacity_kwh <= 0:
+        return 0.0
+    return power_kw * CHARGE_EFFICIENCY / capacity_kwh * 100 / 3600
+
+
+def _taper(level):
+    return 1 - _TAPER_SLOPE * (level - TAPER_START)
+
+
+def draw_factor(level):
+    """Fraction of full power a battery at `level` draws"""
+    return _taper(level) if level > TAPER_START else 1.0
+
+
+def advance(level, power_kw, capacity_kwh, seconds):
+    """Battery percentage after charging for `seconds` from `level`"""
+    rate = _rate(power_kw, capacity_kwh)
+    if rate <= 0 or seconds <= 0 or level >= 100:
+        return min(level, 100.0)
+    if level < TAPER_START:
+        to_taper = (TAPER_START - level) / rate
+        if seconds <= to_taper:
+            return level + rate * seconds
+        seconds -= to_taper
+        level = TAPER_START
+    # In the taper, d(level)/dt = rate * _taper(level), so _taper decays exponentially
+    remaining = _taper(level) * math.exp(-_TAPER_SLOPE * rate * seconds)
+    return min(100.0, TAPER_START + (1 - remaining) / _TAPER_SLOPE)
+
+
+def seconds_to_full(level, power_kw, capacity_kwh):
+    """Seconds until 100%, or None if the vehicle is not receiving power"""
+    if level >= 100:
+        return 0.0
+    rate = _rate(power_kw, capacity_kwh)
+    if rate <= 0:
+        return None
+    seconds = 0.0
+    if level < TAPER_START:
+        seconds += (TAPER_START - level) / rate
+        level = TAPER_START
+    return seconds + math.log(_taper(level) / TAPER_FLOOR) / (_TAPER_SLOPE * rate)
+
+
+def charge_vehicle(vehicle, port_power, seconds):
+    """(new level, energy delivered in kWh) after `seconds` on a port, or None if nothing changed"""
+    capacity, charger = vehicle_spec(vehicle)
+    level = charge_level(vehicle)
+    new_level = advance(level, min(port_power, charger), capacity, seconds)
+    if new_level <= level:
+        return None
+    return new_level, (new_level - level) / 100 * capacity
+
+
+def charge_batch(vehicles, powers, seconds):
+    """
+    Advance a batch of charging vehicles by `seconds` in one pass. `powers`
+    maps vehicle_id to port power in kW. Yields (vehicle, new_level,
+    energy_kwh) for every vehicle that gained charge.
+    """
+    for vehicle in vehicles:
+        charged = charge_vehicle(vehicle, powers.get(vehicle["vehicle_id"], DEFAULT_PORT_POWER_KW), seconds)
+        if charged:
+            yield (vehicle, *charged)
+
+
+# Vehicle fields the model reads
+VEHICLE_FIELDS = {
+    "_id": 0, "vehicle_id": 1, "station_id": 1, "type": 1, "battery_level": 1, "battery": 1,
+    "charge_level": 1, "battery_capacity_kwh": 1, "max_charge_kw": 1,
+    "charging_port_id": 1, "port_power_kw": 1, "allocated_power_kw": 1,
+}
+
+
+def charge_update(vehicle, level, energy_kwh, now, allocated_kw=None):
+    """
+    The write recording charge progress, skipped if charging was stopped
+    since the read. allocated_kw records the power a station budget allowed.
+    """
+    shown = round(level, 1)
+    fields = {
+        "battery_level": shown,
+        "battery": shown,  # For compatibility
+        "charge_level": level,
+        "last_charging_update": now
+    }
+    if allocated_kw is not None:
+        fields["allocated_power_kw"] = round(allocated_kw, 3)
+    return UpdateOne(
+        {"vehicle_id": vehicle["vehicle_id"], "station_id": vehicle.get("station_id"), "status": "charging"},
+        {"$set": fields, "$inc": {"charging_energy_kwh": energy_kwh}}
+    )
+
+
+def charging_eta(vehicle, port_power, now):
+    """
+    ETA fields for a charging vehicle: effective power (throttled if the
+    station's power budget allocated less), minutes to full at that power,
+    estimated completion time and energy delivered this session.
+    """
+    capacity, charger = vehicle_spec(vehicle)
+    rated = min(port_power, charger)
+    allocated = vehicle.get("allocated_power_kw")
+    power = min(rated, allocated) if isinstance(allocated, (int, float)) else rated
+    remaining = seconds_to_full(charge_level(vehicle), power, capacity)
+    return {
+        "charging_power_kw": round(power, 2),
+        "rated_power_kw": round(rated, 2),
+        "throttled": power < rated - 0.01,
+        "eta_minutes": math.ceil(remaining / 60) if remaining is not None else None,
+        "estimated_completion": (now + timedelta(seconds=remaining)).isoformat() if remaining is not None else None,
+        "energy_delivered_kwh": round(vehicle.get("charging_energy_kwh", 0) or 0, 3),
+    }
+
+
+def session_powers(vehicles, ports_collection=None):
+    """
+    Port power per vehicle_id. Vehicles store their port's power in
+    port_power_kw when charging starts; the rest are looked up in one query
+    (or get DEFAULT_PORT_POWER_KW without a ports collection).
+    """
+    powers = {}
+    missing = []
+    for vehicle in vehicles:
+        if vehicle.get("port_power_kw"):
+            powers[vehicle["vehicle_id"]] = float(vehicle["port_power_kw"])
+        elif vehicle.get("charging_port_id") and ports_collection is not None:
+            missing.append(vehicle)
+    if missing:
+        ports = {
+            (p.get("station_id"), p.get("port_id")): p
+            for p in ports_collection.find(
+                {"$or": [{"station_id": v.get("station_id"), "port_id": v["charging_port_id"]} for v in missing]},
+                {"_id": 0, "station_id": 1, "port_id": 1, "max_power_kw": 1, "power_rating": 1}
+            )
+        }
+        for vehicle in missing:
+            port = ports.get((vehicle.get("station_id"), vehicle["charging_port_id"]))
+            if port:
+                powers[vehicle["vehicle_id"]] = port_power_kw(port)
+    return powers
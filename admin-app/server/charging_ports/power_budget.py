@@ -0,0 +1,138 @@
+"""
+Station power budgets.
+
+A station's grid connection is set in its settings as
+charging.powerBudgetKw (unset or 0 = unlimited) with charging.allocation
+"equal" or "soc_priority". On every tick the scheduler shares each
+station's budget among its sessions:
+
+- equal: max-min fair share. Every session gets the same power, except
+  ones that draw less than that share, whose unused power is shared among
+  the rest (water-filling).
+- soc_priority: lowest battery first; each session gets all it can draw
+  until the budget runs out.
+
+A session's demand is what it would draw unthrottled: the lower of port and
+on-board charger power, reduced in the taper above TAPER_START. Both modes
+bucket sessions (by demand in DEMAND_STEP_KW steps, by whole battery
+percent) instead of sorting them, so a tick stays O(sessions) however large
+the depot.
+
+The result is the power each session is charged at this tick, expressed
+like a port rating, and is stored on the vehicle as allocated_power_kw so
+readers report throttled rates (model.charging_eta).
+"""
+from collections import defaultdict
+
+from charging_ports.model import charge_level, draw_factor, vehicle_spec
+from server.db import get_collection
+
+settings_collection = get_collection("station_settings")
+
+ALLOCATION_MODES = ("equal", "soc_priority")
+DEFAULT_ALLOCATION = "equal"
+# Equal shares bucket demands (which vary continuously in the taper) to this
+# resolution; a session may get up to one step less than it could draw
+DEMAND_STEP_KW = 0.1
+
+
+def station_budgets(station_ids):
+    """{station_id: (budget kW, mode)} for the stations that have a budget, in one query"""
+    budgets = {}
+    for doc in settings_collection.find(
+        {"station_id": {"$in": list(station_ids)}, "charging.powerBudgetKw": {"$gt": 0}},
+        {"_id": 0, "station_id": 1, "charging": 1}
+    ):
+        charging = doc["charging"]
+        mode = charging.get("allocation")
+        budgets[doc["station_id"]] = (
+            float(charging["powerBudgetKw"]),
+            mode if mode in ALLOCATION_MODES else DEFAULT_ALLOCATION
+        )
+    return budgets
+
+
+def _demand_step(demand):
+    return int(demand / DEMAND_STEP_KW)
+
+
+def _equal_shares(demands, budget):
+    """
+    Max-min fair shares of the budget for `demands`, rounded down to
+    DEMAND_STEP_KW. Returns ({step: allocated} for the steps drawing less
+    than the fair share, the share every other step is capped at).
+    """
+    # Counting sort over the steps: O(sessions + highest demand / step)
+    counts = [0] * (max(map(_demand_step, demands), default=0) + 1)
+    for demand in demands:
+        counts[_demand_step(demand)] += 1
+    shares = {}
+    remaining, sessions = budget, len(demands)
+    for step, count in enumerate(counts):
+        if not count:
+            continue
+        share = remaining / sessions
+        demand = step * DEMAND_STEP_KW
+        if demand > share:
+            # Everyone from here on is capped at the same share
+            return shares, share
+        shares[step] = demand
+        remaining -= demand * count
+        sessions -= count
+    return shares, 0.0
+
+
+def allocate(sessions, budget, mode=DEFAULT_ALLOCATION):
+    """
+    Share `budget` kW among sessions [(vehicle_id, demand kW, battery level)].
+    Returns {vehicle_id: allocated kW}; allocations never exceed demand.
+    """
+    total = sum(demand for _, demand, _ in sessions)
+    if total <= budget:
+        return {vehicle_id: demand for vehicle_id, demand, _ in sessions}
+
+    if mode == "soc_priority":
+        # Counting sort on whole battery percent
+        buckets = [[] for _ in range(101)]
+        for session in sessions:
+            buckets[min(100, max(0, int(session[2])))].append(session)
+        allocated, remaining = {}, budget
+        for bucket in buckets:
+            for vehicle_id, demand, _ in bucket:
+                allocated[vehicle_id] = min(demand, remaining)
+                remaining -= allocated[vehicle_id]
+        return allocated
+
+    shares, cap = _equal_shares([demand for _, demand, _ in sessions], budget)
+    return {
+        vehicle_id: min(demand, shares.get(_demand_step(demand), cap))
+        for vehicle_id, demand, _ in sessions
+    }
+
+
+def budget_powers(vehicles, powers, default_power):
+    """
+    Apply station budgets to one tick's sessions. `powers` maps vehicle_id
+    to port power; returns {vehicle_id: power to charge at} for every
+    vehicle, throttled where its station is over budget.
+    """
+    by_station = defaultdict(list)
+    effective = {}
+    for vehicle in vehicles:
+        _, charger = vehicle_spec(vehicle)
+        power = min(powers.get(vehicle["vehicle_id"], default_power), charger)
+        effective[vehicle["vehicle_id"]] = power
+        by_station[vehicle.get("station_id")].append(vehicle)
+
+    budgets = station_budgets(by_station)
+    for station_id, (budget, mode) in budgets.items():
+        sessions = []
+        factors = {}
+        for vehicle in by_station[station_id]:
+            vehicle_id, level = vehicle["vehicle_id"], charge_level(vehicle)
+            factors[vehicle_id] = draw_factor(level)
+            sessions.append((vehicle_id, effective[vehicle_id] * factors[vehicle_id], level))
+        for vehicle_id, draw in allocate(sessions, budget, mode).items():
+            # Back from drawn power to the rating the model tapers itself
+            effective[vehicle_id] = draw / factors[vehicle_id]
+    return effective
@@ -0,0 +1,168 @@
+"""
+Charging recovery, run by a worker when it takes over the scheduler lease
+(at boot, or after the previous holder died).
+
+Battery levels are caught up for the time nobody was ticking in one
+bulk_write, and vehicle/port pairs left half-written by a crash are
+reconciled:
+
+- an occupied port whose vehicle is not charging on it is freed;
+- a charging vehicle whose port is free is put back on that port;
+- a charging vehicle whose port is missing or taken by another vehicle
+  stops charging.
+
+Records younger than RECONCILE_GRACE_SECONDS are left alone, since a view may
+still be between its port and vehicle writes.
+"""
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from charging_ports import clock
+from charging_ports.allocation import PORT_RELEASE
+from charging_ports.model import (
+    DEFAULT_PORT_POWER_KW, VEHICLE_FIELDS, charge_update, charge_vehicle, session_powers
+)
+
+RECONCILE_GRACE_SECONDS = 60
+
+STOP_VEHICLE = {
+    "$set": {"status": "available"},
+    "$unset": {"charging_port_id": "", "charging_started_at": ""},
+}
+
+
+def as_datetime(value):
+    """Timestamps are stored both as datetimes and as ISO strings"""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+        except ValueError:
+            return None
+    return None
+
+
+def _port_vehicle(port):
+    return port.get("current_vehicle_id") or port.get("vehicle_id")
+
+
+def catch_up_batteries(vehicles_collection, ports_collection, vehicles, now):
+    """
+    Charge every vehicle for the whole time since its last update in one
+    pass. Counts as the current tick; returns the number of vehicles written.
+    """
+    powers = session_powers(vehicles, ports_collection)
+    ops = []
+    for vehicle in vehicles:
+        last_update = as_datetime(vehicle.get("last_charging_update")) or as_datetime(vehicle.get("charging_started_at"))
+        elapsed = (now - last_update).total_seconds() if last_update else 0
+        port_power = powers.get(vehicle["vehicle_id"], DEFAULT_PORT_POWER_KW)
+        charged = charge_vehicle(vehicle, port_power, elapsed)
+        if charged:
+            ops.append(charge_update(vehicle, *charged, now))
+    if ops:
+        vehicles_collection.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def reconcile_ports(vehicles_collection, ports_collection, vehicles, now):
+    """
+    Fix port/vehicle pairs that disagree. Returns (summary, affected station
+    ids, ids of vehicles taken off charge).
+    """
+    grace_start = now - timedelta(seconds=RECONCILE_GRACE_SECONDS)
+
+    def settled(value):
+        started = as_datetime(value)
+        return started is None or started < grace_start
+
+    claimants = {}
+    for vehicle in vehicles:
+        key = (vehicle.get("station_id"), vehicle.get("charging_port_id"))
+        claimants.setdefault(key, []).append(vehicle)
+
+    # Occupied ports plus every port a charging vehicle points at, in one query
+    referenced = [{"station_id": key[0], "port_id": key[1]} for key in claimants if key[1]]
+    ports = {
+        (p.get("station_id"), p.get("port_id")): p
+        for p in ports_collection.find(
+            {"$or": [{"status": "occupied"}, *referenced]},
+            {"_id": 0, "station_id": 1, "port_id": 1, "status": 1,
+             "current_vehicle_id": 1, "vehicle_id": 1, "occupied_at": 1}
+        )
+    }
+
+    port_ops = []
+    vehicle_ops = []
+    stations = set()
+    stopped = set()
+    summary = {"ports_freed": 0, "ports_reclaimed": 0}
+
+    def stop(vehicle):
+        if settled(vehicle.get("charging_started_at")):
+            vehicle_ops.append(UpdateOne(
+                {"vehicle_id": vehicle["vehicle_id"], "station_id": vehicle.get("station_id"), "status": "charging"},
+                STOP_VEHICLE
+            ))
+            stopped.add(vehicle["vehicle_id"])
+            stations.add(vehicle.get("station_id"))
+
+    for key, port in ports.items():
+        status = port.get("status")
+        waiting = claimants.pop(key, [])
+        owner = _port_vehicle(port) if status == "occupied" else None
+        keeper = next((v for v in waiting if v["vehicle_id"] == owner), None)
+
+        if keeper is None and status in ("available", "occupied") and settled(port.get("occupied_at")):
+            keeper = next((v for v in waiting if settled(v.get("charging_started_at"))), None)
+            port_filter = {"station_id": key[0], "port_id": key[1], "status": status}
+            if keeper:
+                port_ops.append(UpdateOne(port_filter, {"$set": {
+                    "status": "occupied",
+                    "vehicle_id": keeper["vehicle_id"],
+                    "current_vehicle_id": keeper["vehicle_id"],
+                    "occupied_at": now
+                }}))
+                summary["ports_reclaimed"] += 1
+                stations.add(key[0])
+            elif status == "occupied" and not waiting:
+                port_ops.append(UpdateOne(port_filter, PORT_RELEASE))
+                summary["ports_freed"] += 1
+                stations.add(key[0])
+
+        for vehicle in waiting:
+            if vehicle is not keeper and (keeper or status not in ("available", "occupied")):
+                stop(vehicle)
+
+    # Vehicles without a port id, or pointing at a port that does not exist
+    for waiting in claimants.values():
+        for vehicle in waiting:
+            stop(vehicle)
+
+    if port_ops:
+        ports_collection.bulk_write(port_ops, ordered=False)
+    if vehicle_ops:
+        vehicles_collection.bulk_write(vehicle_ops, ordered=False)
+    summary["vehicles_stopped"] = len(stopped)
+    return summary, stations, stopped
+
+
+def recover_sessions(vehicles_collection, ports_collection, now=None):
+    """
+    Catch up and reconcile every charging session; returns a summary dict.
+    Without a ports collection only batteries are caught up.
+    """
+    now = now or clock.now()
+    vehicles = list(vehicles_collection.find(
+        {"status": "charging"},
+        {**VEHICLE_FIELDS, "charging_started_at": 1, "last_charging_update": 1}
+    ))
+    summary, stations = {}, set()
+    if ports_collection is not None:
+        summary, stations, stopped = reconcile_ports(vehicles_collection, ports_collection, vehicles, now)
+        vehicles = [v for v in vehicles if v["vehicle_id"] not in stopped]
+    summary["vehicles_caught_up"] = catch_up_batteries(vehicles_collection, ports_collection, vehicles, now)
+    summary["stations"] = sorted(stations, key=str)
+    return summary
@@ -0,0 +1,201 @@
+"""
+Batched charging scheduler.
+
+Charging sessions live in the database: a vehicle is being charged while its
+status is "charging" and its battery is below 100. Every worker process runs
+one scheduler thread, but only the worker holding the "charging-scheduler"
+lease (server/leases.py) ticks, so each session is driven exactly once
+however many workers there are, and starting or stopping a session from any
+worker is just the vehicle write the views already make. If the lease holder
+dies, another worker takes over once the lease expires. Whoever takes the
+lease first runs recovery (charging_ports/recovery.py) in place of a tick.
+
+A tick loads every charging vehicle in one query, advances each through the
+charging model (charging_ports/model.py) by one interval in a single pass
+and writes all new levels back with one bulk_write, then records them as
+battery history (charging_ports/telemetry.py), so round trips per tick
+stay constant however many vehicles are charging.
+"""
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from pymongo import UpdateOne
+
+from charging_ports.allocation import PORT_RELEASE
+from charging_ports.charging_queue import dispatch, dispatch_all
+from charging_ports.clock import get_clock
+from charging_ports.live import notify_tick
+from charging_ports.model import DEFAULT_PORT_POWER_KW, VEHICLE_FIELDS, charge_batch, charge_update, session_powers
+from charging_ports.power_budget import budget_powers
+from charging_ports.recovery import recover_sessions
+from charging_ports.telemetry import battery_telemetry
+from server.cache import invalidate_station
+from server.db import get_collection
+from server.leases import Lease
+
+LEASE_NAME = "charging-scheduler"
+
+CHARGING_QUERY = {
+    "status": "charging",
+    # Vehicles that only carry the legacy "battery" field match battery_level: None
+    "$or": [{"battery_level": {"$lt": 100}}, {"battery_level": None}],
+}
+
+
+class ChargingScheduler:
+    def __init__(self, collection, interval, lease=None, ports=None, clock=None, telemetry=None,
+                 power_budgets=False):
+        self.collection = collection
+        # Charging ports collection, for port power and reconciling ports on recovery
+        self.ports = ports
+        self.interval = interval
+        # Without a lease every tick() runs (single process, benchmarks)
+        self.lease = lease
+        # None follows the configured charging clock (charging_ports/clock.py)
+        self.clock = clock
+        # Battery history writer (charging_ports/telemetry.py); None records nothing
+        self.telemetry = telemetry
+        # Share station power budgets from station settings (charging_ports/power_budget.py)
+        self.power_budgets = power_budgets
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        # Whether this worker has recovered since it last took the lease
+        self._driving = False
+
+    def start(self):
+        """Start the scheduler thread if it is not running yet"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._driving = False
+            self._thread = threading.Thread(target=self._run, name="charging-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self.lease:
+            self.lease.release()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.step()
+            self._clock().wait(self._stopped, self.interval)
+
+    def step(self):
+        """One pass of the scheduler thread: recover on taking the lease, then tick while holding it"""
+        try:
+            if self.lease is None or self.lease.acquire():
+                if self._driving:
+                    updated = self.tick()
+                    if updated:
+                        print(f"🔋 Charging tick: {updated} vehicles updated")
+                        notify_tick()
+                else:
+                    summary = self.recover()
+                    self._driving = True
+                    print(f"🔁 Charging sessions recovered: {summary}")
+            else:
+                self._driving = False
+        except Exception as e:
+            print(f"❌ Charging tick failed: {e}")
+
+    def _clock(self):
+        return self.clock or get_clock()
+
+    def tick(self, now=None):
+        """Advance every charging vehicle by one interval; returns the number of vehicles written"""
+        now = now or self._clock().now()
+        vehicles = list(self.collection.find(CHARGING_QUERY, VEHICLE_FIELDS))
+        powers = session_powers(vehicles, self.ports)
+        allocated = {}
+        if self.power_budgets:
+            powers = allocated = budget_powers(vehicles, powers, DEFAULT_PORT_POWER_KW)
+
+        charged = list(charge_batch(vehicles, powers, self.interval))
+        ops = [
+            charge_update(vehicle, level, energy, now, allocated.get(vehicle["vehicle_id"]))
+            for vehicle, level, energy in charged
+        ]
+        # Sessions throttled to nothing are not charged, but their allocation changed
+        charged_ids = {vehicle["vehicle_id"] for vehicle, _, _ in charged}
+        ops.extend(
+            UpdateOne(
+                {"vehicle_id": vehicle["vehicle_id"], "station_id": vehicle.get("station_id"), "status": "charging"},
+                {"$set": {"allocated_power_kw": round(allocated[vehicle["vehicle_id"]], 3)}}
+            )
+            for vehicle in vehicles
+            if allocated and vehicle["vehicle_id"] not in charged_ids
+            and vehicle.get("allocated_power_kw") != round(allocated[vehicle["vehicle_id"]], 3)
+        )
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+        if charged:
+            if self.telemetry:
+                try:
+                    self.telemetry.record([(vehicle, level) for vehicle, level, _ in charged], now)
+                except Exception as e:
+                    # History is best effort; it must never stall charging
+                    print(f"❌ Battery telemetry write failed: {e}")
+            full = [vehicle for vehicle, level, _ in charged if level >= 100]
+            if full and self.ports is not None:
+                self.complete(full, now)
+        return len(charged)
+
+    def complete(self, vehicles, now):
+        """End sessions that reached 100%, free their ports and hand them to queued vehicles"""
+        self.collection.bulk_write([
+            UpdateOne(
+                {"vehicle_id": vehicle["vehicle_id"], "station_id": vehicle.get("station_id"), "status": "charging"},
+                {"$set": {"status": "available", "charging_port_id": None, "charging_started_at": None,
+                          "charging_completed_at": now}}
+            )
+            for vehicle in vehicles
+        ], ordered=False)
+        port_ops = [
+            UpdateOne(
+                {"station_id": vehicle.get("station_id"), "port_id": vehicle["charging_port_id"],
+                 "$or": [{"current_vehicle_id": vehicle["vehicle_id"]}, {"vehicle_id": vehicle["vehicle_id"]}]},
+                PORT_RELEASE
+            )
+            for vehicle in vehicles if vehicle.get("charging_port_id")
+        ]
+        if port_ops:
+            self.ports.bulk_write(port_ops, ordered=False)
+        freed_at = time.monotonic()
+        stations = {vehicle.get("station_id") for vehicle in vehicles}
+        for station_id in stations:
+            dispatch(station_id, freed_at)
+        invalidate_station(*stations)
+        print(f"✅ Charging complete for {len(vehicles)} vehicles")
+
+    def recover(self, now=None):
+        """Catch up batteries and reconcile ports after nobody was driving"""
+        now = now or self._clock().now()
+        summary = recover_sessions(self.collection, self.ports, now)
+        if self.ports is not None:
+            # Sessions left full by an older release, then ports freed while nobody was dispatching
+            full = list(self.collection.find({"status": "charging", "battery_level": {"$gte": 100}}, VEHICLE_FIELDS))
+            if full:
+                self.complete(full, now)
+            summary["sessions_completed"] = len(full)
+            summary["vehicles_dispatched"] = len(dispatch_all())
+        if summary["stations"]:
+            invalidate_station(*summary["stations"])
+        return summary
+
+
+scheduler = ChargingScheduler(
+    get_collection("vehicle_details"),
+    settings.CHARGING["TICK_SECONDS"],
+    lease=Lease(LEASE_NAME, ttl=settings.CHARGING["LEASE_SECONDS"]),
+    ports=get_collection("charging_ports"),
+    telemetry=battery_telemetry,
+    power_budgets=True
+)
+
+# Let another worker take over straight away on a clean shutdown
+atexit.register(scheduler.stop)
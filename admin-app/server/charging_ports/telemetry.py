@@ -0,0 +1,173 @@
+"""
+Battery telemetry.
+
+Every scheduler tick records the level of each vehicle it charged:
+
+    battery_samples           time-series collection, one raw sample per
+                              vehicle per tick (meta: vehicle_id, station_id)
+    battery_rollups_1m        per-vehicle buckets {vehicle_id, station_id, t,
+    battery_rollups_15m       count, sum, min, max, last}, where t is the
+    battery_rollups_1h        bucket start
+
+A tick costs one insert_many plus one bulk_write per tier however many
+vehicles are charging. Raw samples expire through the time-series
+collection's expireAfterSeconds and rollups through a TTL index on t, with
+retention per tier in settings.BATTERY_TELEMETRY.
+
+History reads use the finest tier that answers the range in at most
+MAX_POINTS buckets and still retains its start; longer ranges than the
+coarsest tier answers that way (MAX_HISTORY_HOURS) are rejected.
+"""
+import math
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from pymongo import UpdateOne
+from pymongo.errors import CollectionInvalid
+
+from server.db import get_collection, get_db
+
+SAMPLES_COLLECTION = "battery_samples"
+ROLLUPS_PREFIX = "battery_rollups"
+
+# (tier, bucket seconds), finest first
+TIERS = [("1m", 60), ("15m", 900), ("1h", 3600)]
+MAX_POINTS = 500
+# Longest range the coarsest tier answers in MAX_POINTS buckets
+MAX_HISTORY_HOURS = MAX_POINTS * TIERS[-1][1] // 3600
+
+DEFAULT_HISTORY_HOURS = 24
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def retention(tier):
+    return timedelta(days=settings.BATTERY_TELEMETRY["RETENTION_DAYS"][tier])
+
+
+def bucket_start(ts, seconds):
+    return ts - timedelta(seconds=(ts - _EPOCH).total_seconds() % seconds, microseconds=0)
+
+
+def history_tier(start, end, now):
+    """(tier, bucket seconds) to read for the range [start, end); raises ValueError if no tier fits"""
+    span = (end - start).total_seconds()
+    for tier, seconds in TIERS:
+        if span / seconds <= MAX_POINTS and start >= now - retention(tier):
+            return tier, seconds
+    if span / TIERS[-1][1] > MAX_POINTS:
+        raise ValueError(f"History ranges are limited to {MAX_HISTORY_HOURS} hours")
+    return TIERS[-1]
+
+
+def parse_history_range(params, now):
+    """
+    (start, end) from ?from=&to= ISO timestamps or ?hours=; defaults to the
+    last DEFAULT_HISTORY_HOURS. Raises ValueError for bad values and for
+    ranges longer than MAX_HISTORY_HOURS.
+    """
+    end = datetime.fromisoformat(params["to"]) if params.get("to") else now
+    if params.get("from"):
+        start = datetime.fromisoformat(params["from"])
+    else:
+        hours = float(params.get("hours", DEFAULT_HISTORY_HOURS))
+        if not math.isfinite(hours) or hours > MAX_HISTORY_HOURS:
+            raise ValueError(f"hours must be at most {MAX_HISTORY_HOURS}")
+        try:
+            start = end - timedelta(hours=hours)
+        except OverflowError:
+            raise ValueError("hours reaches before the earliest date")
+    start, end = start.replace(tzinfo=None), end.replace(tzinfo=None)
+    if start >= end:
+        raise ValueError("'from' must be before 'to'")
+    if end - start > timedelta(hours=MAX_HISTORY_HOURS):
+        raise ValueError(f"History ranges are limited to {MAX_HISTORY_HOURS} hours")
+    return start, end
+
+
+class BatteryTelemetry:
+    def __init__(self, samples=SAMPLES_COLLECTION, rollups=ROLLUPS_PREFIX):
+        self.samples_name = samples
+        self.samples = get_collection(samples)
+        self.rollups = {tier: get_collection(f"{rollups}_{tier}") for tier, _ in TIERS}
+        self._samples_ready = False
+
+    def ensure_samples_collection(self):
+        """Create the raw samples time-series collection if it does not exist yet"""
+        if self._samples_ready:
+            return
+        try:
+            get_db().create_collection(
+                self.samples_name,
+                timeseries={"timeField": "ts", "metaField": "meta", "granularity": "seconds"},
+                expireAfterSeconds=settings.BATTERY_TELEMETRY["RAW_RETENTION_DAYS"] * 86400
+            )
+        except CollectionInvalid:
+            pass  # Already exists
+        self._samples_ready = True
+
+    def record(self, readings, now):
+        """Write one tick of (vehicle, level) readings to the samples and every rollup tier"""
+        if not readings:
+            return
+        self.ensure_samples_collection()
+        self.samples.insert_many([
+            {"ts": now, "meta": {"vehicle_id": vehicle["vehicle_id"], "station_id": vehicle.get("station_id")},
+             "battery_level": round(level, 2)}
+            for vehicle, level in readings
+        ], ordered=False)
+        for tier, seconds in TIERS:
+            t = bucket_start(now, seconds)
+            self.rollups[tier].bulk_write([
+                UpdateOne(
+                    {"vehicle_id": vehicle["vehicle_id"], "t": t},
+                    {
+                        "$set": {"station_id": vehicle.get("station_id"), "last": round(level, 2)},
+                        "$inc": {"count": 1, "sum": level},
+                        "$min": {"min": round(level, 2)},
+                        "$max": {"max": round(level, 2)}
+                    },
+                    upsert=True
+                )
+                for vehicle, level in readings
+            ], ordered=False)
+
+    def vehicle_history(self, vehicle_id, start, end, now):
+        tier, seconds = history_tier(start, end, now)
+        rows = self.rollups[tier].find(
+            {"vehicle_id": vehicle_id, "t": {"$gte": bucket_start(start, seconds), "$lt": end}},
+            {"_id": 0, "t": 1, "count": 1, "sum": 1, "min": 1, "max": 1, "last": 1}
+        ).sort("t", 1)
+        return tier, [
+            {"t": row["t"].isoformat(), "avg": round(row["sum"] / row["count"], 1),
+             "min": row["min"], "max": row["max"], "last": row["last"], "samples": row["count"]}
+            for row in rows
+        ]
+
+    def station_history(self, station_id, start, end, now):
+        tier, seconds = history_tier(start, end, now)
+        rows = self.rollups[tier].aggregate([
+            {"$match": {"station_id": station_id, "t": {"$gte": bucket_start(start, seconds), "$lt": end}}},
+            {"$group": {
+                "_id": "$t",
+                "count": {"$sum": "$count"},
+                "sum": {"$sum": "$sum"},
+                "min": {"$min": "$min"},
+                "max": {"$max": "$max"},
+                "vehicles": {"$sum": 1}
+            }},
+            {"$sort": {"_id": 1}}
+        ])
+        return tier, [
+            {"t": row["_id"].isoformat(), "avg": round(row["sum"] / row["count"], 1),
+             "min": row["min"], "max": row["max"], "vehicles": row["vehicles"]}
+            for row in rows
+        ]
+
+    def drop(self):
+        self.samples.drop()
+        for collection in self.rollups.values():
+            collection.drop()
+
+
+battery_telemetry = BatteryTelemetry()
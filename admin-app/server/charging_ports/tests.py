@@ -1,3 +1,469 @@
-from django.test import TestCase
+import json
+import math
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.test import RequestFactory, TestCase, override_settings
+
+from charging_ports import charging_queue, live
+from charging_ports.allocation import claim_port, release_port
+from charging_ports.clock import ManualClock, WallClock, get_clock, set_clock
+from charging_ports.clock import now as clock_now
+from charging_ports.model import (
+    CHARGE_EFFICIENCY, TAPER_START, advance, charging_eta, draw_factor, seconds_to_full
+)
+from charging_ports.power_budget import ALLOCATION_MODES, allocate
+from charging_ports.scheduler import ChargingScheduler
+from charging_ports.telemetry import MAX_HISTORY_HOURS, MAX_POINTS, history_tier, parse_history_range
+from charging_ports.views import assign_vehicle_to_port, stop_charging, stream_charging_status
+from server.db import get_collection, track_round_trips
+from server.leases import Lease
+from server.testing import MongoTestCase
+from reports.views import get_station_battery_history
+from vehicles.views import get_vehicle_battery_history, update_vehicle_status
+
+STATION = 1001
+
+
+def patch_status(factory, vehicle_id, status):
+    request = factory.patch("/", json.dumps({"status": status}), content_type="application/json")
+    return update_vehicle_status(request, vehicle_id)
+
+
+class PortAllocationTests(MongoTestCase):
+    """Concurrent charging requests never double book a port or a vehicle"""
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        self.ports = get_collection("charging_ports")
+        self.vehicles = get_collection("vehicle_details")
+        self.port_ids = [f"P{i:03d}" for i in range(10)]
+        self.vehicle_ids = [f"V{i:03d}" for i in range(30)]
+        self.ports.insert_many([
+            {"station_id": STATION, "port_id": port_id, "status": "available", "usage_count": 0}
+            for port_id in self.port_ids
+        ])
+        self.vehicles.insert_many([
+            {"station_id": STATION, "vehicle_id": vehicle_id, "status": "available", "battery_level": 20}
+            for vehicle_id in self.vehicle_ids
+        ])
+
+    def fire(self, job):
+        vehicle_id, port_id = job
+        if port_id is None:
+            return patch_status(self.factory, vehicle_id, "charging").status_code
+        request = self.factory.post("/", json.dumps({"vehicle_id": vehicle_id, "port_id": port_id}),
+                                    content_type="application/json")
+        return assign_vehicle_to_port(request, str(STATION)).status_code
+
+    def test_concurrent_requests(self):
+        rng = random.Random(0)
+        # Half the requests name a port, half let the status view pick one
+        jobs = [
+            (rng.choice(self.vehicle_ids), rng.choice(self.port_ids) if i % 2 == 0 else None)
+            for i in range(200)
+        ]
+        with ThreadPoolExecutor(16) as pool:
+            results = list(pool.map(self.fire, jobs))
+
+        occupied = {port["port_id"]: port.get("current_vehicle_id")
+                    for port in self.ports.find({"station_id": STATION, "status": "occupied"})}
+        charging = {vehicle["vehicle_id"]: vehicle.get("charging_port_id")
+                    for vehicle in self.vehicles.find({"station_id": STATION, "status": "charging"})}
+
+        self.assertFalse([status for status in results if status >= 500])
+        self.assertEqual(len(set(charging.values())), len(charging), "a port is held by two vehicles")
+        self.assertEqual(charging, {vehicle: port for port, vehicle in occupied.items()})
+        self.assertEqual(results.count(200), len(charging))
+
+
+class ChargingQueueTests(MongoTestCase):
+    """Vehicles asked to charge at a full station queue and are dispatched as ports free up"""
+
+    PORTS = 3
+    VEHICLES = 12
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        self.vehicles = get_collection("vehicle_details")
+        rng = random.Random(0)
+        get_collection("charging_ports").insert_many([
+            {"station_id": STATION, "port_id": f"P{i:03d}", "status": "available"} for i in range(self.PORTS)
+        ])
+        self.vehicles.insert_many([
+            {"station_id": STATION, "vehicle_id": f"V{i:03d}", "status": "available",
+             "battery_level": rng.randint(0, 90)}
+            for i in range(self.VEHICLES)
+        ])
+
+    def stop(self, vehicle_id):
+        request = self.factory.post("/", json.dumps({"vehicle_id": vehicle_id}), content_type="application/json")
+        return stop_charging(request, str(STATION))
+
+    def charging_ids(self):
+        return {vehicle["vehicle_id"] for vehicle in self.vehicles.find({"station_id": STATION, "status": "charging"})}
+
+    def test_dispatch_order(self):
+        statuses = [patch_status(self.factory, f"V{i:03d}", "charging").status_code for i in range(self.VEHICLES)]
+        self.assertEqual(statuses, [200] * self.PORTS + [202] * (self.VEHICLES - self.PORTS))
+        expected = [entry["vehicle_id"] for entry in
+                    charging_queue.queue_collection.find({"station_id": STATION}).sort(charging_queue.QUEUE_ORDER)]
+
+        # Lowest battery first, then longest waiting
+        order = []
+        while charging_queue.queue_collection.count_documents({"station_id": STATION}):
+            before = self.charging_ids()
+            self.assertEqual(self.stop(sorted(before)[0]).status_code, 200)
+            order.extend(self.charging_ids() - before)
+        self.assertEqual(order, expected)
+
+    def test_port_freed_while_entry_is_out(self):
+        for i in range(self.PORTS + 1):
+            patch_status(self.factory, f"V{i:03d}", "charging")
+        queued = f"V{self.PORTS:03d}"
+        holder = get_collection("charging_ports").find_one({"station_id": STATION, "port_id": "P000"})
+
+        calls = []
+
+        def claim(station_id, vehicle_id, *args, **kwargs):
+            calls.append(vehicle_id)
+            if len(calls) > 1:
+                return claim_port(station_id, vehicle_id, *args, **kwargs)
+            # Another worker stops a session while the entry is popped; its dispatch finds no queue
+            release_port(station_id, holder["port_id"], holder["current_vehicle_id"])
+            self.vehicles.update_one({"vehicle_id": holder["current_vehicle_id"]}, {"$set": {"status": "available"}})
+            self.assertEqual(charging_queue.dispatch(station_id), [])
+            return None
+
+        with mock.patch.object(charging_queue, "claim_port", side_effect=claim):
+            started = charging_queue.dispatch(STATION)
+        self.assertEqual(started, [(queued, holder["port_id"])])
+
+
+class SchedulerTickTests(MongoTestCase):
+    """A tick takes the same round trips however many vehicles charge, and full sessions hand their port on"""
+
+    INTERVAL = 60
+    VEHICLE = {"battery_capacity_kwh": 2.5, "max_charge_kw": 1, "port_power_kw": 1}
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        self.clock = ManualClock(datetime(2024, 1, 1))
+        self.vehicles = get_collection("vehicle_details")
+        self.ports = get_collection("charging_ports")
+
+    def scheduler(self, ports=None):
+        return ChargingScheduler(self.vehicles, self.INTERVAL, ports=ports, clock=self.clock)
+
+    def charging(self, count, start=0, level=40):
+        self.vehicles.insert_many([
+            {"vehicle_id": f"V{i:03d}", "station_id": STATION, "status": "charging", "battery_level": level,
+             **self.VEHICLE}
+            for i in range(start, start + count)
+        ])
+
+    def test_round_trips_constant(self):
+        scheduler = self.scheduler()
+        trips = []
+        for count in (5, 100):
+            self.charging(count, start=len(trips) * 1000)
+            with track_round_trips() as counter:
+                self.assertEqual(scheduler.tick(), self.vehicles.count_documents({}))
+            trips.append(counter["round_trips"])
+        self.assertEqual(trips[0], trips[1])
+        self.assertLessEqual(trips[1], 2)
+
+        # The batch added last was ticked once
+        levels = {round(vehicle["charge_level"], 9) for vehicle in self.vehicles.find({"vehicle_id": {"$gte": "V1000"}})}
+        self.assertEqual(levels, {round(advance(40, 1, 2.5, self.INTERVAL), 9)})
+
+    def test_stopped_session_not_overwritten(self):
+        self.charging(2)
+        bulk_write = self.vehicles.bulk_write
+
+        def stopped_first(operations, **kwargs):
+            # A stop request lands between the tick's read and its write
+            self.vehicles.update_one({"vehicle_id": "V000"}, {"$set": {"status": "available", "battery_level": 41}})
+            return bulk_write(operations, **kwargs)
+
+        with mock.patch.object(self.vehicles, "bulk_write", side_effect=stopped_first):
+            self.scheduler().tick()
+        self.assertEqual(self.vehicles.find_one({"vehicle_id": "V000"})["battery_level"], 41)
+        self.assertGreater(self.vehicles.find_one({"vehicle_id": "V001"})["battery_level"], 40)
+
+    def test_full_session_hands_port_to_queue(self):
+        self.ports.insert_one({"station_id": STATION, "port_id": "P000", "status": "available"})
+        self.vehicles.insert_many([
+            {"vehicle_id": "V000", "station_id": STATION, "status": "available", "battery_level": 99.9},
+            {"vehicle_id": "V001", "station_id": STATION, "status": "available", "battery_level": 20},
+        ])
+        self.assertEqual(patch_status(self.factory, "V000", "charging").status_code, 200)
+        self.assertEqual(patch_status(self.factory, "V001", "charging").status_code, 202)
+
+        self.scheduler(self.ports).tick()
+        done = self.vehicles.find_one({"vehicle_id": "V000"})
+        self.assertEqual((done["status"], done["battery_level"], done["charging_port_id"]), ("available", 100, None))
+        self.assertEqual(done["charging_completed_at"], self.clock.now())
+        port = self.ports.find_one({"port_id": "P000"})
+        self.assertEqual((port["status"], port["current_vehicle_id"]), ("occupied", "V001"))
+        self.assertEqual(self.vehicles.find_one({"vehicle_id": "V001"})["status"], "charging")
+        self.assertEqual(charging_queue.queue_collection.count_documents({}), 0)
+
+
+class SchedulerFailoverTests(MongoTestCase):
+    """Several workers run schedulers; only the lease holder drives sessions, and another takes over when it dies"""
+
+    INTERVAL = 10
+    # A tiny battery on a 1 kW charger gains 0.25% per second
+    VEHICLE = {"battery_capacity_kwh": 0.1, "max_charge_kw": 1, "port_power_kw": 1}
+
+    def setUp(self):
+        super().setUp()
+        self.clock = ManualClock(datetime(2024, 1, 1))
+        self.vehicles = get_collection("vehicle_details")
+        self.vehicles.insert_many([
+            {"vehicle_id": f"V{i:03d}", "station_id": STATION, "status": "charging", "battery_level": 0,
+             "charging_started_at": self.clock.now(), **self.VEHICLE}
+            for i in range(20)
+        ])
+        self.workers = [
+            ChargingScheduler(self.vehicles, self.INTERVAL, lease=Lease("test-scheduler", ttl=30, owner=f"worker-{i}"),
+                              clock=self.clock)
+            for i in range(3)
+        ]
+
+    def step_all(self, workers):
+        """Every worker runs one scheduler pass at the same moment"""
+        barrier = threading.Barrier(len(workers))
+
+        def step(worker):
+            barrier.wait()
+            worker.step()
+
+        with ThreadPoolExecutor(len(workers)) as pool:
+            list(pool.map(step, workers))
+
+    def levels(self):
+        return {vehicle.get("charge_level", 0) for vehicle in self.vehicles.find({}, {"charge_level": 1})}
+
+    def expected(self, seconds):
+        return advance(0, self.VEHICLE["port_power_kw"], self.VEHICLE["battery_capacity_kwh"], seconds)
+
+    def test_one_driver_and_failover(self):
+        self.step_all(self.workers)
+        for _ in range(5):
+            self.clock.advance(self.INTERVAL)
+            self.step_all(self.workers)
+        (level,) = self.levels()
+        self.assertAlmostEqual(level, self.expected(5 * self.INTERVAL))
+
+        # The holder dies; its lease runs out and a survivor recovers the missed tick, then drives
+        owner = self.workers[0].lease.holder()["owner"]
+        survivors = [worker for worker in self.workers if worker.lease.owner != owner]
+        self.clock.advance(self.INTERVAL)
+        self.step_all(survivors)
+        self.assertEqual(self.levels(), {level})
+        self.workers[0].lease.collection.update_one({"_id": "test-scheduler"}, {"$set": {"expires_at": datetime(2000, 1, 1)}})
+        for _ in range(2):
+            self.clock.advance(self.INTERVAL)
+            self.step_all(survivors)
+
+        self.assertNotEqual(self.workers[0].lease.holder()["owner"], owner)
+        (level,) = self.levels()
+        self.assertAlmostEqual(level, self.expected(8 * self.INTERVAL))
+
+
+class HistoryRangeTests(TestCase):
+    NOW = datetime(2024, 6, 1, 12)
+
+    def test_hours(self):
+        self.assertEqual(parse_history_range({"hours": "6"}, self.NOW), (self.NOW - timedelta(hours=6), self.NOW))
+        self.assertEqual(parse_history_range({}, self.NOW)[0], self.NOW - timedelta(hours=24))
+
+    def test_from_to(self):
+        start, end = parse_history_range({"from": "2024-05-01T00:00:00+00:00", "to": "2024-05-02T00:00:00"}, self.NOW)
+        self.assertEqual((start, end), (datetime(2024, 5, 1), datetime(2024, 5, 2)))
+
+    def test_rejected(self):
+        for params in ({"hours": "1e308"}, {"hours": "nan"}, {"hours": "inf"}, {"hours": "-1"}, {"hours": "x"},
+                       {"hours": str(MAX_HISTORY_HOURS + 1)},
+                       {"from": "2020-01-01T00:00:00"},
+                       {"from": "2024-05-02T00:00:00", "to": "2024-05-01T00:00:00"},
+                       {"to": "0001-01-01T05:00:00"}):
+            with self.assertRaises(ValueError, msg=params):
+                parse_history_range(params, self.NOW)
+
+    def test_tiers_stay_within_max_points(self):
+        for hours in (1, 6, 24, 24 * 7, MAX_HISTORY_HOURS):
+            start = self.NOW - timedelta(hours=hours)
+            tier, seconds = history_tier(start, self.NOW, self.NOW)
+            self.assertLessEqual(hours * 3600 / seconds, MAX_POINTS, tier)
+        self.assertEqual(history_tier(self.NOW - timedelta(hours=1), self.NOW, self.NOW)[0], "1m")
+        with self.assertRaises(ValueError):
+            history_tier(self.NOW - timedelta(hours=MAX_HISTORY_HOURS + 1), self.NOW, self.NOW)
+
+    def test_views_answer_400(self):
+        request = RequestFactory().get("/", {"hours": "1e308"})
+        self.assertEqual(get_vehicle_battery_history(request, "V001").status_code, 400)
+        self.assertEqual(get_station_battery_history(request, str(STATION)).status_code, 400)
+
+
+@override_settings(CHARGING={**settings.CHARGING, "MAX_LIVE_STREAMS": 2})
+class LiveStreamTests(TestCase):
+    def load(self, station_id):
+        return [{"vehicle_id": "V001", "battery_level": 50}]
+
+    def test_feed_dropped_with_last_subscriber(self):
+        first = live.open_stream(STATION, self.load)
+        second = live.open_stream(STATION, self.load)
+        self.assertIs(first[0], second[0])
+        thread = first[0]._thread
+
+        live.close_stream(*first)
+        self.assertIs(live._feeds.get(STATION), first[0])
+        live.close_stream(*second)
+        live.close_stream(*second)  # Closing twice gives back one slot
+        self.assertNotIn(STATION, live._feeds)
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+
+    def test_stream_limit(self):
+        streams = [live.open_stream(STATION, self.load), live.open_stream(STATION + 1, self.load)]
+        self.assertIsNone(live.open_stream(STATION + 2, self.load))
+        self.assertEqual(stream_charging_status(RequestFactory().get("/"), str(STATION)).status_code, 503)
+
+        # A response closed before its first read gives its slot back too
+        live.EventStream(*streams.pop()).close()
+        stream = live.EventStream(*live.open_stream(STATION + 2, self.load))
+        body = iter(stream)
+        self.assertEqual(next(body), f"retry: {live.RETRY_MS}\n")
+        self.assertIn('"V001"', next(body))
+        body.close()
+        for feed, subscriber in streams:
+            live.close_stream(feed, subscriber)
+        self.assertEqual((live._open_streams, live._feeds), (0, {}))
+
+
+class PowerBudgetTests(TestCase):
+    def test_under_budget(self):
+        sessions = [("V1", 7, 50), ("V2", 11, 20)]
+        self.assertEqual(allocate(sessions, 30), {"V1": 7, "V2": 11})
+
+    def test_equal_shares_unused_power(self):
+        sessions = [("V1", 2, 50), ("V2", 10, 20), ("V3", 10, 80)]
+        self.assertEqual(allocate(sessions, 12, "equal"), {"V1": 2, "V2": 5, "V3": 5})
+
+    def test_soc_priority(self):
+        sessions = [("V1", 7, 50), ("V2", 7, 20.5), ("V3", 7, 80)]
+        self.assertEqual(allocate(sessions, 10, "soc_priority"), {"V2": 7, "V1": 3, "V3": 0})
+
+    def test_within_budget_and_demand(self):
+        rng = random.Random(7)
+        for mode in ALLOCATION_MODES:
+            for _ in range(50):
+                sessions = [(f"V{i}", rng.uniform(0, 22), rng.uniform(0, 100)) for i in range(rng.randint(1, 40))]
+                budget = rng.uniform(1, 200)
+                allocated = allocate(sessions, budget, mode)
+                self.assertLessEqual(sum(allocated.values()), budget + 1e-9)
+                for vehicle_id, demand, _ in sessions:
+                    self.assertTrue(0 <= allocated[vehicle_id] <= demand, (mode, vehicle_id))
+
+
+class ChargingModelTests(TestCase):
+    # Scooter: 2.5 kWh behind a 1 kW charger fills 0.01 %/s before the taper
+    CAPACITY, POWER = 2.5, 1.0
+
+    def integrate(self, level, seconds, step=0.5):
+        rate = self.POWER * CHARGE_EFFICIENCY / self.CAPACITY * 100 / 3600
+        for _ in range(int(seconds / step)):
+            level = min(100.0, level + rate * draw_factor(level) * step)
+        return level
+
+    def test_constant_phase(self):
+        self.assertAlmostEqual(advance(10, self.POWER, self.CAPACITY, 3600), 46)
+        to_taper = (seconds_to_full(TAPER_START - 36, self.POWER, self.CAPACITY)
+                    - seconds_to_full(TAPER_START, self.POWER, self.CAPACITY))
+        self.assertAlmostEqual(to_taper, 3600)
+
+    def test_matches_step_integration(self):
+        for level, seconds in ((50, 7200), (79, 600), (90, 3600)):
+            self.assertAlmostEqual(advance(level, self.POWER, self.CAPACITY, seconds),
+                                   self.integrate(level, seconds), places=2)
+
+    def test_intervals_compose(self):
+        split = advance(advance(60, self.POWER, self.CAPACITY, 1500), self.POWER, self.CAPACITY, 2500)
+        self.assertAlmostEqual(split, advance(60, self.POWER, self.CAPACITY, 4000))
+
+    def test_seconds_to_full(self):
+        for level in (0, 50, 80, 95):
+            remaining = seconds_to_full(level, self.POWER, self.CAPACITY)
+            self.assertAlmostEqual(advance(level, self.POWER, self.CAPACITY, remaining), 100, places=6)
+            self.assertLess(advance(level, self.POWER, self.CAPACITY, remaining - 60), 100)
+        self.assertEqual(seconds_to_full(100, self.POWER, self.CAPACITY), 0)
+        self.assertIsNone(seconds_to_full(50, 0, self.CAPACITY))
+        self.assertEqual(advance(50, 0, self.CAPACITY, 3600), 50)
+
+    def test_charging_eta(self):
+        now = datetime(2024, 1, 1)
+        vehicle = {"vehicle_id": "V001", "type": "scooter", "battery_level": 50, "charging_energy_kwh": 0.3}
+        eta = charging_eta(vehicle, 22, now)
+        remaining = seconds_to_full(50, self.POWER, self.CAPACITY)
+        self.assertEqual(eta, {
+            "charging_power_kw": 1.0, "rated_power_kw": 1.0, "throttled": False,
+            "eta_minutes": math.ceil(remaining / 60),
+            "estimated_completion": (now + timedelta(seconds=remaining)).isoformat(),
+            "energy_delivered_kwh": 0.3,
+        })
+
+        throttled = charging_eta({**vehicle, "allocated_power_kw": 0.5}, 22, now)
+        self.assertEqual((throttled["charging_power_kw"], throttled["throttled"]), (0.5, True))
+        self.assertEqual(throttled["eta_minutes"], math.ceil(seconds_to_full(50, 0.5, self.CAPACITY) / 60))
+        self.assertIsNone(charging_eta(vehicle, 0, now)["eta_minutes"])
+
+
+class ClockTests(TestCase):
+    START = datetime(2024, 1, 1)
+
+    def test_manual_time_moves_only_on_advance(self):
+        clock = ManualClock(self.START)
+        self.assertEqual(clock.now(), self.START)
+        self.assertEqual(clock.advance(90), self.START + timedelta(seconds=90))
+        self.assertEqual(clock.now(), self.START + timedelta(seconds=90))
+
+    def test_manual_wait(self):
+        clock = ManualClock(self.START)
+        event = threading.Event()
+        waiter = threading.Thread(target=clock.wait, args=(event, 10))
+        waiter.start()
+        clock.advance(5)
+        waiter.join(0.2)
+        self.assertTrue(waiter.is_alive())
+        clock.advance(5)
+        waiter.join(1)
+        self.assertFalse(waiter.is_alive())
+
+        event.set()
+        self.assertTrue(clock.wait(event, 3600))
+
+    def test_scaled_wall_clock(self):
+        clock = WallClock(3600)
+        self.assertFalse(clock.wait(threading.Event(), 36))  # 10 ms of real time
+        self.assertGreaterEqual(clock.now() - clock._origin, timedelta(seconds=36))
+        with self.assertRaises(ValueError):
+            WallClock(0)
+
+    def test_set_clock(self):
+        manual = ManualClock(self.START)
+        previous = set_clock(manual)
+        try:
+            self.assertIs(get_clock(), manual)
+            self.assertEqual(clock_now(), self.START)
+        finally:
+            self.assertIs(set_clock(previous), manual)
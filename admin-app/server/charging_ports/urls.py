@@ -7,5 +7,7 @@ urlpatterns = [
     path('<str:station_id>/remove/', views.remove_vehicle_from_port, name='remove_vehicle_from_port'),
     path('<str:station_id>/available-vehicles/', views.get_available_vehicles, name='get_available_vehicles'),
     path('<str:station_id>/charging-status/', views.get_charging_status, name='get_charging_status'),
+    path('<str:station_id>/charging-status/stream/', views.stream_charging_status, name='stream_charging_status'),
+    path('<str:station_id>/queue/', views.get_charging_queue, name='get_charging_queue'),
     path('<str:station_id>/stop-charging/', views.stop_charging, name='stop_charging'),
 ]
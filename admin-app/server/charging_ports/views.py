@@ -1,31 +1,25 @@
 from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from pymongo import MongoClient
 from datetime import datetime, timedelta
 import json
-import os
 import time
-import threading
-from dotenv import load_dotenv
+from charging_ports import clock
+from charging_ports.allocation import charging_fields, claim_port, release_port
+from charging_ports.charging_queue import dispatch, dispatch_stats, queue_state
+from charging_ports.live import RETRY_MS, EventStream, open_stream
+from charging_ports.model import DEFAULT_PORT_POWER_KW, VEHICLE_FIELDS, charging_eta, session_powers
+from server.cache import invalidate_station
+from server.db import canonical_station_id, get_collection
 
-# Load environment variables
-load_dotenv()
-
-MONGO_URI = os.getenv('MONGODB_URI')
-client = MongoClient(MONGO_URI)
-db = client["boltride"]
-ports_collection = db["charging_ports"]
-vehicles_collection = db["vehicle_details"]
-
-# Global charging threads management
-charging_threads = {}
-charging_status = {}
+ports_collection = get_collection("charging_ports")
+vehicles_collection = get_collection("vehicle_details")
 
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_ports_by_station(request, station_id):
     try:
+        station_id = canonical_station_id(station_id)
         ports = list(ports_collection.find(
             {"station_id": station_id}, {"_id": 0}
         ).sort("port_id", 1))
@@ -62,6 +56,7 @@ def get_ports_by_station(request, station_id):
 @require_http_methods(["POST"])
 def assign_vehicle_to_port(request, station_id):
     try:
+        station_id = canonical_station_id(station_id)
         data = json.loads(request.body)
         port_id = data.get("port_id")
         vehicle_id = data.get("vehicle_id")
@@ -69,51 +64,27 @@ def assign_vehicle_to_port(request, station_id):
         if not port_id or not vehicle_id:
             return JsonResponse({"status": "error", "message": "Port ID and Vehicle ID are required"}, status=400)
         
-        # Check if port exists and is available
-        port = ports_collection.find_one({"port_id": port_id, "station_id": station_id})
+        # Claim the port only if it is still available
+        port = claim_port(station_id, vehicle_id, port_id)
         if not port:
-            return JsonResponse({"status": "error", "message": "Port not found"}, status=404)
-        
-        if port.get("status") != "available":
+            if not ports_collection.find_one({"port_id": port_id, "station_id": station_id}, {"_id": 1}):
+                return JsonResponse({"status": "error", "message": "Port not found"}, status=404)
             return JsonResponse({"status": "error", "message": "Port is not available"}, status=400)
         
-        # Check if vehicle exists and is available
-        vehicle = vehicles_collection.find_one({"vehicle_id": vehicle_id, "station_id": station_id})
-        if not vehicle:
-            return JsonResponse({"status": "error", "message": "Vehicle not found"}, status=404)
-        
-        if vehicle.get("status") != "available":
-            return JsonResponse({"status": "error", "message": "Vehicle is not available"}, status=400)
-        
-        # Update port status to occupied and assign vehicle
-        ports_collection.update_one(
-            {"port_id": port_id, "station_id": station_id},
-            {
-                "$set": {
-                    "status": "occupied",
-                    "vehicle_id": vehicle_id,  # Store vehicle_id in charging port
-                    "current_vehicle_id": vehicle_id,
-                    "occupied_at": datetime.now(),
-                    "charging_started_at": datetime.now(),
-                    "usage_count": port.get("usage_count", 0) + 1
-                }
-            }
-        )
-        
-        # Update vehicle status to charging
-        vehicles_collection.update_one(
-            {"vehicle_id": vehicle_id, "station_id": station_id},
-            {
-                "$set": {
-                    "status": "charging",
-                    "charging_port_id": port_id,
-                    "charging_started_at": datetime.now()
-                }
-            }
+        # Update vehicle status to charging, only if it is available
+        result = vehicles_collection.update_one(
+            {"vehicle_id": vehicle_id, "station_id": station_id, "status": "available"},
+            {"$set": charging_fields(port)}
         )
+        if not result.matched_count:
+            # Undo the port claim
+            release_port(station_id, port_id, vehicle_id)
+            if not vehicles_collection.find_one({"vehicle_id": vehicle_id, "station_id": station_id}, {"_id": 1}):
+                return JsonResponse({"status": "error", "message": "Vehicle not found"}, status=404)
+            return JsonResponse({"status": "error", "message": "Vehicle is not available"}, status=400)
         
-        # Start charging process
-        start_charging_process(vehicle_id, port_id, station_id)
+        # The scheduler picks the session up on its next tick
+        invalidate_station(station_id)
         
         return JsonResponse({
             "status": "success", 
@@ -127,6 +98,7 @@ def assign_vehicle_to_port(request, station_id):
 @require_http_methods(["POST"])
 def remove_vehicle_from_port(request, station_id):
     try:
+        station_id = canonical_station_id(station_id)
         data = json.loads(request.body)
         port_id = data.get("port_id")
         
@@ -140,25 +112,9 @@ def remove_vehicle_from_port(request, station_id):
         
         vehicle_id = port.get("current_vehicle_id") or port.get("vehicle_id")
         
-        # Stop charging process if active
-        if vehicle_id:
-            stop_charging_process(vehicle_id)
-        
         # Update port status to available
-        ports_collection.update_one(
-            {"port_id": port_id, "station_id": station_id},
-            {
-                "$set": {
-                    "status": "available",
-                    "current_vehicle_id": None,
-                    "vehicle_id": None
-                },
-                "$unset": {
-                    "occupied_at": "",
-                    "charging_started_at": ""
-                }
-            }
-        )
+        release_port(station_id, port_id)
+        freed_at = time.monotonic()
         
         # Update vehicle status back to available if vehicle exists
         if vehicle_id:
@@ -175,6 +131,10 @@ def remove_vehicle_from_port(request, station_id):
                 }
             )
         
+        # Hand the freed port to the next queued vehicle
+        dispatch(station_id, freed_at)
+        
+        invalidate_station(station_id)
         return JsonResponse({
             "status": "success", 
             "message": f"Vehicle removed from port {port_id} and charging stopped"
@@ -187,6 +147,7 @@ def remove_vehicle_from_port(request, station_id):
 @require_http_methods(["GET"])
 def get_available_vehicles(request, station_id):
     try:
+        station_id = canonical_station_id(station_id)
         # Get available vehicles for this station
         vehicles = list(vehicles_collection.find(
             {"station_id": station_id, "status": "available"}, 
@@ -202,116 +163,51 @@ def get_available_vehicles(request, station_id):
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
 
-def start_charging_process(vehicle_id, port_id, station_id):
-    """Start charging process for a vehicle"""
-    def charging_loop():
-        charging_key = f"{vehicle_id}_{port_id}"
-        charging_status[charging_key] = True
-        
-        while charging_status.get(charging_key, False):
-            try:
-                # Get current vehicle data
-                vehicle = vehicles_collection.find_one({"vehicle_id": vehicle_id, "station_id": station_id})
-                if not vehicle:
-                    break
-                
-                current_battery = vehicle.get("battery_level", vehicle.get("battery", 0))
-                
-                # Stop charging if battery reaches 100%
-                if current_battery >= 100:
-                    charging_status[charging_key] = False
-                    break
-                
-                # Increase battery by 1%
-                new_battery = min(100, current_battery + 1)
-                
-                # Update vehicle battery in database
-                vehicles_collection.update_one(
-                    {"vehicle_id": vehicle_id, "station_id": station_id},
-                    {
-                        "$set": {
-                            "battery_level": new_battery,
-                            "battery": new_battery,  # For compatibility
-                            "last_charging_update": datetime.now()
-                        }
-                    }
-                )
-                
-                print(f"🔋 Vehicle {vehicle_id} battery updated: {current_battery}% → {new_battery}%")
-                
-                # Wait 10 seconds before next increment
-                time.sleep(10)
-                
-            except Exception as e:
-                print(f"❌ Charging error for vehicle {vehicle_id}: {e}")
-                break
-        
-        # Clean up when charging stops
-        if charging_key in charging_status:
-            del charging_status[charging_key]
-        if charging_key in charging_threads:
-            del charging_threads[charging_key]
-    
-    # Start charging thread
-    charging_key = f"{vehicle_id}_{port_id}"
-    if charging_key not in charging_threads:
-        thread = threading.Thread(target=charging_loop, daemon=True)
-        charging_threads[charging_key] = thread
-        thread.start()
-        print(f"🚀 Started charging process for vehicle {vehicle_id} on port {port_id}")
+def charging_status_rows(station_id):
+    """Charging status rows for all vehicles charging at a station"""
+    # Get all charging vehicles at this station
+    charging_vehicles = list(vehicles_collection.find(
+        {"station_id": station_id, "status": "charging"},
+        {**VEHICLE_FIELDS, "vehicle_number": 1, "charging_started_at": 1,
+         "last_charging_update": 1, "charging_energy_kwh": 1}
+    ))
+    powers = session_powers(charging_vehicles, ports_collection)
+    now = clock.now()
 
-def stop_charging_process(vehicle_id):
-    """Stop charging process for a vehicle"""
-    # Find and stop all charging processes for this vehicle
-    keys_to_remove = []
-    for key in charging_status.keys():
-        if key.startswith(f"{vehicle_id}_"):
-            charging_status[key] = False
-            keys_to_remove.append(key)
-    
-    # Clean up
-    for key in keys_to_remove:
-        if key in charging_threads:
-            del charging_threads[key]
-    
-    print(f"⏹️ Stopped charging process for vehicle {vehicle_id}")
+    # Format the response
+    charging_data = []
+    for vehicle in charging_vehicles:
+        battery_level = vehicle.get("battery_level", vehicle.get("battery", 0))
+        charging_started = vehicle.get("charging_started_at")
+        last_update = vehicle.get("last_charging_update")
+
+        # Calculate charging duration
+        duration_minutes = 0
+        if charging_started:
+            if isinstance(charging_started, str):
+                charging_started = datetime.fromisoformat(charging_started.replace('Z', '+00:00'))
+            duration = now - charging_started
+            duration_minutes = int(duration.total_seconds() / 60)
+
+        charging_data.append({
+            "vehicle_id": vehicle["vehicle_id"],
+            "vehicle_number": vehicle.get("vehicle_number", "N/A"),
+            "battery_level": battery_level,
+            "charging_port_id": vehicle.get("charging_port_id"),
+            "charging_duration_minutes": duration_minutes,
+            "last_update": last_update.isoformat() if last_update else None,
+            "is_charging": battery_level < 100,
+            **charging_eta(vehicle, powers.get(vehicle["vehicle_id"], DEFAULT_PORT_POWER_KW), now)
+        })
+    return charging_data
 
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_charging_status(request, station_id):
     """Get real-time charging status for all vehicles at a station"""
     try:
-        # Get all charging vehicles at this station
-        charging_vehicles = list(vehicles_collection.find(
-            {"station_id": station_id, "status": "charging"},
-            {"_id": 0, "vehicle_id": 1, "vehicle_number": 1, "battery_level": 1, "battery": 1, 
-             "charging_port_id": 1, "charging_started_at": 1, "last_charging_update": 1}
-        ))
-        
-        # Format the response
-        charging_data = []
-        for vehicle in charging_vehicles:
-            battery_level = vehicle.get("battery_level", vehicle.get("battery", 0))
-            charging_started = vehicle.get("charging_started_at")
-            last_update = vehicle.get("last_charging_update")
-            
-            # Calculate charging duration
-            duration_minutes = 0
-            if charging_started:
-                if isinstance(charging_started, str):
-                    charging_started = datetime.fromisoformat(charging_started.replace('Z', '+00:00'))
-                duration = datetime.now() - charging_started
-                duration_minutes = int(duration.total_seconds() / 60)
-            
-            charging_data.append({
-                "vehicle_id": vehicle["vehicle_id"],
-                "vehicle_number": vehicle.get("vehicle_number", "N/A"),
-                "battery_level": battery_level,
-                "charging_port_id": vehicle.get("charging_port_id"),
-                "charging_duration_minutes": duration_minutes,
-                "last_update": last_update.isoformat() if last_update else None,
-                "is_charging": battery_level < 100
-            })
+        station_id = canonical_station_id(station_id)
+        charging_data = charging_status_rows(station_id)
         
         return JsonResponse({
             "status": "success", 
@@ -322,11 +218,47 @@ def get_charging_status(request, station_id):
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
 
+@require_http_methods(["GET"])
+def stream_charging_status(request, station_id):
+    """Live charging status for a station as Server-Sent Events (see charging_ports/live.py)"""
+    try:
+        station_id = canonical_station_id(station_id)
+        stream = open_stream(station_id, charging_status_rows)
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+    if stream is None:
+        response = JsonResponse({"status": "error", "message": "Too many live streams, try again shortly"}, status=503)
+        response["Retry-After"] = str(RETRY_MS // 1000)
+        return response
+
+    response = StreamingHttpResponse(EventStream(*stream), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_charging_queue(request, station_id):
+    """Vehicles waiting for a port at a station, in dispatch order"""
+    try:
+        station_id = canonical_station_id(station_id)
+        queue = queue_state(station_id)
+        return JsonResponse({
+            "status": "success",
+            "queue": queue,
+            "total_queued": len(queue),
+            "dispatch": dispatch_stats()
+        })
+        
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def stop_charging(request, station_id):
     """Manually stop charging for a specific vehicle"""
     try:
+        station_id = canonical_station_id(station_id)
         data = json.loads(request.body)
         vehicle_id = data.get("vehicle_id")
         
@@ -340,10 +272,7 @@ def stop_charging(request, station_id):
         
         port_id = vehicle.get("charging_port_id")
         
-        # Stop charging process
-        stop_charging_process(vehicle_id)
-        
-        # Update vehicle status
+        # Update vehicle status; the scheduler only writes vehicles that are still charging
         vehicles_collection.update_one(
             {"vehicle_id": vehicle_id, "station_id": station_id},
             {
@@ -357,23 +286,12 @@ def stop_charging(request, station_id):
             }
         )
         
-        # Update port status
+        # Update port status and hand it to the next queued vehicle
         if port_id:
-            ports_collection.update_one(
-                {"port_id": port_id, "station_id": station_id},
-                {
-                    "$set": {
-                        "status": "available",
-                        "current_vehicle_id": None,
-                        "vehicle_id": None
-                    },
-                    "$unset": {
-                        "occupied_at": "",
-                        "charging_started_at": ""
-                    }
-                }
-            )
+            release_port(station_id, port_id, vehicle_id)
+            dispatch(station_id, time.monotonic())
         
+        invalidate_station(station_id)
         return JsonResponse({
             "status": "success", 
             "message": f"Charging stopped for vehicle {vehicle_id}"
@@ -1,58 +1,50 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from pymongo import MongoClient
 from datetime import datetime, timedelta
 import json
-import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# --- MongoDB Connection ---
-MONGO_URI = os.getenv('MONGODB_URI')
-client = MongoClient(MONGO_URI)
-db = client["boltride"]
-
-vehicle_collection = db["vehicle_details"]
-ride_collection = db["rides"]
-station_collection = db["stations"]
+from server.db import canonical_station_id, get_collection
+from reports.rollups import station_day, utc_today
+from server.cache import cached_station_view
+
+# --- MongoDB Collections ---
+vehicle_collection = get_collection("vehicle_details")
+ride_collection = get_collection("rides")
+station_collection = get_collection("stations")
 # Remove payment_collection - use ride_collection instead
-charging_port_collection = db["charging_ports"]
-station_managers_collection = db["station_managers"]
+charging_port_collection = get_collection("charging_ports")
+station_managers_collection = get_collection("station_managers")
 
 # --- Dashboard Stats API ---
 @csrf_exempt
 @require_http_methods(["GET"])
+@cached_station_view("dashboard_stats")
 def get_dashboard_stats(request, station_id):
     try:
-        # Convert station_id to integer for querying
-        try:
-            station_id_int = int(station_id)
-        except ValueError:
-            station_id_int = station_id
-
-        # Query with both integer and string station_id
-        station_query = {"$or": [{"station_id": station_id_int}, {"station_id": station_id}]}
+        station_query = {"station_id": canonical_station_id(station_id)}
         
         total_vehicles = vehicle_collection.count_documents(station_query)
-        active_rides = ride_collection.count_documents({**station_query, "status": "active"})
-        total_rides = ride_collection.count_documents(station_query)
 
-        # Calculate total collection and pending payments
-        paid_rides = list(ride_collection.find({**station_query, "payment_status": "paid"}))
-        pending_rides = list(ride_collection.find({**station_query, "payment_status": "pending"}))
-        
-        total_collection = sum([r.get("amount", 0) for r in paid_rides])
-        pending_payments = sum([r.get("amount", 0) for r in pending_rides])
+        # Ride counts and payment totals in one server-side pass; only the
+        # three fields the group needs ever leave the storage engine.
+        ride_totals = next(ride_collection.aggregate([
+            {"$match": station_query},
+            {"$project": {"_id": 0, "status": 1, "payment_status": 1, "amount": 1}},
+            {"$group": {
+                "_id": None,
+                "total_rides": {"$sum": 1},
+                "active_rides": {"$sum": {"$cond": [{"$eq": ["$status", "active"]}, 1, 0]}},
+                "total_collection": {"$sum": {"$cond": [{"$eq": ["$payment_status", "paid"]}, "$amount", 0]}},
+                "pending_payments": {"$sum": {"$cond": [{"$eq": ["$payment_status", "pending"]}, "$amount", 0]}}
+            }}
+        ]), {})
 
         stats = {
             "totalVehicles": total_vehicles,
-            "activeRides": active_rides,
-            "totalRides": total_rides,
-            "totalCollection": total_collection,
-            "pendingPayments": pending_payments,
+            "activeRides": ride_totals.get("active_rides", 0),
+            "totalRides": ride_totals.get("total_rides", 0),
+            "totalCollection": ride_totals.get("total_collection", 0),
+            "pendingPayments": ride_totals.get("pending_payments", 0),
         }
         return JsonResponse({"status": "success", "data": stats})
     except Exception as e:
@@ -63,14 +55,7 @@ def get_dashboard_stats(request, station_id):
 @require_http_methods(["GET"])
 def fetch_active_rides(request, station_id):
     try:
-        # Convert station_id to integer for querying
-        try:
-            station_id_int = int(station_id)
-        except ValueError:
-            station_id_int = station_id
-
-        # Query with both integer and string station_id
-        station_query = {"$or": [{"station_id": station_id_int}, {"station_id": station_id}]}
+        station_query = {"station_id": canonical_station_id(station_id)}
         
         rides = list(ride_collection.find({**station_query, "status": "active"}, {"_id": 0}))
         ride_list = []
@@ -100,14 +85,7 @@ def fetch_active_rides(request, station_id):
 @require_http_methods(["GET"])
 def fetch_vehicles_lite(request, station_id):
     try:
-        # Convert station_id to integer for querying
-        try:
-            station_id_int = int(station_id)
-        except ValueError:
-            station_id_int = station_id
-
-        # Query with both integer and string station_id, limit to 5 vehicles
-        station_query = {"$or": [{"station_id": station_id_int}, {"station_id": station_id}]}
+        station_query = {"station_id": canonical_station_id(station_id)}
         
         vehicles = list(vehicle_collection.find(station_query, {"_id": 0}).limit(5))
         vehicle_list = []
@@ -135,24 +113,21 @@ def fetch_vehicles_lite(request, station_id):
 # --- Get Station Details API ---
 @csrf_exempt
 @require_http_methods(["GET"])
+@cached_station_view("station_details")
 def get_station_details(request, station_id):
     try:
-        # Convert station_id to integer for querying
-        try:
-            station_id_int = int(station_id)
-        except ValueError:
-            station_id_int = station_id
+        station_id_key = canonical_station_id(station_id)
+        station_query = {"station_id": station_id_key}
 
-        # Try both integer and string station_id
         station = station_collection.find_one(
-            {"$or": [{"station_id": station_id_int}, {"station_id": station_id}]}, 
+            station_query, 
             {"_id": 0, "password": 0}
         )
         
         if not station:
             # Create a default station if not found
             station = {
-                "station_id": station_id_int,
+                "station_id": station_id_key,
                 "station_name": f"Station {station_id}",
                 "name": f"Station {station_id}",
                 "location": "Unknown Location",
@@ -165,25 +140,27 @@ def get_station_details(request, station_id):
 
         # Get charging ports for this station
         charging_ports = list(charging_port_collection.find(
-            {"$or": [{"station_id": station_id_int}, {"station_id": station_id}]}, 
+            station_query, 
             {"_id": 0}
         ))
         
-        # Calculate today's stats
-        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        # Calculate today's stats (UTC day, like the rollup rows)
+        today = utc_today()
         tomorrow = today + timedelta(days=1)
         
-        today_rides = ride_collection.count_documents({
-            "$or": [{"station_id": station_id_int}, {"station_id": station_id}],
-            "start_time": {"$gte": today, "$lt": tomorrow}
-        })
-        
-        today_revenue_rides = list(ride_collection.find({
-            "$or": [{"station_id": station_id_int}, {"station_id": station_id}],
-            "start_time": {"$gte": today, "$lt": tomorrow},
-            "payment_status": "paid"
-        }))
-        today_revenue = sum([r.get("amount", 0) for r in today_revenue_rides])
+        # Today's totals come from the daily rollup row
+        today_stats = station_day(station_id_key, today)
+        today_rides = today_stats.get("rides", 0)
+        today_revenue = today_stats.get("revenue", 0)
+
+        today_revenue_rides = list(ride_collection.find(
+            {
+                **station_query,
+                "start_time": {"$gte": today, "$lt": tomorrow},
+                "payment_status": "paid"
+            },
+            {"_id": 0, "customer_id": 1, "user_id": 1}
+        ))
 
         # Handle different location formats
         location = station.get("location", {})
@@ -1,89 +1,100 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from pymongo import MongoClient
 from datetime import datetime
-import os
-from dotenv import load_dotenv
+from server.db import canonical_station_id, get_collection
+from server.pagination import fetch_page, page_query, parse_page_params, wants_page
+from server.streaming import stream_format, stream_listing
 
-# Load environment variables
-load_dotenv()
+# Use rides collection instead of payments
+ride_collection = get_collection("rides")  # Changed from payment_collection
 
-# --- MongoDB Connection ---
-MONGO_URI = os.getenv('MONGODB_URI')
-client = MongoClient(MONGO_URI)
-db = client["boltride"]
+def format_payment(p, default_station_id="N/A"):
+    """Shape a ride document as a payment record for the frontend"""
+    # Use ride_id as payment_id
+    p["payment_id"] = p.get("ride_id", "N/A")
+    p["id"] = p.get("ride_id", "N/A")  # For frontend compatibility
+    p["ride_id"] = p.get("ride_id", "N/A")
+    p["user_id"] = p.get("customer_id") or p.get("user_id", "N/A")
+    p["amount"] = p.get("amount") or p.get("fare", 0)
+    # Use payment_status if available, otherwise derive from status
+    p["status"] = p.get("payment_status", "pending")
+    p["station_id"] = str(p.get("station_id", default_station_id))  # Ensure string format
+    
+    # Handle timestamp formatting - use end_time or start_time
+    timestamp = p.get("end_time") or p.get("start_time")
+    if timestamp:
+        if isinstance(timestamp, str):
+            try:
+                # Parse ISO string and convert to datetime object
+                dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+                p["timestamp"] = dt.isoformat()
+                p["date"] = dt.strftime("%Y-%m-%d")
+                p["time"] = dt.strftime("%H:%M:%S")
+            except:
+                p["timestamp"] = timestamp
+                p["date"] = "N/A"
+                p["time"] = "N/A"
+        elif isinstance(timestamp, datetime):
+            p["timestamp"] = timestamp.isoformat()
+            p["date"] = timestamp.strftime("%Y-%m-%d")
+            p["time"] = timestamp.strftime("%H:%M:%S")
+        else:
+            # Handle other timestamp formats
+            p["timestamp"] = str(timestamp)
+            p["date"] = "N/A"
+            p["time"] = "N/A"
+    else:
+        p["timestamp"] = "N/A"
+        p["date"] = "N/A"
+        p["time"] = "N/A"
+    
+    # Add display fields
+    p["user_name"] = p.get("user_name", f"User {p['user_id']}")
+    p["amount_display"] = f"₹{p['amount']}"
+    p["status_display"] = p["status"].title()
+    return p
 
-# Use rides collection instead of payments
-ride_collection = db["rides"]  # Changed from payment_collection
+def list_payments(request, payments_query, default_station_id="N/A"):
+    """Full, paged (?limit/after/before/from/to) or streamed (?stream=) payment listing"""
+    try:
+        fmt = stream_format(request)
+        page = parse_page_params(request) if wants_page(request) else None
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    if fmt:
+        # Streams ignore limit; cursor and date-range filters still apply
+        query = page_query(payments_query, "end_time", page) if page else payments_query
+        cursor = ride_collection.find(query, {"_id": 0}).sort([("end_time", -1), ("ride_id", -1)])
+        return stream_listing(cursor, lambda p: format_payment(p, default_station_id), "payments", fmt)
+
+    page_info = None
+    if page:
+        payments, page_info = fetch_page(ride_collection, payments_query, "end_time", page, {"_id": 0})
+    else:
+        payments = list(ride_collection.find(payments_query, {"_id": 0}).sort("end_time", -1))
+
+    # Format payments for frontend
+    for p in payments:
+        format_payment(p, default_station_id)
+
+    response = {"status": "success", "payments": payments}
+    if page_info:
+        response["page"] = page_info
+    return JsonResponse(response)
 
 # --- Get Payments by Station ID ---
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_payments_by_station(request, station_id):
     try:
-        # Convert station_id to int to match database format
-        try:
-            station_id_int = int(station_id)
-        except ValueError:
-            station_id_int = station_id
-        
-        # Get completed rides as payment records - search for both string and int
-        payments = list(ride_collection.find(
-            {
-                "station_id": {"$in": [station_id, station_id_int]}, 
-                "status": {"$in": ["completed", "active"]},
-                "amount": {"$gt": 0}  # Only rides with amount
-            }, 
-            {"_id": 0}
-        ).sort("end_time", -1))
-        
-        # Format payments for frontend
-        for p in payments:
-            # Use ride_id as payment_id
-            p["payment_id"] = p.get("ride_id", "N/A")
-            p["id"] = p.get("ride_id", "N/A")  # For frontend compatibility
-            p["ride_id"] = p.get("ride_id", "N/A")
-            p["user_id"] = p.get("customer_id") or p.get("user_id", "N/A")
-            p["amount"] = p.get("amount") or p.get("fare", 0)
-            # Use payment_status if available, otherwise derive from status
-            p["status"] = p.get("payment_status", "pending")
-            p["station_id"] = str(p.get("station_id", station_id))  # Ensure string format
-            
-            # Handle timestamp formatting - use end_time or start_time
-            timestamp = p.get("end_time") or p.get("start_time")
-            if timestamp:
-                if isinstance(timestamp, str):
-                    try:
-                        # Parse ISO string and convert to datetime object
-                        dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                        p["timestamp"] = dt.isoformat()
-                        p["date"] = dt.strftime("%Y-%m-%d")
-                        p["time"] = dt.strftime("%H:%M:%S")
-                    except:
-                        p["timestamp"] = timestamp
-                        p["date"] = "N/A"
-                        p["time"] = "N/A"
-                elif isinstance(timestamp, datetime):
-                    p["timestamp"] = timestamp.isoformat()
-                    p["date"] = timestamp.strftime("%Y-%m-%d")
-                    p["time"] = timestamp.strftime("%H:%M:%S")
-                else:
-                    # Handle other timestamp formats
-                    p["timestamp"] = str(timestamp)
-                    p["date"] = "N/A"
-                    p["time"] = "N/A"
-            else:
-                p["timestamp"] = "N/A"
-                p["date"] = "N/A"
-                p["time"] = "N/A"
-            
-            # Add display fields
-            p["user_name"] = p.get("user_name", f"User {p['user_id']}")
-            p["amount_display"] = f"₹{p['amount']}"
-            p["status_display"] = p["status"].title()
-
-        return JsonResponse({"status": "success", "payments": payments})
+        # Get completed rides as payment records
+        return list_payments(request, {
+            "station_id": canonical_station_id(station_id), 
+            "status": {"$in": ["completed", "active"]},
+            "amount": {"$gt": 0}  # Only rides with amount
+        }, station_id)
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
 
@@ -93,57 +104,9 @@ def get_payments_by_station(request, station_id):
 def get_all_payments(request):
     try:
         # Get all completed rides as payment records
-        payments = list(ride_collection.find(
-            {
-                "status": {"$in": ["completed", "active"]},
-                "amount": {"$gt": 0}
-            }, 
-            {"_id": 0}
-        ).sort("end_time", -1))
-        
-        # Format payments for frontend
-        for p in payments:
-            p["payment_id"] = p.get("ride_id", "N/A")
-            p["id"] = p.get("ride_id", "N/A")
-            p["ride_id"] = p.get("ride_id", "N/A")
-            p["user_id"] = p.get("customer_id") or p.get("user_id", "N/A")
-            p["amount"] = p.get("amount") or p.get("fare", 0)
-            # Use payment_status if available, otherwise derive from status
-            p["status"] = p.get("payment_status", "pending")
-            p["station_id"] = str(p.get("station_id", "N/A"))  # Ensure string format
-            
-            # Handle timestamp formatting - use end_time or start_time
-            timestamp = p.get("end_time") or p.get("start_time")
-            if timestamp:
-                if isinstance(timestamp, str):
-                    try:
-                        dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                        p["timestamp"] = dt.isoformat()
-                        p["date"] = dt.strftime("%Y-%m-%d")
-                        p["time"] = dt.strftime("%H:%M:%S")
-                    except:
-                        p["timestamp"] = timestamp
-                        p["date"] = "N/A"
-                        p["time"] = "N/A"
-                elif isinstance(timestamp, datetime):
-                    p["timestamp"] = timestamp.isoformat()
-                    p["date"] = timestamp.strftime("%Y-%m-%d")
-                    p["time"] = timestamp.strftime("%H:%M:%S")
-                else:
-                    # Handle other timestamp formats
-                    p["timestamp"] = str(timestamp)
-                    p["date"] = "N/A"
-                    p["time"] = "N/A"
-            else:
-                p["timestamp"] = "N/A"
-                p["date"] = "N/A"
-                p["time"] = "N/A"
-            
-            # Add display fields
-            p["user_name"] = p.get("user_name", f"User {p['user_id']}")
-            p["amount_display"] = f"₹{p['amount']}"
-            p["status_display"] = p["status"].title()
-
-        return JsonResponse({"status": "success", "payments": payments})
+        return list_payments(request, {
+            "status": {"$in": ["completed", "active"]},
+            "amount": {"$gt": 0}
+        })
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from server.db import canonical_station_id
+from reports.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute station_daily_stats rollups from the rides collection"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--station", help="Only rebuild this station")
+        parser.add_argument("--since", help="Only rebuild days on or after this date (YYYY-MM-DD)")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            try:
+                since = datetime.strptime(options["since"], "%Y-%m-%d")
+            except ValueError:
+                raise CommandError("--since must be a date in YYYY-MM-DD format")
+        station_id = canonical_station_id(options["station"]) if options["station"] else None
+
+        scanned, written = rebuild_rollups(station_id, since, options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Scanned {scanned} rides, wrote {written} daily rows"))
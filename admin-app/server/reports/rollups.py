@@ -0,0 +1,250 @@
+"""
+Per-station daily ride rollups (station_daily_stats).
+
+One row per (station_id, day) holding running counters, so reports read
+O(days) rows instead of scanning every ride:
+
+    rides, completed          ride counts
+    revenue                   sum of amount over paid rides
+    distance, duration, fare  sums over completed rides
+    by_status.<status>        ride count per status
+    by_payment_status.<ps>    {count, amount} per payment status
+    vehicles.<vehicle_id>     {rides, distance, duration} per vehicle
+
+`day` is the UTC midnight of the ride's start_time (None if the ride has no
+usable start_time); reports pick today, this week and this month in UTC too
+(utc_today). Writers call apply_ride_change(before, after) with the
+ride document before and after the write; the customer app does the same
+in services/stationDailyStats.js. `manage.py rebuild_station_daily_stats`
+recomputes rows from the rides collection.
+"""
+from datetime import datetime, timezone
+
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+
+from server.db import get_collection
+
+ROLLUP_COLLECTION = "station_daily_stats"
+
+rollups_collection = get_collection(ROLLUP_COLLECTION)
+
+# Map key for rides without a payment_status
+NO_PAYMENT_STATUS = "none"
+
+
+def ride_day(ride):
+    start_time = ride.get("start_time")
+    if isinstance(start_time, datetime):
+        if start_time.tzinfo is not None:
+            start_time = start_time.astimezone(timezone.utc)
+        return start_time.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    return None
+
+
+def utc_today():
+    """Today's row day: UTC midnight, naive like the stored days"""
+    return ride_day({"start_time": datetime.now(timezone.utc)})
+
+
+def _field_key(value):
+    # Counters live under dotted paths, so keys cannot contain "." or start with "$"
+    return str(value).replace(".", "_").lstrip("$")
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def ride_contribution(ride):
+    """Counters a single ride adds to its (station_id, day) row, as dotted paths"""
+    status = ride.get("status")
+    payment_status = ride.get("payment_status")
+    amount = _number(ride.get("amount"))
+    distance = _number(ride.get("distance_km"))
+    duration = _number(ride.get("duration_minutes"))
+
+    counters = {
+        "rides": 1,
+        f"by_status.{_field_key(status)}": 1,
+        f"by_payment_status.{_field_key(payment_status or NO_PAYMENT_STATUS)}.count": 1,
+        f"by_payment_status.{_field_key(payment_status or NO_PAYMENT_STATUS)}.amount": amount,
+    }
+    if payment_status == "paid":
+        counters["revenue"] = amount
+    if status == "completed":
+        counters["completed"] = 1
+        counters["distance"] = distance
+        counters["duration"] = duration
+        counters["fare"] = _number(ride.get("fare"))
+
+    vehicle_id = ride.get("vehicle_id")
+    if vehicle_id is not None:
+        vehicle = f"vehicles.{_field_key(vehicle_id)}"
+        counters[f"{vehicle}.rides"] = 1
+        counters[f"{vehicle}.distance"] = distance
+        counters[f"{vehicle}.duration"] = duration
+    return counters
+
+
+def _row_key(ride):
+    return ride.get("station_id"), ride_day(ride)
+
+
+def apply_ride_change(before, after):
+    """
+    Apply the difference between two versions of a ride to the rollups.
+    Pass before=None for a new ride and after=None for a deleted one.
+    """
+    deltas = {}
+    for ride, sign in ((before, -1), (after, 1)):
+        if not ride:
+            continue
+        row = deltas.setdefault(_row_key(ride), {})
+        for field, value in ride_contribution(ride).items():
+            row[field] = row.get(field, 0) + sign * value
+
+    ops = []
+    for (station_id, day), counters in deltas.items():
+        counters = {field: value for field, value in counters.items() if value}
+        if counters:
+            ops.append(UpdateOne(
+                {"station_id": station_id, "day": day},
+                {"$inc": counters},
+                upsert=True
+            ))
+    if ops:
+        rollups_collection.bulk_write(ops, ordered=False)
+
+
+def _nest(counters):
+    """Expand dotted counter paths into the nested row document"""
+    row = {}
+    for path, value in counters.items():
+        target = row
+        *parents, leaf = path.split(".")
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[leaf] = target.get(leaf, 0) + value
+    return row
+
+
+def rebuild_rollups(station_id=None, since=None, batch_size=1000):
+    """
+    Recompute rows from the rides collection. Rows in scope are replaced in
+    place and rows no ride maps to any more are deleted afterwards, so
+    reports never see the scope empty; returns (rides_scanned, rows_written).
+    """
+    rides_query = {}
+    rows_query = {}
+    if station_id is not None:
+        rides_query["station_id"] = station_id
+        rows_query["station_id"] = station_id
+    if since is not None:
+        rides_query["start_time"] = {"$gte": since}
+        rows_query["day"] = {"$gte": since}
+
+    projection = {"_id": 0, "station_id": 1, "start_time": 1, "status": 1, "payment_status": 1,
+                  "amount": 1, "fare": 1, "distance_km": 1, "duration_minutes": 1, "vehicle_id": 1}
+    totals = {}
+    scanned = 0
+    for ride in get_collection("rides").find(rides_query, projection).batch_size(batch_size):
+        scanned += 1
+        row = totals.setdefault(_row_key(ride), {})
+        for field, value in ride_contribution(ride).items():
+            row[field] = row.get(field, 0) + value
+
+    # Rows created after this read (rides started meanwhile) are not ours to delete
+    stale = [
+        (row.get("station_id"), row.get("day"))
+        for row in rollups_collection.find(rows_query, {"_id": 0, "station_id": 1, "day": 1})
+        if (row.get("station_id"), row.get("day")) not in totals
+    ]
+    ops = [
+        ReplaceOne(
+            {"station_id": row_station, "day": day},
+            {"station_id": row_station, "day": day, **_nest(counters)},
+            upsert=True
+        )
+        for (row_station, day), counters in totals.items()
+    ]
+    ops.extend(DeleteOne({"station_id": row_station, "day": day}) for row_station, day in stale)
+    for start in range(0, len(ops), batch_size):
+        rollups_collection.bulk_write(ops[start:start + batch_size], ordered=False)
+    return scanned, len(totals)
+
+
+def station_rollup_summary(station_id, today_start, week_start, month_start, trend_days=7):
+    """
+    Everything the reports need from the rollups, in one aggregation over the
+    station's rows: per-day rows (without the vehicle maps) and the top five
+    vehicles by ride count.
+    """
+    result = list(rollups_collection.aggregate([
+        {"$match": {"station_id": station_id}},
+        {"$facet": {
+            "rows": [{"$project": {"_id": 0, "vehicles": 0}}],
+            "popular_vehicles": [
+                {"$project": {"vehicles": {"$objectToArray": {"$ifNull": ["$vehicles", {}]}}}},
+                {"$unwind": "$vehicles"},
+                {"$group": {
+                    "_id": "$vehicles.k",
+                    "ride_count": {"$sum": "$vehicles.v.rides"},
+                    "total_distance": {"$sum": "$vehicles.v.distance"},
+                    "total_duration": {"$sum": "$vehicles.v.duration"}
+                }},
+                {"$match": {"ride_count": {"$gt": 0}}},
+                {"$sort": {"ride_count": -1}},
+                {"$limit": 5}
+            ]
+        }}
+    ]))
+    facets = result[0] if result else {}
+    rows = facets.get("rows", [])
+
+    summary = {
+        "total_rides": 0, "today_rides": 0, "week_rides": 0, "month_rides": 0,
+        "completed_rides": 0, "active_rides": 0,
+        "total_revenue": 0, "today_revenue": 0,
+        "completed_distance": 0, "completed_duration": 0, "completed_fare": 0,
+        "payment_status": {}, "daily": {},
+        "popular_vehicles": facets.get("popular_vehicles", []),
+    }
+    trend_start = today_start.toordinal() - (trend_days - 1)
+    for row in rows:
+        day = row.get("day")
+        rides = row.get("rides", 0)
+        summary["total_rides"] += rides
+        summary["completed_rides"] += row.get("completed", 0)
+        summary["active_rides"] += row.get("by_status", {}).get("active", 0)
+        summary["total_revenue"] += row.get("revenue", 0)
+        summary["completed_distance"] += row.get("distance", 0)
+        summary["completed_duration"] += row.get("duration", 0)
+        summary["completed_fare"] += row.get("fare", 0)
+        for payment_status, totals in row.get("by_payment_status", {}).items():
+            bucket = summary["payment_status"].setdefault(payment_status, {"count": 0, "total_amount": 0})
+            bucket["count"] += totals.get("count", 0)
+            bucket["total_amount"] += totals.get("amount", 0)
+
+        if day is None:
+            continue
+        if day >= week_start:
+            summary["week_rides"] += rides
+        if day >= month_start:
+            summary["month_rides"] += rides
+        if day == today_start:
+            summary["today_rides"] += rides
+            summary["today_revenue"] += row.get("revenue", 0)
+        if day.toordinal() >= trend_start:
+            summary["daily"][day.strftime("%Y-%m-%d")] = {"rides": rides, "revenue": row.get("revenue", 0)}
+
+    summary["payment_status"] = [
+        {"_id": None if key == NO_PAYMENT_STATUS else key, **totals}
+        for key, totals in summary["payment_status"].items()
+        if totals["count"]
+    ]
+    return summary
+
+
+def station_day(station_id, day):
+    """A single rollup row, or {} if the station had no rides that day"""
+    return rollups_collection.find_one({"station_id": station_id, "day": day}, {"_id": 0, "vehicles": 0}) or {}
@@ -1,3 +1,84 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from reports import rollups
+from reports.rollups import apply_ride_change, rebuild_rollups, ride_contribution, ride_day, station_day
+from server.db import get_collection
+from server.testing import MongoTestCase
+
+STATION = 1001
+DAY = datetime(2024, 3, 10)
+
+
+class RideContributionTests(SimpleTestCase):
+    def test_completed_paid_ride(self):
+        ride = {"status": "completed", "payment_status": "paid", "amount": 120, "fare": 100,
+                "distance_km": 4.5, "duration_minutes": 18, "vehicle_id": "V.1"}
+        self.assertEqual(ride_contribution(ride), {
+            "rides": 1, "by_status.completed": 1,
+            "by_payment_status.paid.count": 1, "by_payment_status.paid.amount": 120,
+            "revenue": 120, "completed": 1, "distance": 4.5, "duration": 18, "fare": 100,
+            "vehicles.V_1.rides": 1, "vehicles.V_1.distance": 4.5, "vehicles.V_1.duration": 18,
+        })
+
+    def test_active_unpaid_ride(self):
+        counters = ride_contribution({"status": "active", "amount": "12", "distance_km": True})
+        self.assertEqual(counters, {
+            "rides": 1, "by_status.active": 1,
+            "by_payment_status.none.count": 1, "by_payment_status.none.amount": 0,
+        })
+
+    def test_ride_day_is_utc(self):
+        ist = timezone(timedelta(hours=5, minutes=30))
+        self.assertEqual(ride_day({"start_time": datetime(2024, 3, 11, 2, 0, tzinfo=ist)}), DAY)
+        self.assertEqual(ride_day({"start_time": datetime(2024, 3, 10, 23, 59)}), DAY)
+        self.assertIsNone(ride_day({"start_time": "2024-03-10T10:00:00"}))
+
+
+class RebuildRollupsTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rides = get_collection("rides")
+        self.rows = get_collection(rollups.ROLLUP_COLLECTION)
+        self.rides.insert_many([
+            {"ride_id": "R1", "station_id": STATION, "start_time": DAY + timedelta(hours=9),
+             "status": "completed", "payment_status": "paid", "amount": 50, "fare": 45,
+             "distance_km": 2, "duration_minutes": 10, "vehicle_id": "V1"},
+            {"ride_id": "R2", "station_id": STATION, "start_time": DAY + timedelta(hours=12),
+             "status": "active", "payment_status": "pending", "amount": 20, "vehicle_id": "V2"},
+        ])
+
+    def test_matches_incremental_rows(self):
+        for ride in self.rides.find({}, {"_id": 0}):
+            apply_ride_change(None, ride)
+        incremental = station_day(STATION, DAY)
+        self.rows.delete_many({})
+
+        self.assertEqual(rebuild_rollups(STATION), (2, 1))
+        self.assertEqual(station_day(STATION, DAY), incremental)
+        self.assertEqual(incremental["rides"], 2)
+
+    def test_replaces_in_place_and_drops_stale_rows(self):
+        stale_day = DAY - timedelta(days=1)
+        self.rows.insert_many([
+            {"station_id": STATION, "day": DAY, "rides": 99},
+            {"station_id": STATION, "day": stale_day, "rides": 3},
+            {"station_id": STATION + 1, "day": stale_day, "rides": 4},
+        ])
+        bulk_write = rollups.rollups_collection.bulk_write
+        seen = []
+
+        def checked(operations, **kwargs):
+            # Readers never find the station's current rows missing mid-rebuild
+            seen.append(self.rows.count_documents({"station_id": STATION, "day": DAY}))
+            return bulk_write(operations, **kwargs)
+
+        with mock.patch.object(rollups.rollups_collection, "bulk_write", side_effect=checked):
+            rebuild_rollups(STATION)
+        self.assertEqual(seen, [1])
+        self.assertEqual(station_day(STATION, DAY)["rides"], 2)
+        self.assertIsNone(self.rows.find_one({"station_id": STATION, "day": stale_day}))
+        # Out of scope
+        self.assertEqual(self.rows.find_one({"station_id": STATION + 1})["rides"], 4)
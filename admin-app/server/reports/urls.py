@@ -3,4 +3,5 @@ from . import views
 
 urlpatterns = [
     path('<str:station_id>/', views.get_reports, name='get_reports'),
+    path('<str:station_id>/battery-history/', views.get_station_battery_history, name='get_station_battery_history'),
 ]
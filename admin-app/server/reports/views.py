@@ -1,42 +1,36 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from pymongo import MongoClient
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import json
-import os
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# --- MongoDB Connection ---
-MONGO_URI = os.getenv('MONGODB_URI')
-client = MongoClient(MONGO_URI)
-db = client["boltride"]
+from charging_ports import clock
+from charging_ports.telemetry import battery_telemetry, parse_history_range
+from server.db import canonical_station_id, get_collection
+from server.cache import cached_station_view
+from .rollups import station_rollup_summary, utc_today
 
 # Collections
-rides_collection = db["rides"]
-vehicles_collection = db["vehicle_details"]
+rides_collection = get_collection("rides")
+vehicles_collection = get_collection("vehicle_details")
 # Remove payments_collection - use rides_collection for payment data
-charging_ports_collection = db["charging_ports"]
-stations_collection = db["stations"]
+charging_ports_collection = get_collection("charging_ports")
+stations_collection = get_collection("stations")
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@cached_station_view("reports")
 def get_reports(request, station_id):
     """
     Generate comprehensive reports by aggregating data from multiple collections
     """
     try:
+        # Get today's date for daily stats, in UTC like the rollup days
+        today_start = utc_today()
+
         # Get date range (default: last 30 days)
-        end_date = datetime.now()
+        end_date = datetime.now(timezone.utc).replace(tzinfo=None)
         start_date = end_date - timedelta(days=30)
         
-        # Get today's date for daily stats
-        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        tomorrow_start = today_start + timedelta(days=1)
-        
         # Get week start (Monday)
         week_start = today_start - timedelta(days=today_start.weekday())
         
@@ -44,145 +38,94 @@ def get_reports(request, station_id):
         month_start = today_start.replace(day=1)
 
 
-        # Query with both integer and string station_id
-        try:
-            station_id_int = int(station_id)
-        except ValueError:
-            station_id_int = station_id
-        station_query = {"$or": [{"station_id": station_id_int}, {"station_id": station_id}]}
+        station_query = {"station_id": canonical_station_id(station_id)}
+
+        # Ride metrics come from the station_daily_stats rollups (one row per
+        # day); vehicles and ports are each scanned once with a $facet pipeline.
 
         # === RIDES ANALYTICS ===
-        total_rides = rides_collection.count_documents(station_query)
-        today_rides = rides_collection.count_documents({**station_query, "start_time": {"$gte": today_start, "$lt": tomorrow_start}})
-        week_rides = rides_collection.count_documents({**station_query, "start_time": {"$gte": week_start}})
-        month_rides = rides_collection.count_documents({**station_query, "start_time": {"$gte": month_start}})
+        rides = station_rollup_summary(station_query["station_id"], today_start, week_start, month_start)
 
-        completed_rides = rides_collection.count_documents({**station_query, "status": "completed"})
-        active_rides = rides_collection.count_documents({**station_query, "status": "active"})
+        total_rides = rides["total_rides"]
+        today_rides = rides["today_rides"]
+        week_rides = rides["week_rides"]
+        month_rides = rides["month_rides"]
+        completed_rides = rides["completed_rides"]
+        active_rides = rides["active_rides"]
 
         # === REVENUE ANALYTICS ===
-        total_revenue_pipeline = [
-            {"$match": {**station_query, "payment_status": "paid"}},
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-        ]
-        total_revenue_result = list(rides_collection.aggregate(total_revenue_pipeline))
-        total_revenue = total_revenue_result[0]["total"] if total_revenue_result else 0
-
-        today_revenue_pipeline = [
-            {"$match": {
-                **station_query,
-                "payment_status": "paid",
-                "start_time": {"$gte": today_start, "$lt": tomorrow_start}
-            }},
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-        ]
-        today_revenue_result = list(rides_collection.aggregate(today_revenue_pipeline))
-        today_revenue = today_revenue_result[0]["total"] if today_revenue_result else 0
-
-        # === VEHICLE ANALYTICS ===
-        total_vehicles = vehicles_collection.count_documents(station_query)
-        available_vehicles = vehicles_collection.count_documents({**station_query, "status": "available"})
-        charging_vehicles = vehicles_collection.count_documents({**station_query, "status": "charging"})
-        in_use_vehicles = vehicles_collection.count_documents({**station_query, "status": "in_use"})
-
-        # Vehicle battery analytics
-        battery_pipeline = [
-            {"$match": station_query},
-            {"$group": {
-                "_id": None,
-                "avg_battery": {"$avg": "$battery"},
-                "min_battery": {"$min": "$battery"},
-                "max_battery": {"$max": "$battery"}
-            }}
-        ]
-        battery_result = list(vehicles_collection.aggregate(battery_pipeline))
-        battery_stats = battery_result[0] if battery_result else {
-            "avg_battery": 0, "min_battery": 0, "max_battery": 0
-        }
+        total_revenue = rides["total_revenue"]
+        today_revenue = rides["today_revenue"]
 
-        # === CHARGING PORT ANALYTICS ===
-        total_ports = charging_ports_collection.count_documents(station_query)
-        available_ports = charging_ports_collection.count_documents({**station_query, "status": "available"})
-        occupied_ports = charging_ports_collection.count_documents({**station_query, "status": "occupied"})
-
-        # Port usage analytics
-        usage_pipeline = [
-            {"$match": station_query},
-            {"$group": {
-                "_id": None,
-                "total_usage": {"$sum": "$usage_count"},
-                "avg_usage": {"$avg": "$usage_count"}
-            }}
-        ]
-        usage_result = list(charging_ports_collection.aggregate(usage_pipeline))
-        usage_stats = usage_result[0] if usage_result else {"total_usage": 0, "avg_usage": 0}
+        # === PAYMENT STATUS BREAKDOWN (instead of payment methods) ===
+        payment_status = rides["payment_status"]
 
         # === DAILY TRENDS (Last 7 days) ===
         daily_trends = []
         for i in range(7):
             day_start = today_start - timedelta(days=i)
-            day_end = day_start + timedelta(days=1)
-            
-            day_rides = rides_collection.count_documents({**station_query, "start_time": {"$gte": day_start, "$lt": day_end}})
-            
-            day_revenue_pipeline = [
-                {"$match": {
-                    **station_query,
-                    "payment_status": "paid",
-                    "start_time": {"$gte": day_start, "$lt": day_end}
-                }},
-                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-            ]
-            day_revenue_result = list(rides_collection.aggregate(day_revenue_pipeline))
-            day_revenue = day_revenue_result[0]["total"] if day_revenue_result else 0
-            
+            bucket = rides["daily"].get(day_start.strftime("%Y-%m-%d"), {})
             daily_trends.append({
                 "date": day_start.strftime("%Y-%m-%d"),
                 "day": day_start.strftime("%A"),
-                "rides": day_rides,
-                "revenue": day_revenue
+                "rides": bucket.get("rides", 0),
+                "revenue": bucket.get("revenue", 0)
             })
 
-        # === PAYMENT STATUS BREAKDOWN (instead of payment methods) ===
-        payment_status_pipeline = [
-            {"$match": station_query},
-            {"$group": {
-                "_id": "$payment_status",
-                "count": {"$sum": 1},
-                "total_amount": {"$sum": "$amount"}
-            }}
-        ]
-        payment_status = list(rides_collection.aggregate(payment_status_pipeline))
-
         # === POPULAR VEHICLES ===
-        popular_vehicles_pipeline = [
-            {"$match": station_query},
-            {"$group": {
-                "_id": "$vehicle_id",
-                "ride_count": {"$sum": 1},
-                "total_distance": {"$sum": "$distance_km"},
-                "total_duration": {"$sum": "$duration_minutes"}
-            }},
-            {"$sort": {"ride_count": -1}},
-            {"$limit": 5}
-        ]
-        popular_vehicles = list(rides_collection.aggregate(popular_vehicles_pipeline))
+        popular_vehicles = rides["popular_vehicles"]
 
         # === EFFICIENCY METRICS ===
-        avg_ride_duration_pipeline = [
-            {"$match": {**station_query, "status": "completed"}},
-            {"$group": {
-                "_id": None,
-                "avg_duration": {"$avg": "$duration_minutes"},
-                "avg_distance": {"$avg": "$distance_km"},
-                "avg_fare": {"$avg": "$fare"}
+        efficiency_metrics = {
+            "avg_duration": rides["completed_duration"] / completed_rides if completed_rides else 0,
+            "avg_distance": rides["completed_distance"] / completed_rides if completed_rides else 0,
+            "avg_fare": rides["completed_fare"] / completed_rides if completed_rides else 0
+        }
+
+        # === VEHICLE ANALYTICS ===
+        vehicle_facets = _first(vehicles_collection.aggregate([
+            {"$match": station_query},
+            {"$facet": {
+                "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+                # Vehicle battery analytics
+                "battery": [{"$group": {
+                    "_id": None,
+                    "avg_battery": {"$avg": "$battery"},
+                    "min_battery": {"$min": "$battery"},
+                    "max_battery": {"$max": "$battery"}
+                }}]
             }}
-        ]
-        efficiency_result = list(rides_collection.aggregate(avg_ride_duration_pipeline))
-        efficiency_metrics = efficiency_result[0] if efficiency_result else {
-            "avg_duration": 0, "avg_distance": 0, "avg_fare": 0
+        ]))
+
+        vehicles_by_status = {g["_id"]: g["count"] for g in vehicle_facets.get("by_status", [])}
+        total_vehicles = sum(vehicles_by_status.values())
+        available_vehicles = vehicles_by_status.get("available", 0)
+        charging_vehicles = vehicles_by_status.get("charging", 0)
+        in_use_vehicles = vehicles_by_status.get("in_use", 0)
+        battery_stats = _first(vehicle_facets.get("battery", [])) or {
+            "avg_battery": 0, "min_battery": 0, "max_battery": 0
         }
 
+        # === CHARGING PORT ANALYTICS ===
+        port_facets = _first(charging_ports_collection.aggregate([
+            {"$match": station_query},
+            {"$facet": {
+                "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+                # Port usage analytics
+                "usage": [{"$group": {
+                    "_id": None,
+                    "total_usage": {"$sum": "$usage_count"},
+                    "avg_usage": {"$avg": "$usage_count"}
+                }}]
+            }}
+        ]))
+
+        ports_by_status = {g["_id"]: g["count"] for g in port_facets.get("by_status", [])}
+        total_ports = sum(ports_by_status.values())
+        available_ports = ports_by_status.get("available", 0)
+        occupied_ports = ports_by_status.get("occupied", 0)
+        usage_stats = _first(port_facets.get("usage", [])) or {"total_usage": 0, "avg_usage": 0}
+
         # Compile the comprehensive report
         report = {
             "station_id": station_id,
@@ -251,3 +194,40 @@ def get_reports(request, station_id):
         
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_station_battery_history(request, station_id):
+    """
+    Battery levels over time across the vehicles charged at a station
+    (average, min and max per bucket). ?from=&to= (ISO) or ?hours= select
+    the range; the resolution is picked to suit it.
+    """
+    try:
+        now = clock.now()
+        try:
+            start, end = parse_history_range(request.GET, now)
+        except ValueError as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+        station_id = canonical_station_id(station_id)
+        resolution, points = battery_telemetry.station_history(station_id, start, end, now)
+        return JsonResponse({
+            "status": "success",
+            "station_id": station_id,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "resolution": resolution,
+            "points": points
+        })
+
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+def _first(results):
+    """First document of an aggregation result (or facet branch), or {}"""
+    for doc in results:
+        return doc
+    return {}
+
@@ -1,20 +1,37 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from pymongo import MongoClient
 from datetime import datetime
-import os
-from dotenv import load_dotenv
+from server.db import canonical_station_id, get_collection
+from server.pagination import fetch_page, page_query, parse_page_params, wants_page
+from server.streaming import stream_format, stream_listing
 
-# Load environment variables
-load_dotenv()
+rides_collection = get_collection("rides")
 
-# --- MongoDB Connection ---
-MONGO_URI = os.getenv('MONGODB_URI')
-client = MongoClient(MONGO_URI)
-db = client["boltride"]
+def format_ride(r):
+    """Add the display fields the frontend expects to a ride document"""
+    # Handle datetime objects properly
+    if r.get("start_time"):
+        if isinstance(r["start_time"], datetime):
+            r["start_time"] = r["start_time"].isoformat()
+    
+    if r.get("end_time"):
+        if isinstance(r["end_time"], datetime):
+            r["end_time"] = r["end_time"].isoformat()
 
-rides_collection = db["rides"]
+    # Add additional fields for frontend compatibility
+    r["user_name"] = r.get("user_name", f"User {r.get('customer_id') or r.get('user_id','N/A')}")
+    r["vehicle_number"] = r.get("vehicle_number", r.get("vehicle_id","N/A"))
+    r["amount"] = r.get("amount", r.get("fare", 0))
+    r["duration"] = r.get("duration", f"{r.get('duration_minutes',0)} min")
+    r["distance"] = r.get("distance", f"{r.get('distance_km',0)} km")
+
+    # Safe pickup/drop locations
+    pickup = r.get("pickup_location")
+    drop = r.get("drop_location")
+    r["startLocation"] = f"Lat:{pickup.get('lat', 0)}, Lng:{pickup.get('lng', 0)}" if pickup else "N/A"
+    r["endLocation"] = f"Lat:{drop.get('lat', 0)}, Lng:{drop.get('lng', 0)}" if drop else "N/A"
+    return r
 
 # --- Get Rides by Station ID ---
 @csrf_exempt
@@ -22,34 +39,34 @@ rides_collection = db["rides"]
 def get_rides_by_station(request, station_id):
     try:
         # Fetch only rides for the given station_id
-        rides = list(
-            rides_collection.find({"station_id": station_id}, {"_id": 0}).sort("start_time", -1)
-        )
+        station_query = {"station_id": canonical_station_id(station_id)}
+        page_info = None
+        try:
+            fmt = stream_format(request)
+            page = parse_page_params(request) if wants_page(request) else None
+        except ValueError as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+        if fmt:
+            # Streams ignore limit; cursor and date-range filters still apply
+            query = page_query(station_query, "start_time", page) if page else station_query
+            cursor = rides_collection.find(query, {"_id": 0}).sort([("start_time", -1), ("ride_id", -1)])
+            return stream_listing(cursor, format_ride, "rides", fmt)
+
+        if page:
+            rides, page_info = fetch_page(rides_collection, station_query, "start_time", page, {"_id": 0})
+        else:
+            rides = list(
+                rides_collection.find(station_query, {"_id": 0}).sort("start_time", -1)
+            )
 
         # Format rides for frontend
         for r in rides:
-            # Handle datetime objects properly
-            if r.get("start_time"):
-                if isinstance(r["start_time"], datetime):
-                    r["start_time"] = r["start_time"].isoformat()
-            
-            if r.get("end_time"):
-                if isinstance(r["end_time"], datetime):
-                    r["end_time"] = r["end_time"].isoformat()
-
-            # Add additional fields for frontend compatibility
-            r["user_name"] = r.get("user_name", f"User {r.get('customer_id') or r.get('user_id','N/A')}")
-            r["vehicle_number"] = r.get("vehicle_number", r.get("vehicle_id","N/A"))
-            r["amount"] = r.get("amount", r.get("fare", 0))
-            r["duration"] = r.get("duration", f"{r.get('duration_minutes',0)} min")
-            r["distance"] = r.get("distance", f"{r.get('distance_km',0)} km")
-
-            # Safe pickup/drop locations
-            pickup = r.get("pickup_location")
-            drop = r.get("drop_location")
-            r["startLocation"] = f"Lat:{pickup.get('lat', 0)}, Lng:{pickup.get('lng', 0)}" if pickup else "N/A"
-            r["endLocation"] = f"Lat:{drop.get('lat', 0)}, Lng:{drop.get('lng', 0)}" if drop else "N/A"
-
-        return JsonResponse({"status": "success", "rides": rides})
+            format_ride(r)
+
+        response = {"status": "success", "rides": rides}
+        if page_info:
+            response["page"] = page_info
+        return JsonResponse(response)
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
@@ -0,0 +1,120 @@
+"""
+TTL response cache for the polled station endpoints.
+
+Responses are stored in the Django cache named by settings.RESPONSE_CACHE
+(an in-process LRU by default, Redis when REDIS_URL is set). Keys carry a
+per-station version number, so invalidate_station() drops every cached
+response for a station with a single increment instead of a key scan.
+"""
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from server.db import canonical_station_id
+
+
+class CacheStats:
+    """Hit/miss counters per cached view for this worker process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self.invalidations = 0
+
+    def record(self, name, event):
+        with self._lock:
+            counters = self._counters.setdefault(name, {"hits": 0, "misses": 0})
+            counters[event] += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        with self._lock:
+            views = {name: dict(counters) for name, counters in self._counters.items()}
+        hits = sum(c["hits"] for c in views.values())
+        misses = sum(c["misses"] for c in views.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0,
+            "invalidations": self.invalidations,
+            "views": views,
+        }
+
+
+stats = CacheStats()
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE["ALIAS"]]
+
+
+def _version_key(station_id):
+    return f"station:{station_id}:version"
+
+
+def _initial_version():
+    # Start from the clock so a version key lost to LRU eviction never
+    # resurrects responses cached under an earlier number
+    return int(time.time() * 1000)
+
+
+def _station_version(cache, station_id):
+    version = cache.get(_version_key(station_id))
+    if version is None:
+        # add() so concurrent first requests agree on the starting version
+        cache.add(_version_key(station_id), _initial_version(), timeout=None)
+        version = cache.get(_version_key(station_id), 0)
+    return version
+
+
+def invalidate_station(*station_ids):
+    """Drop every cached response for the given stations"""
+    cache = _cache()
+    for station_id in {canonical_station_id(s) for s in station_ids if s is not None}:
+        try:
+            cache.incr(_version_key(station_id))
+        except ValueError:
+            # No version yet means nothing has been cached for this station
+            cache.add(_version_key(station_id), _initial_version(), timeout=None)
+        stats.record_invalidation()
+
+
+def cached_station_view(name):
+    """
+    Cache a GET view taking (request, station_id) for RESPONSE_CACHE["TTL"][name]
+    seconds. Only successful responses are stored.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, station_id, *args, **kwargs):
+            ttl = settings.RESPONSE_CACHE["TTL"].get(name, 0)
+            if not ttl or request.method != "GET":
+                return view(request, station_id, *args, **kwargs)
+
+            cache = _cache()
+            station_key = canonical_station_id(station_id)
+            key = f"response:{name}:{station_key}:{_station_version(cache, station_key)}:{request.get_full_path()}"
+
+            cached = cache.get(key)
+            if cached is not None:
+                stats.record(name, "hits")
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+                response["X-Cache"] = "HIT"
+                return response
+
+            stats.record(name, "misses")
+            response = view(request, station_id, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(key, (response.content, response["Content-Type"]), timeout=ttl)
+            response["X-Cache"] = "MISS"
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,211 @@
+"""
+Shared MongoDB access for all Django apps.
+
+Every app gets its collections from here so a worker process holds exactly
+one MongoClient (one connection pool, one set of monitor threads).
+Client options come from settings.MONGODB.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from pymongo import MongoClient, monitoring
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Keeps running counters of connection pool activity"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.checked_out = 0
+            self.checkout_failures = 0
+            self.pools_cleared = 0
+            self.max_checked_out = 0
+
+    def _open_connections(self):
+        return self.connections_created - self.connections_closed
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "open_connections": self._open_connections(),
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "checkout_failures": self.checkout_failures,
+                "pools_cleared": self.pools_cleared,
+            }
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pools_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+
+class CommandStatsListener(monitoring.CommandListener):
+    """Counts commands (round trips) sent to the server, per process and per thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.total = 0
+
+    def started(self, event):
+        with self._lock:
+            self.total += 1
+        counter = getattr(self._local, "counter", None)
+        if counter is not None:
+            counter["round_trips"] += 1
+            counter["commands"][event.command_name] = counter["commands"].get(event.command_name, 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+pool_listener = PoolStatsListener()
+command_listener = CommandStatsListener()
+
+
+@contextmanager
+def track_round_trips():
+    """
+    Count the commands the current thread sends while the block runs.
+
+        with track_round_trips() as counter:
+            ...
+        counter["round_trips"], counter["commands"]  # e.g. 3, {"aggregate": 3}
+    """
+    counter = {"round_trips": 0, "commands": {}}
+    previous = getattr(command_listener._local, "counter", None)
+    command_listener._local.counter = counter
+    try:
+        yield counter
+    finally:
+        command_listener._local.counter = previous
+        if previous is not None:
+            previous["round_trips"] += counter["round_trips"]
+            for name, count in counter["commands"].items():
+                previous["commands"][name] = previous["commands"].get(name, 0) + count
+
+
+def _client_options():
+    config = settings.MONGODB
+    options = {
+        "appname": config["APP_NAME"],
+        "maxPoolSize": config["MAX_POOL_SIZE"],
+        "minPoolSize": config["MIN_POOL_SIZE"],
+        "maxIdleTimeMS": config["MAX_IDLE_TIME_MS"],
+        "waitQueueTimeoutMS": config["WAIT_QUEUE_TIMEOUT_MS"],
+        "connectTimeoutMS": config["CONNECT_TIMEOUT_MS"],
+        "serverSelectionTimeoutMS": config["SERVER_SELECTION_TIMEOUT_MS"],
+        "socketTimeoutMS": config["SOCKET_TIMEOUT_MS"],
+        "readPreference": config["READ_PREFERENCE"],
+        "event_listeners": [pool_listener, command_listener],
+    }
+    if config["COMPRESSORS"]:
+        options["compressors"] = config["COMPRESSORS"]
+    return options
+
+
+def get_client():
+    """Return the process-wide MongoClient, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(settings.MONGODB["URI"], **_client_options())
+    return _client
+
+
+def get_db():
+    return get_client()[settings.MONGODB["NAME"]]
+
+
+def get_collection(name):
+    return get_db()[name]
+
+
+def canonical_station_id(station_id):
+    """
+    Station ids are stored as integers in every collection (the customer app
+    writes them as Numbers). Numeric strings from URLs and request bodies are
+    converted; anything non-numeric is kept as-is.
+    """
+    if isinstance(station_id, str):
+        value = station_id.strip()
+        return int(value) if value.isascii() and value.isdigit() else value
+    return station_id
+
+
+def close_client():
+    """Close the shared client (e.g. in a post-fork hook or on shutdown)"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+            pool_listener.reset()
+
+
+def pool_stats():
+    """Pool configuration and live counters for this worker process"""
+    config = settings.MONGODB
+    return {
+        "database": config["NAME"],
+        "client_initialized": _client is not None,
+        "max_pool_size": config["MAX_POOL_SIZE"],
+        "min_pool_size": config["MIN_POOL_SIZE"],
+        "wait_queue_timeout_ms": config["WAIT_QUEUE_TIMEOUT_MS"],
+        "compressors": config["COMPRESSORS"] or None,
+        "read_preference": config["READ_PREFERENCE"],
+        "commands_sent": command_listener.total,
+        **pool_listener.snapshot(),
+    }
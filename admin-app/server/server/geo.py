@@ -0,0 +1,61 @@
+"""
+Station locations for geospatial queries.
+
+Stations store coordinates as {latitude, longitude} (customer app schema),
+which a 2dsphere index cannot read in that order. Each station also carries
+a GeoJSON point in STATION_GEO_FIELD, derived from coordinates: the
+customer app sets it when a station is saved and
+`manage.py sync_station_locations` backfills existing stations.
+"""
+import math
+
+STATION_GEO_FIELD = "geo_location"
+EARTH_RADIUS_KM = 6371.0088
+
+# Update pipeline deriving STATION_GEO_FIELD from coordinates on the server
+SYNC_PIPELINE = [
+    {"$set": {STATION_GEO_FIELD: {
+        "type": "Point",
+        "coordinates": ["$coordinates.longitude", "$coordinates.latitude"]
+    }}}
+]
+
+# Stations whose coordinates are usable numbers
+HAS_COORDINATES = {
+    "coordinates.latitude": {"$type": "number", "$gte": -90, "$lte": 90},
+    "coordinates.longitude": {"$type": "number", "$gte": -180, "$lte": 180},
+}
+
+
+def geo_point(coordinates):
+    """GeoJSON point for {latitude, longitude}, or None if they are missing"""
+    try:
+        return {"type": "Point", "coordinates": [float(coordinates["longitude"]), float(coordinates["latitude"])]}
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def lat_lng(coordinates):
+    """(latitude, longitude) in radians for {latitude, longitude}, or None if they are missing"""
+    point = geo_point(coordinates)
+    return (math.radians(point["coordinates"][1]), math.radians(point["coordinates"][0])) if point else None
+
+
+def distance_km(a, b):
+    """Great-circle (haversine) distance between two lat_lng() points"""
+    h = (math.sin((b[0] - a[0]) / 2) ** 2
+         + math.cos(a[0]) * math.cos(b[0]) * math.sin((b[1] - a[1]) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def distances_km(origin, points):
+    """distance_km from one lat_lng() point to each of `points`"""
+    lat, lng = origin
+    cos_lat = math.cos(lat)
+    sin, cos = math.sin, math.cos
+    return [
+        2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(
+            sin((b_lat - lat) / 2) ** 2 + cos_lat * cos(b_lat) * sin((b_lng - lng) / 2) ** 2
+        )))
+        for b_lat, b_lng in points
+    ]
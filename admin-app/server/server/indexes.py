@@ -0,0 +1,139 @@
+"""
+Declared MongoDB indexes for every collection the admin app reads.
+
+`manage.py ensure_indexes` creates anything missing from this catalog and
+reports drift; `--check` additionally explains HOT_PATH_QUERIES and fails if
+any of them would fall back to a collection scan. When a view gains a new
+query shape, add it to HOT_PATH_QUERIES and back it with an index here.
+
+Specs may set "unique" and "expire_after_seconds" (a TTL index).
+
+Index names are left to the server default (e.g. "station_id_1_status_1"),
+which matches what the customer app's Mongoose schemas create.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE
+
+from server.geo import STATION_GEO_FIELD
+
+
+def _battery_rollup_indexes(tier):
+    # charging_ports/telemetry.py: upserts by vehicle, station history reads, retention
+    return [
+        {"keys": [("vehicle_id", ASCENDING), ("t", ASCENDING)], "unique": True},
+        {"keys": [("station_id", ASCENDING), ("t", ASCENDING)]},
+        {"keys": [("t", ASCENDING)],
+         "expire_after_seconds": settings.BATTERY_TELEMETRY["RETENTION_DAYS"][tier] * 86400},
+    ]
+
+
+INDEXES = {
+    "rides": [
+        {"keys": [("ride_id", ASCENDING)], "unique": True},
+        {"keys": [("station_id", ASCENDING), ("status", ASCENDING)]},
+        {"keys": [("station_id", ASCENDING), ("payment_status", ASCENDING)]},
+        # Keyset pagination order: (time, ride_id) newest first
+        {"keys": [("station_id", ASCENDING), ("start_time", DESCENDING), ("ride_id", DESCENDING)]},
+        {"keys": [("station_id", ASCENDING), ("end_time", DESCENDING), ("ride_id", DESCENDING)]},
+        {"keys": [("end_time", DESCENDING), ("ride_id", DESCENDING)]},
+    ],
+    "vehicle_details": [
+        {"keys": [("vehicle_id", ASCENDING)], "unique": True},
+        {"keys": [("station_id", ASCENDING), ("status", ASCENDING)]},
+        # Charging scheduler: charging vehicles across all stations
+        {"keys": [("status", ASCENDING), ("battery_level", ASCENDING)]},
+    ],
+    "charging_ports": [
+        {"keys": [("station_id", ASCENDING), ("port_id", ASCENDING)], "unique": True},
+        {"keys": [("station_id", ASCENDING), ("status", ASCENDING)]},
+    ],
+    "charging_queue": [
+        {"keys": [("vehicle_id", ASCENDING)], "unique": True},
+        # Dispatch order: lowest battery, then longest waiting
+        {"keys": [("station_id", ASCENDING), ("battery_level", ASCENDING), ("enqueued_at", ASCENDING)]},
+    ],
+    "stations": [
+        {"keys": [("station_id", ASCENDING)], "unique": True},
+        # vehicles/views.py get_nearby_stations: $geoNear
+        {"keys": [(STATION_GEO_FIELD, GEOSPHERE)]},
+    ],
+    "station_settings": [
+        {"keys": [("station_id", ASCENDING)], "unique": True},
+    ],
+    "station_daily_stats": [
+        {"keys": [("station_id", ASCENDING), ("day", ASCENDING)], "unique": True},
+    ],
+    "battery_rollups_1m": _battery_rollup_indexes("1m"),
+    "battery_rollups_15m": _battery_rollup_indexes("15m"),
+    "battery_rollups_1h": _battery_rollup_indexes("1h"),
+    "station_managers": [
+        {"keys": [("manager_id", ASCENDING)], "unique": True},
+        {"keys": [("email", ASCENDING)], "unique": True},
+        {"keys": [("station_id", ASCENDING)]},
+    ],
+}
+
+# Representative query shapes issued by the views. Values only need the
+# right type; the planner picks the same plan for any station.
+STATION = 1001
+DAY = datetime(2024, 1, 1)
+
+HOT_PATH_QUERIES = [
+    # dashboard / reports
+    {"collection": "rides", "filter": {"station_id": STATION}},
+    {"collection": "rides", "filter": {"station_id": STATION, "status": "active"}},
+    {"collection": "rides", "filter": {"station_id": STATION, "payment_status": "paid"}},
+    {"collection": "rides", "filter": {"station_id": STATION, "start_time": {"$gte": DAY}}},
+    {"collection": "station_daily_stats", "filter": {"station_id": STATION}},
+    {"collection": "station_daily_stats", "filter": {"station_id": STATION, "day": DAY}},
+    # rides / payments listings
+    {"collection": "rides", "filter": {"station_id": STATION}, "sort": [("start_time", DESCENDING)]},
+    {"collection": "rides", "filter": {"station_id": STATION, "status": {"$in": ["completed", "active"]},
+                                       "amount": {"$gt": 0}}, "sort": [("end_time", DESCENDING)]},
+    {"collection": "rides", "filter": {"station_id": STATION, "start_time": {"$lt": DAY}},
+     "sort": [("start_time", DESCENDING), ("ride_id", DESCENDING)]},
+    {"collection": "rides", "filter": {"status": {"$in": ["completed", "active"]}, "amount": {"$gt": 0}},
+     "sort": [("end_time", DESCENDING), ("ride_id", DESCENDING)]},
+    # vehicles
+    {"collection": "vehicle_details", "filter": {"station_id": STATION}},
+    {"collection": "vehicle_details", "filter": {"station_id": STATION, "status": "charging"}},
+    {"collection": "vehicle_details", "filter": {"vehicle_id": "V001"}},
+    {"collection": "vehicle_details", "filter": {"status": "charging", "$or": [{"battery_level": {"$lt": 100}},
+                                                                          {"battery_level": None}]}},
+    # charging ports
+    {"collection": "charging_ports", "filter": {"station_id": STATION}, "sort": [("port_id", ASCENDING)]},
+    {"collection": "charging_ports", "filter": {"station_id": STATION, "port_id": "P1"}},
+    {"collection": "charging_ports", "filter": {"station_id": STATION, "status": "available"}},
+    {"collection": "charging_queue", "filter": {"station_id": STATION},
+     "sort": [("battery_level", ASCENDING), ("enqueued_at", ASCENDING)]},
+    # battery history
+    {"collection": "battery_rollups_15m", "filter": {"vehicle_id": "V001", "t": {"$gte": DAY}}, "sort": [("t", ASCENDING)]},
+    {"collection": "battery_rollups_15m", "filter": {"station_id": STATION, "t": {"$gte": DAY}}},
+    # stations / settings / auth
+    {"collection": "stations", "filter": {"station_id": STATION}},
+    {"collection": "stations", "filter": {STATION_GEO_FIELD: {"$nearSphere": {
+        "$geometry": {"type": "Point", "coordinates": [77.59, 12.97]}, "$maxDistance": 10000}}}},
+    {"collection": "station_settings", "filter": {"station_id": STATION}},
+    {"collection": "station_managers", "filter": {"email": "manager@example.com", "status": "active"}},
+    {"collection": "station_managers", "filter": {"manager_id": "M001"}},
+]
+
+
+def index_name(keys):
+    """Server default name for a key specification"""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def plan_stages(explain):
+    """Every stage name in the winning plan of an explain() result, outermost first"""
+    def walk(plan):
+        # Newer servers wrap the classic plan in queryPlan
+        plan = plan.get("queryPlan", plan)
+        stages = [plan.get("stage", "?")]
+        children = plan.get("inputStages") or ([plan["inputStage"]] if "inputStage" in plan else [])
+        for child in children:
+            stages.extend(walk(child))
+        return stages
+    return walk(explain.get("queryPlanner", {}).get("winningPlan", {}))
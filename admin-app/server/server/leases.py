@@ -0,0 +1,60 @@
+"""
+Time-limited leases stored in MongoDB, for work that exactly one worker
+process may do at a time (e.g. driving the charging scheduler).
+
+A lease is one document in LEASE_COLLECTION keyed by name. The holder renews
+it before every unit of work; if the holder dies, the lease expires after
+`ttl` seconds and the next worker to call acquire() takes it over.
+
+Expiry is computed and checked against the database server's clock ($$NOW,
+UTC), never a worker's, so clock skew between workers or a DST change on
+one of them cannot make an unexpired lease look expired.
+"""
+import os
+import socket
+
+from pymongo.errors import DuplicateKeyError
+
+from server.db import get_collection
+
+LEASE_COLLECTION = "leases"
+
+
+def default_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Lease:
+    def __init__(self, name, ttl, owner=None, collection=None):
+        self.name = name
+        self.ttl = ttl
+        self.owner = owner or default_owner()
+        self.collection = collection if collection is not None else get_collection(LEASE_COLLECTION)
+        self.held = False
+
+    def acquire(self):
+        """Take or renew the lease; returns True while this owner holds it"""
+        try:
+            self.collection.update_one(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"$expr": {"$lt": ["$expires_at", "$$NOW"]}}]},
+                [{"$set": {
+                    "owner": self.owner,
+                    "expires_at": {"$add": ["$$NOW", int(self.ttl * 1000)]},
+                    "renewed_at": "$$NOW"
+                }}],
+                upsert=True
+            )
+            self.held = True
+        except DuplicateKeyError:
+            # Another owner holds an unexpired lease, so the upsert collided with it
+            self.held = False
+        return self.held
+
+    def release(self):
+        if self.held:
+            self.collection.delete_one({"_id": self.name, "owner": self.owner})
+            self.held = False
+
+    def holder(self):
+        """The current lease document, or None if nobody holds it"""
+        return self.collection.find_one({"_id": self.name})
@@ -0,0 +1,125 @@
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import IndexModel
+
+from charging_ports.telemetry import battery_telemetry
+from server.db import get_collection, get_db
+from server.indexes import HOT_PATH_QUERIES, INDEXES, index_name, plan_stages
+
+
+class Command(BaseCommand):
+    help = "Create the indexes declared in server/indexes.py and report drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true",
+                            help="Do not create anything; fail if indexes are missing "
+                                 "or any hot-path query would COLLSCAN")
+        parser.add_argument("--drop-extra", action="store_true",
+                            help="Drop indexes that exist in the database but are not declared")
+
+    def handle(self, *args, **options):
+        check = options["check"]
+        missing_total = 0
+
+        if not check:
+            # Time-series collections cannot be created implicitly by a write
+            battery_telemetry.ensure_samples_collection()
+
+        for name, declared in INDEXES.items():
+            missing, conflicting, extra = self.diff(name, declared)
+            missing_total += len(missing) + len(conflicting)
+
+            for spec in conflicting:
+                if not check and self.retention_only(name, spec):
+                    # A changed retention is applied in place
+                    get_db().command("collMod", name, index={
+                        "keyPattern": dict(spec["keys"]), "expireAfterSeconds": spec["expire_after_seconds"]
+                    })
+                    self.stdout.write(self.style.SUCCESS(
+                        f"{name}.{index_name(spec['keys'])}: expireAfterSeconds set to {spec['expire_after_seconds']}"
+                    ))
+                    continue
+                self.stdout.write(self.style.WARNING(
+                    f"{name}.{index_name(spec['keys'])}: exists with different options "
+                    f"(declared unique={spec.get('unique', False)}, "
+                    f"expire_after_seconds={spec.get('expire_after_seconds')})"
+                ))
+            for index in extra:
+                self.stdout.write(f"{name}.{index}: not declared")
+
+            if check:
+                for spec in missing:
+                    self.stdout.write(self.style.ERROR(f"{name}.{index_name(spec['keys'])}: missing"))
+                continue
+
+            if missing:
+                created = get_collection(name).create_indexes([
+                    IndexModel(spec["keys"], unique=spec.get("unique", False),
+                               **({"expireAfterSeconds": spec["expire_after_seconds"]}
+                                  if "expire_after_seconds" in spec else {}))
+                    for spec in missing
+                ])
+                for index in created:
+                    self.stdout.write(self.style.SUCCESS(f"{name}.{index}: created"))
+            if options["drop_extra"]:
+                for index in extra:
+                    get_collection(name).drop_index(index)
+                    self.stdout.write(f"{name}.{index}: dropped")
+            if not missing and not conflicting:
+                self.stdout.write(f"{name}: {len(declared)} indexes up to date")
+
+        if not check:
+            return
+
+        collscans = self.check_query_plans()
+        if missing_total or collscans:
+            raise CommandError(
+                f"{missing_total} missing/conflicting indexes, {collscans} hot-path queries doing COLLSCAN"
+            )
+        self.stdout.write(self.style.SUCCESS("All declared indexes present, no hot-path COLLSCAN"))
+
+    def diff(self, name, declared):
+        existing = get_collection(name).index_information()
+        existing.pop("_id_", None)
+        existing_by_keys = {tuple(info["key"]): (index, info) for index, info in existing.items()}
+
+        missing, conflicting = [], []
+        matched = set()
+        for spec in declared:
+            found = existing_by_keys.get(tuple(spec["keys"]))
+            if not found:
+                missing.append(spec)
+                continue
+            index, info = found
+            matched.add(index)
+            if (info.get("unique", False) != spec.get("unique", False)
+                    or info.get("expireAfterSeconds") != spec.get("expire_after_seconds")):
+                conflicting.append(spec)
+
+        extra = sorted(set(existing) - matched)
+        return missing, conflicting, extra
+
+    def retention_only(self, name, spec):
+        """Whether a conflicting index differs from its spec only in TTL"""
+        existing = get_collection(name).index_information()
+        info = next(info for info in existing.values() if tuple(info["key"]) == tuple(spec["keys"]))
+        return ("expire_after_seconds" in spec and "expireAfterSeconds" in info
+                and info.get("unique", False) == spec.get("unique", False))
+
+    def check_query_plans(self):
+        collscans = 0
+        for query in HOT_PATH_QUERIES:
+            cursor = get_collection(query["collection"]).find(query["filter"])
+            if query.get("sort"):
+                cursor = cursor.sort(query["sort"])
+            stages = plan_stages(cursor.explain())
+
+            label = f"{query['collection']} {query['filter']}"
+            if query.get("sort"):
+                label += f" sort={query['sort']}"
+            if "COLLSCAN" in stages:
+                collscans += 1
+                self.stdout.write(self.style.ERROR(f"COLLSCAN  {label}"))
+            else:
+                self.stdout.write(f"{'>'.join(stages):<9} {label}")
+        return collscans
+
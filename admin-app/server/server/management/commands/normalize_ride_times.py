@@ -0,0 +1,83 @@
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from server.db import get_collection
+
+# Ride timestamps the listings page on (server/pagination.py)
+FIELDS = ["start_time", "end_time"]
+
+
+def parse_legacy_time(value):
+    """ISO string -> naive UTC datetime, or None if it is not a timestamp"""
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Convert ride timestamps stored as ISO strings to dates (resumable, batched)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only count rides that still need converting")
+        parser.add_argument("--restart", action="store_true",
+                            help="Ignore saved checkpoints and scan from the beginning")
+
+    def handle(self, *args, **options):
+        rides = get_collection("rides")
+        checkpoints = get_collection("migration_checkpoints")
+        for field in FIELDS:
+            legacy_filter = {field: {"$type": "string"}}
+            if options["dry_run"]:
+                pending = rides.count_documents(legacy_filter)
+                self.stdout.write(f"{field}: {pending} rides to convert")
+                continue
+
+            checkpoint_id = f"normalize_ride_times:{field}"
+            if options["restart"]:
+                checkpoints.delete_one({"_id": checkpoint_id})
+            checkpoint = checkpoints.find_one({"_id": checkpoint_id}) or {}
+            last_id = checkpoint.get("last_id")
+
+            converted = 0
+            unparseable = 0
+            while True:
+                query = dict(legacy_filter)
+                if last_id is not None:
+                    query["_id"] = {"$gt": last_id}
+                batch = list(rides.find(query, {field: 1}).sort("_id", 1).limit(options["batch_size"]))
+                if not batch:
+                    break
+
+                # Match on the old value so a concurrent write is never clobbered
+                ops = []
+                for doc in batch:
+                    value = parse_legacy_time(doc[field])
+                    if value is None:
+                        unparseable += 1
+                        continue
+                    ops.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: value}}))
+                modified = rides.bulk_write(ops, ordered=False).modified_count if ops else 0
+                converted += modified
+                last_id = batch[-1]["_id"]
+
+                checkpoints.update_one(
+                    {"_id": checkpoint_id},
+                    {"$set": {"last_id": last_id, "updated_at": datetime.now()},
+                     "$inc": {"converted": modified}},
+                    upsert=True
+                )
+
+            checkpoints.delete_one({"_id": checkpoint_id})
+            self.stdout.write(self.style.SUCCESS(f"{field}: converted {converted} rides"))
+            if unparseable:
+                self.stdout.write(self.style.WARNING(
+                    f"{field}: {unparseable} rides hold strings that are not ISO timestamps; left as they are"
+                ))
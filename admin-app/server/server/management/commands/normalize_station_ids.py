@@ -0,0 +1,119 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from server.db import canonical_station_id, get_collection
+from server.indexes import plan_stages
+
+COLLECTIONS = [
+    "vehicle_details",
+    "rides",
+    "charging_ports",
+    "stations",
+    "station_settings",
+    "station_managers",
+]
+
+# Numeric station ids still stored as strings
+LEGACY_FILTER = {"station_id": {"$type": "string", "$regex": r"^\s*\d+\s*$"}}
+
+# Queries used to compare plans before and after the backfill
+EXPLAIN_QUERIES = {
+    "vehicle_details": {"status": "available"},
+    "rides": {"status": "completed"},
+    "charging_ports": {"status": "available"},
+    "stations": {},
+    "station_settings": {},
+    "station_managers": {},
+}
+
+
+class Command(BaseCommand):
+    help = "Convert station_id to its canonical integer form in every collection (resumable, batched)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--collection", action="append", choices=COLLECTIONS,
+                            help="Limit the backfill to these collections (repeatable)")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only count documents that still need converting")
+        parser.add_argument("--restart", action="store_true",
+                            help="Ignore saved checkpoints and scan from the beginning")
+        parser.add_argument("--explain", metavar="STATION_ID",
+                            help="Compare the legacy $or plan with the single-equality plan for a station")
+
+    def handle(self, *args, **options):
+        collections = options["collection"] or COLLECTIONS
+
+        if options["explain"]:
+            for name in collections:
+                self.explain(name, options["explain"])
+            return
+
+        checkpoints = get_collection("migration_checkpoints")
+        for name in collections:
+            collection = get_collection(name)
+            if options["dry_run"]:
+                pending = collection.count_documents(LEGACY_FILTER)
+                self.stdout.write(f"{name}: {pending} documents to convert")
+                continue
+
+            checkpoint_id = f"normalize_station_ids:{name}"
+            if options["restart"]:
+                checkpoints.delete_one({"_id": checkpoint_id})
+            checkpoint = checkpoints.find_one({"_id": checkpoint_id}) or {}
+            last_id = checkpoint.get("last_id")
+
+            converted = 0
+            while True:
+                query = dict(LEGACY_FILTER)
+                if last_id is not None:
+                    query["_id"] = {"$gt": last_id}
+                batch = list(collection.find(query, {"station_id": 1})
+                             .sort("_id", 1).limit(options["batch_size"]))
+                if not batch:
+                    break
+
+                # Match on the old value so a concurrent write is never clobbered
+                ops = [
+                    UpdateOne(
+                        {"_id": doc["_id"], "station_id": doc["station_id"]},
+                        {"$set": {"station_id": canonical_station_id(doc["station_id"])}}
+                    )
+                    for doc in batch
+                ]
+                result = collection.bulk_write(ops, ordered=False)
+                converted += result.modified_count
+                last_id = batch[-1]["_id"]
+
+                checkpoints.update_one(
+                    {"_id": checkpoint_id},
+                    {"$set": {"last_id": last_id, "updated_at": datetime.now()},
+                     "$inc": {"converted": result.modified_count}},
+                    upsert=True
+                )
+
+            checkpoints.delete_one({"_id": checkpoint_id})
+            self.stdout.write(self.style.SUCCESS(f"{name}: converted {converted} documents"))
+
+    def explain(self, name, station_id):
+        collection = get_collection(name)
+        extra = EXPLAIN_QUERIES[name]
+        station_key = canonical_station_id(station_id)
+        legacy = {"$or": [{"station_id": station_key}, {"station_id": str(station_id)}], **extra}
+        current = {"station_id": station_key, **extra}
+
+        self.stdout.write(f"{name}:")
+        for label, query in (("before ($or)", legacy), ("after (equality)", current)):
+            plan = collection.find(query).explain()
+            stats = plan.get("executionStats", {})
+            stages = plan_stages(plan)
+            self.stdout.write(
+                f"  {label:<17} plan={'>'.join(stages) or '?'} "
+                f"keys={stats.get('totalKeysExamined', '?')} "
+                f"docs={stats.get('totalDocsExamined', '?')} "
+                f"returned={stats.get('nReturned', '?')} "
+                f"ms={stats.get('executionTimeMillis', '?')}"
+            )
+
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from server.db import get_collection
+from server.geo import HAS_COORDINATES, STATION_GEO_FIELD, SYNC_PIPELINE
+
+
+class Command(BaseCommand):
+    help = f"Derive each station's GeoJSON {STATION_GEO_FIELD} from its coordinates (idempotent)"
+
+    def handle(self, *args, **options):
+        stations = get_collection("stations")
+        result = stations.update_many(HAS_COORDINATES, SYNC_PIPELINE)
+        without = stations.count_documents({STATION_GEO_FIELD: {"$exists": False}})
+        self.stdout.write(f"Stations with coordinates: {result.matched_count} ({result.modified_count} updated)")
+        if without:
+            self.stdout.write(self.style.WARNING(
+                f"{without} stations have no usable coordinates and are left out of nearby-station results"
+            ))
+        self.stdout.write(self.style.SUCCESS(f"{STATION_GEO_FIELD} in sync"))
@@ -0,0 +1,14 @@
+from server.db import track_round_trips
+
+
+class MongoRoundTripMiddleware:
+    """Report how many MongoDB commands a request issued in X-Mongo-Round-Trips"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with track_round_trips() as counter:
+            response = self.get_response(request)
+        response["X-Mongo-Round-Trips"] = str(counter["round_trips"])
+        return response
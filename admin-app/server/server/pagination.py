@@ -0,0 +1,152 @@
+"""
+Keyset (cursor) pagination for ride-based listings.
+
+Listings are ordered newest first by (time_field, ride_id). A cursor encodes
+the (time, ride_id) of a boundary row, so every page is a bounded index range
+scan on a (…, time_field, ride_id) index however deep into history it is,
+unlike skip/offset.
+
+time_field must hold dates (or be missing). BSON compares values of
+different types by type first, so the $lt/$gt bounds never match a
+timestamp stored as an ISO string and a cursor taken from such a row cannot
+place it; run `manage.py normalize_ride_times` to convert legacy rows.
+
+Query parameters:
+    limit   page size (default DEFAULT_LIMIT, at most MAX_LIMIT)
+    after   cursor; return rows older than it (next page)
+    before  cursor; return rows newer than it (previous page)
+    from    ISO date/datetime; only rows with time_field >= from
+    to      ISO date/datetime; only rows with time_field < to
+"""
+import base64
+import json
+from datetime import datetime
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+PAGE_PARAMS = ("limit", "after", "before", "from", "to")
+
+
+def wants_page(request):
+    """Listings stay unpaged for callers that send none of the paging parameters"""
+    return any(name in request.GET for name in PAGE_PARAMS)
+
+
+def encode_cursor(doc, time_field):
+    value = doc.get(time_field)
+    payload = {
+        "t": value.isoformat() if isinstance(value, datetime) else None,
+        "id": doc.get("ride_id"),
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        time_value = datetime.fromisoformat(payload["t"]) if payload.get("t") else None
+        return time_value, payload["id"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an ISO date or datetime")
+
+
+def parse_page_params(request):
+    """Validate paging parameters; raises ValueError with a client-facing message"""
+    params = request.GET
+    try:
+        limit = int(params.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError("'limit' must be an integer")
+    if limit <= 0:
+        raise ValueError("'limit' must be positive")
+
+    if params.get("after") and params.get("before"):
+        raise ValueError("Use either 'after' or 'before', not both")
+
+    return {
+        "limit": min(limit, MAX_LIMIT),
+        "after": decode_cursor(params["after"]) if params.get("after") else None,
+        "before": decode_cursor(params["before"]) if params.get("before") else None,
+        "from": _parse_date(params["from"], "from") if params.get("from") else None,
+        "to": _parse_date(params["to"], "to") if params.get("to") else None,
+    }
+
+
+def _older_than(time_field, time_value, ride_id):
+    if time_value is None:
+        # Rows without a timestamp sort last; only the id breaks ties there
+        return {time_field: None, "ride_id": {"$lt": ride_id}}
+    return {"$or": [
+        {time_field: {"$lt": time_value}},
+        {time_field: time_value, "ride_id": {"$lt": ride_id}},
+        {time_field: None},
+    ]}
+
+
+def _newer_than(time_field, time_value, ride_id):
+    if time_value is None:
+        return {"$or": [
+            {time_field: {"$ne": None}},
+            {time_field: None, "ride_id": {"$gt": ride_id}},
+        ]}
+    return {"$or": [
+        {time_field: {"$gt": time_value}},
+        {time_field: time_value, "ride_id": {"$gt": ride_id}},
+    ]}
+
+
+def page_query(query, time_field, page):
+    """Add the date range and cursor conditions to a base query"""
+    conditions = [query]
+    time_range = {}
+    if page["from"]:
+        time_range["$gte"] = page["from"]
+    if page["to"]:
+        time_range["$lt"] = page["to"]
+    if time_range:
+        conditions.append({time_field: time_range})
+    if page["after"]:
+        conditions.append(_older_than(time_field, *page["after"]))
+    if page["before"]:
+        conditions.append(_newer_than(time_field, *page["before"]))
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def fetch_page(collection, query, time_field, page, projection=None):
+    """
+    Return (docs, page_info) for one page, newest first. Reads limit + 1 rows
+    to know whether another page exists in the direction of travel.
+    """
+    limit = page["limit"]
+    backwards = page["before"] is not None
+    direction = 1 if backwards else -1
+
+    docs = list(
+        collection.find(page_query(query, time_field, page), projection)
+        .sort([(time_field, direction), ("ride_id", direction)])
+        .limit(limit + 1)
+    )
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    if backwards:
+        docs.reverse()
+
+    has_newer = has_more if backwards else page["after"] is not None
+    has_older = page["before"] is not None if backwards else has_more
+    page_info = {
+        "limit": limit,
+        "count": len(docs),
+        "has_more": has_older,
+        "next_cursor": encode_cursor(docs[-1], time_field) if docs and has_older else None,
+        "prev_cursor": encode_cursor(docs[0], time_field) if docs and has_newer else None,
+    }
+    return docs, page_info
@@ -10,8 +10,14 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -39,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'corsheaders',
+    'server',
     'vehicles',
     'rides',
     'reports',
@@ -58,6 +65,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'server.middleware.MongoRoundTripMiddleware',
     
 ]
 
@@ -133,4 +141,80 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+CORS_EXPOSE_HEADERS = ['X-Mongo-Round-Trips']
+
+
+# MongoDB
+# One shared client per process, see server/db.py
+
+MONGODB = {
+    'URI': os.getenv('MONGODB_URI'),
+    'NAME': os.getenv('MONGODB_NAME', 'boltride'),
+    'APP_NAME': os.getenv('MONGODB_APP_NAME', 'boltride-admin'),
+    'MAX_POOL_SIZE': int(os.getenv('MONGODB_MAX_POOL_SIZE', '50')),
+    'MIN_POOL_SIZE': int(os.getenv('MONGODB_MIN_POOL_SIZE', '0')),
+    'MAX_IDLE_TIME_MS': int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', '300000')),
+    'WAIT_QUEUE_TIMEOUT_MS': int(os.getenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS', '5000')),
+    'CONNECT_TIMEOUT_MS': int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', '5000')),
+    'SERVER_SELECTION_TIMEOUT_MS': int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+    'SOCKET_TIMEOUT_MS': int(os.getenv('MONGODB_SOCKET_TIMEOUT_MS', '20000')),
+    # Comma separated, e.g. "zstd,snappy,zlib"; empty disables compression
+    'COMPRESSORS': os.getenv('MONGODB_COMPRESSORS', 'zlib'),
+    'READ_PREFERENCE': os.getenv('MONGODB_READ_PREFERENCE', 'primaryPreferred'),
+}
+
+# `manage.py test` uses a throwaway "test_<NAME>" database, see server/testing.py
+TEST_RUNNER = 'server.testing.MongoTestRunner'
+
+
+# Cache
+# In-process LRU by default; set REDIS_URL to share the cache between workers
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+            'KEY_PREFIX': 'boltride',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'boltride-responses',
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000'))},
+        }
+    }
+
+# TTLs in seconds for the polled station endpoints, see server/cache.py (0 disables)
+RESPONSE_CACHE = {
+    'ALIAS': 'default',
+    'TTL': {
+        'dashboard_stats': int(os.getenv('CACHE_TTL_DASHBOARD_STATS', '15')),
+        'station_details': int(os.getenv('CACHE_TTL_STATION_DETAILS', '30')),
+        'reports': int(os.getenv('CACHE_TTL_REPORTS', '60')),
+    },
+}
+
+# Charging scheduler, see charging_ports/scheduler.py
+CHARGING = {
+    'TICK_SECONDS': float(os.getenv('CHARGING_TICK_SECONDS', '10')),
+    # A worker that stops renewing the scheduler lease for this long is replaced
+    'LEASE_SECONDS': float(os.getenv('CHARGING_LEASE_SECONDS', '30')),
+    # Charging time runs this many times faster than real time (charging_ports/clock.py)
+    'TIME_SCALE': float(os.getenv('CHARGING_TIME_SCALE', '1')),
+    # Live status streams (SSE) one worker process serves at once; each holds a thread
+    'MAX_LIVE_STREAMS': int(os.getenv('CHARGING_MAX_LIVE_STREAMS', '20')),
+}
+
+# Battery telemetry retention in days, see charging_ports/telemetry.py
+BATTERY_TELEMETRY = {
+    'RAW_RETENTION_DAYS': int(os.getenv('BATTERY_SAMPLES_RETENTION_DAYS', '2')),
+    'RETENTION_DAYS': {
+        '1m': int(os.getenv('BATTERY_ROLLUP_1M_RETENTION_DAYS', '7')),
+        '15m': int(os.getenv('BATTERY_ROLLUP_15M_RETENTION_DAYS', '90')),
+        '1h': int(os.getenv('BATTERY_ROLLUP_1H_RETENTION_DAYS', '730')),
+    },
+}
@@ -0,0 +1,90 @@
+"""
+Streaming responses for bulk listings.
+
+With ?stream=ndjson a listing is written as one JSON document per line; with
+?stream=json it is written as the usual {"<key>": [...], "status": ...}
+object, chunk by chunk. Rows are pulled from the Mongo cursor BATCH_SIZE at a
+time and written as they are formatted, so worker memory is bounded by the
+batch size rather than the result size.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+BATCH_SIZE = 500
+
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+def stream_format(request):
+    """The requested stream format, or None for a regular JsonResponse"""
+    value = request.GET.get("stream")
+    if value is None:
+        return None
+    if value not in STREAM_FORMATS:
+        raise ValueError(f"'stream' must be one of: {', '.join(STREAM_FORMATS)}")
+    return value
+
+
+def _dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder)
+
+
+def _ndjson(cursor, format_row, batch_size):
+    chunk = []
+    try:
+        for doc in cursor:
+            chunk.append(_dumps(format_row(doc)))
+            if len(chunk) >= batch_size:
+                yield "\n".join(chunk) + "\n"
+                chunk = []
+        if chunk:
+            yield "\n".join(chunk) + "\n"
+    except Exception as e:
+        if chunk:
+            yield "\n".join(chunk) + "\n"
+        yield _dumps({"status": "error", "message": str(e)}) + "\n"
+
+
+def _json_array(cursor, format_row, key, trailer, batch_size):
+    # status goes last so it can report an error hit halfway through the cursor
+    yield '{"%s": [' % key
+    count = 0
+    chunk = []
+    separator = ""
+    try:
+        for doc in cursor:
+            chunk.append(_dumps(format_row(doc)))
+            count += 1
+            if len(chunk) >= batch_size:
+                yield separator + ",".join(chunk)
+                chunk, separator = [], ","
+        if chunk:
+            yield separator + ",".join(chunk)
+            chunk, separator = [], ","
+        extra = trailer(count) if trailer else {}
+        tail = "".join(f", {_dumps(name)}: {_dumps(value)}" for name, value in extra.items())
+        yield f'], "count": {count}{tail}, "status": "success"}}'
+    except Exception as e:
+        if chunk:
+            yield separator + ",".join(chunk)
+        yield f'], "count": {count}, "status": "error", "message": {_dumps(str(e))}}}'
+
+
+def stream_listing(cursor, format_row, key, fmt, trailer=None, batch_size=BATCH_SIZE):
+    """
+    Stream cursor rows through format_row. trailer(count) may return extra
+    top-level fields for the json format (e.g. capacity info).
+    """
+    cursor = cursor.batch_size(batch_size)
+    if fmt == "ndjson":
+        body = _ndjson(cursor, format_row, batch_size)
+    else:
+        body = _json_array(cursor, format_row, key, trailer, batch_size)
+    response = StreamingHttpResponse(body, content_type=STREAM_FORMATS[fmt])
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,57 @@
+"""
+Test support: `manage.py test` runs against a throwaway MongoDB database.
+
+Collections are bound from server.db when app modules are imported, so
+MongoTestRunner switches settings.MONGODB["NAME"] to "test_<name>" before
+any test module (and the views it imports) is loaded, and drops that
+database when the run ends. Tests that touch MongoDB derive from
+MongoTestCase, which creates the declared indexes once per run and empties
+every collection before each test.
+"""
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.runner import DiscoverRunner
+
+from server import db
+
+_prepared = False
+
+
+class MongoTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        if db._client is not None:
+            raise RuntimeError("MongoDB client created before the test database was selected")
+        self._mongo_name = settings.MONGODB["NAME"]
+        settings.MONGODB["NAME"] = f"test_{self._mongo_name}"
+
+    def teardown_test_environment(self, **kwargs):
+        # Runs with only pure tests never open a connection
+        if _prepared:
+            db.get_client().drop_database(settings.MONGODB["NAME"])
+        settings.MONGODB["NAME"] = self._mongo_name
+        super().teardown_test_environment(**kwargs)
+
+
+class MongoTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        global _prepared
+        super().setUpClass()
+        if not settings.MONGODB["NAME"].startswith("test_"):
+            raise RuntimeError("MongoTestCase needs MongoTestRunner (settings.TEST_RUNNER)")
+        if not _prepared:
+            db.get_client().drop_database(settings.MONGODB["NAME"])
+            call_command("ensure_indexes", stdout=StringIO())
+            _prepared = True
+
+    def setUp(self):
+        database = db.get_db()
+        for name in database.list_collection_names():
+            if not name.startswith("system."):
+                database[name].delete_many({})
+        cache.clear()
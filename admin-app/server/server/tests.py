@@ -0,0 +1,121 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from server.db import get_collection
+from server.leases import Lease
+from server.pagination import decode_cursor, encode_cursor, fetch_page
+from server.streaming import _json_array
+from server.testing import MongoTestCase
+
+
+def read(body):
+    return json.loads("".join(body))
+
+
+class JsonArrayStreamTests(TestCase):
+    def test_rows_and_trailer(self):
+        body = _json_array(range(5), lambda n: {"n": n}, "rows", lambda count: {"pages": count // 2}, 2)
+        self.assertEqual(read(body), {"rows": [{"n": n} for n in range(5)], "count": 5, "pages": 2,
+                                      "status": "success"})
+
+    def test_error_in_cursor(self):
+        def rows():
+            yield from range(3)
+            raise RuntimeError("cursor died")
+
+        body = read(_json_array(rows(), lambda n: {"n": n}, "rows", None, 2))
+        self.assertEqual(body["rows"], [{"n": n} for n in range(3)])
+        self.assertEqual((body["status"], body["message"]), ("error", "cursor died"))
+
+    def test_error_in_trailer(self):
+        def trailer(count):
+            raise RuntimeError("no capacity")
+
+        body = read(_json_array(range(3), lambda n: {"n": n}, "rows", trailer, 2))
+        # Rows already sent are not repeated
+        self.assertEqual(body["rows"], [{"n": n} for n in range(3)])
+        self.assertEqual(body["status"], "error")
+
+
+class LeaseTests(MongoTestCase):
+    def expire(self, name):
+        Lease(name, ttl=1).collection.update_one({"_id": name}, {"$set": {"expires_at": datetime(2000, 1, 1)}})
+
+    def test_one_holder_among_workers(self):
+        workers = [Lease("test", ttl=30, owner=f"worker-{i}") for i in range(8)]
+        barrier = threading.Barrier(len(workers))
+
+        def acquire(lease):
+            barrier.wait()
+            return lease.acquire()
+
+        with ThreadPoolExecutor(len(workers)) as pool:
+            held = list(pool.map(acquire, workers))
+        self.assertEqual(held.count(True), 1)
+        self.assertEqual(workers[0].holder()["owner"], workers[held.index(True)].owner)
+
+    def test_renew_and_take_over(self):
+        first, second = Lease("test", ttl=30, owner="a"), Lease("test", ttl=30, owner="b")
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        self.assertTrue(first.acquire())
+
+        self.expire("test")
+        self.assertTrue(second.acquire())
+        self.assertFalse(first.acquire())
+        self.assertEqual(first.holder()["owner"], "b")
+
+    def test_release(self):
+        first, second = Lease("test", ttl=30, owner="a"), Lease("test", ttl=30, owner="b")
+        first.acquire()
+        first.release()
+        self.assertIsNone(first.holder())
+        self.assertTrue(second.acquire())
+
+
+class CursorTests(TestCase):
+    def test_round_trip(self):
+        doc = {"start_time": datetime(2024, 3, 10, 9, 30, 15, 250), "ride_id": "R7"}
+        self.assertEqual(decode_cursor(encode_cursor(doc, "start_time")), (doc["start_time"], "R7"))
+        # Rows without a date sort last and keep only the id
+        self.assertEqual(decode_cursor(encode_cursor({"ride_id": "R8"}, "start_time")), (None, "R8"))
+
+    def test_invalid(self):
+        for cursor in ("not base64!", "e30", encode_cursor({"start_time": datetime(2024, 1, 1)}, "start_time")[:-4]):
+            with self.assertRaises(ValueError, msg=cursor):
+                decode_cursor(cursor)
+
+
+class RideTimePagingTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rides = get_collection("rides")
+        self.rides.insert_many(
+            [{"ride_id": f"R{i}", "station_id": 1, "start_time": datetime(2024, 1, 1 + i)} for i in range(4)]
+            + [{"ride_id": "R4", "station_id": 1, "start_time": "2024-01-05T10:00:00+05:30"},
+               {"ride_id": "R5", "station_id": 1, "start_time": "yesterday"},
+               {"ride_id": "R6", "station_id": 1}]
+        )
+
+    def walk(self):
+        page = {"limit": 2, "after": None, "before": None, "from": None, "to": None}
+        seen = []
+        while True:
+            docs, info = fetch_page(self.rides, {"station_id": 1}, "start_time", page, {"_id": 0})
+            seen += [doc["ride_id"] for doc in docs]
+            if not info["next_cursor"]:
+                return seen
+            page["after"] = decode_cursor(info["next_cursor"])
+
+    def test_normalize_legacy_strings(self):
+        call_command("normalize_ride_times", stdout=StringIO())
+        self.assertEqual(self.rides.find_one({"ride_id": "R4"})["start_time"], datetime(2024, 1, 5, 4, 30))
+        self.assertEqual(self.rides.find_one({"ride_id": "R5"})["start_time"], "yesterday")
+        self.rides.delete_one({"ride_id": "R5"})
+        self.assertEqual(self.walk(), ["R4", "R3", "R2", "R1", "R0", "R6"])
@@ -1,3 +1,32 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.test import RequestFactory
+
+from server.db import get_collection
+from server.testing import MongoTestCase
+from settings.views import update_settings
+
+STATION = 1001
+
+
+class ChargingSettingsTests(MongoTestCase):
+    def update(self, body):
+        request = RequestFactory().put("/", body, content_type="application/json")
+        return update_settings(request, str(STATION))
+
+    def test_power_budget(self):
+        response = self.update(json.dumps({"name": "Depot", "charging": {"powerBudgetKw": 42.5,
+                                                                          "allocation": "soc_priority"}}))
+        self.assertEqual(response.status_code, 200)
+        stored = get_collection("station_settings").find_one({"station_id": STATION})
+        self.assertEqual(stored["charging"], {"powerBudgetKw": 42.5, "allocation": "soc_priority"})
+
+    def test_invalid_power_budget(self):
+        # json.loads accepts the NaN and Infinity literals
+        for budget in ("NaN", "Infinity", "-Infinity", "-1", "true", '"50"'):
+            body = f'{{"name": "Depot", "charging": {{"powerBudgetKw": {budget}}}}}'
+            response = self.update(body)
+            self.assertEqual(response.status_code, 400, budget)
+            self.assertEqual(json.loads(response.content)["message"],
+                             "Charging powerBudgetKw must be a non-negative number")
+        self.assertIsNone(get_collection("station_settings").find_one({"station_id": STATION}))
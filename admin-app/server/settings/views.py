@@ -1,25 +1,20 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from pymongo import MongoClient
 import json
+import math
 from datetime import datetime
-import os
-from dotenv import load_dotenv
+from charging_ports.power_budget import ALLOCATION_MODES, DEFAULT_ALLOCATION
+from server.cache import invalidate_station
+from server.db import canonical_station_id, get_collection
 
-# Load environment variables
-load_dotenv()
-
-# MongoDB connection
-MONGO_URI = os.getenv('MONGODB_URI')
-client = MongoClient(MONGO_URI)
-db = client["boltride"]
-settings_collection = db["station_settings"]
+settings_collection = get_collection("station_settings")
 
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_settings(request, station_id):
     try:
+        station_id = canonical_station_id(station_id)
         settings = settings_collection.find_one({"station_id": station_id}, {"_id": 0})
         
         if not settings:
@@ -49,6 +44,10 @@ def get_settings(request, station_id):
                     "autoLock": True,
                     "emergencyContact": "+91 98765 43210"
                 },
+                "charging": {
+                    "powerBudgetKw": None,
+                    "allocation": DEFAULT_ALLOCATION
+                },
                 "created_at": datetime.now().isoformat()
             }
             
@@ -71,6 +70,7 @@ def get_settings(request, station_id):
 @require_http_methods(["POST", "PUT"])
 def update_settings(request, station_id):
     try:
+        station_id = canonical_station_id(station_id)
         data = json.loads(request.body)
         
         # Validate required fields
@@ -138,7 +138,29 @@ def update_settings(request, station_id):
                         "message": "Emergency contact must be a valid phone number"
                     }, status=400)
         
+        # Validate charging power budget (None or 0 = unlimited)
+        if "charging" in data:
+            charging = data["charging"]
+            if not isinstance(charging, dict):
+                return JsonResponse({
+                    "status": "error", 
+                    "message": "Charging settings must be an object"
+                }, status=400)
+            budget = charging.get("powerBudgetKw")
+            if budget is not None and (not isinstance(budget, (int, float)) or isinstance(budget, bool)
+                                       or not math.isfinite(budget) or budget < 0):
+                return JsonResponse({
+                    "status": "error", 
+                    "message": "Charging powerBudgetKw must be a non-negative number"
+                }, status=400)
+            if "allocation" in charging and charging["allocation"] not in ALLOCATION_MODES:
+                return JsonResponse({
+                    "status": "error", 
+                    "message": f"Charging allocation must be one of: {', '.join(ALLOCATION_MODES)}"
+                }, status=400)
+        
         # Add update timestamp
+        data["station_id"] = station_id
         data["updated_at"] = datetime.now().isoformat()
         
         result = settings_collection.update_one(
@@ -147,6 +169,8 @@ def update_settings(request, station_id):
             upsert=True
         )
         
+        invalidate_station(station_id)
+        
         # Return updated settings
         updated_settings = settings_collection.find_one({"station_id": station_id}, {"_id": 0})
         
@@ -173,6 +197,7 @@ def update_settings(request, station_id):
 def reset_settings(request, station_id):
     """Reset settings to default configuration"""
     try:
+        station_id = canonical_station_id(station_id)
         default_config = {
             "station_id": station_id,
             "name": f"Station {station_id}",
@@ -198,6 +223,10 @@ def reset_settings(request, station_id):
                 "autoLock": True,
                 "emergencyContact": "+91 98765 43210"
             },
+            "charging": {
+                "powerBudgetKw": None,
+                "allocation": DEFAULT_ALLOCATION
+            },
             "created_at": datetime.now().isoformat(),
             "updated_at": datetime.now().isoformat()
         }
@@ -207,6 +236,7 @@ def reset_settings(request, station_id):
             default_config,
             upsert=True
         )
+        invalidate_station(station_id)
         
         return JsonResponse({
             "status": "success",
@@ -1,21 +1,12 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from pymongo import MongoClient
 from datetime import datetime
 import json
-import os
-from dotenv import load_dotenv
+from server.db import canonical_station_id, get_collection
 import hashlib
 
-# Load environment variables
-load_dotenv()
-
-# MongoDB connection
-MONGO_URI = os.getenv('MONGODB_URI')
-client = MongoClient(MONGO_URI)
-db = client["boltride"]
-station_managers_collection = db["station_managers"]
+station_managers_collection = get_collection("station_managers")
 
 def hash_password(password):
     """Simple password hashing (in production, use bcrypt or similar)"""
@@ -165,7 +156,7 @@ def get_managers_by_station(request, station_id):
     """Get all managers for a station"""
     try:
         managers = list(station_managers_collection.find(
-            {"station_id": station_id},
+            {"station_id": canonical_station_id(station_id)},
             {"_id": 0, "password": 0}  # Exclude password
         ))
         
@@ -187,7 +178,7 @@ def verify_manager_access(request):
     try:
         data = json.loads(request.body)
         manager_id = data.get("manager_id")
-        station_id = data.get("station_id")
+        station_id = canonical_station_id(data.get("station_id"))
         permission = data.get("permission")  # e.g., "manage_vehicles", "view_reports"
         
         if not manager_id or not station_id:
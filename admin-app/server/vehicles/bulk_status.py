@@ -0,0 +1,135 @@
+"""
+Bulk vehicle status changes.
+
+Applies update_vehicle_status's rules for moving vehicles out of (or
+between) non-charging states to many vehicles at once: a charging vehicle
+has its session stopped and its port released, every vehicle leaves the
+charging queue, and freed ports are handed to queued vehicles. The round
+trips are fixed however many vehicles are selected:
+
+1. one find for the selected vehicles;
+2. one bulk_write of conditional updates; each only applies if the vehicle
+   is still in the state it was read in, so a concurrent change (a rental,
+   a session completing) wins and is reported as a conflict;
+3. one find to learn which updates applied: they all set bulk_op to a
+   token unique to this call, which no other writer touches;
+4. one bulk_write releasing the ports of the stopped sessions, one
+   delete_many on the queue, then a dispatch per station that freed ports.
+
+Starting sessions needs a port claim per vehicle, so "charging" is left to
+update_vehicle_status.
+"""
+import time
+import uuid
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from charging_ports.allocation import PORT_RELEASE, ports_collection
+from charging_ports.charging_queue import dequeue_many, dispatch
+from server.cache import invalidate_station
+from server.db import canonical_station_id, get_collection
+
+vehicle_collection = get_collection("vehicle_details")
+
+BULK_STATUSES = ("available", "in_use", "maintenance", "out_of_service")
+# Fields a bulk selection may filter on
+FILTER_FIELDS = ("station_id", "model", "type", "status")
+MAX_BULK_VEHICLES = 5000
+
+
+def selection_query(vehicle_ids=None, filters=None):
+    """Mongo query for a bulk selection; raises ValueError if it is empty or malformed"""
+    query = {}
+    if filters is not None and not isinstance(filters, dict):
+        raise ValueError("filter must be an object")
+    for field, value in (filters or {}).items():
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"Cannot filter on {field}. Valid filters: {', '.join(FILTER_FIELDS)}")
+        if isinstance(value, (dict, list)):
+            raise ValueError(f"Filter {field} must be a single value")
+        query[field] = canonical_station_id(value) if field == "station_id" else value
+    if vehicle_ids is not None:
+        if not isinstance(vehicle_ids, list) or not all(isinstance(v, str) for v in vehicle_ids):
+            raise ValueError("vehicle_ids must be a list of vehicle IDs")
+        query["vehicle_id"] = {"$in": vehicle_ids}
+    if not query:
+        raise ValueError("Select vehicles with vehicle_ids or a filter")
+    return query
+
+
+def apply_status(query, new_status, vehicle_ids=None):
+    """
+    Move the vehicles matching `query` to `new_status`. Returns (summary,
+    results) with one result per selected vehicle: updated, conflict or,
+    for requested ids that do not exist, not_found.
+    """
+    vehicles = list(vehicle_collection.find(
+        query, {"_id": 0, "vehicle_id": 1, "station_id": 1, "status": 1, "charging_port_id": 1},
+        limit=MAX_BULK_VEHICLES + 1
+    ))
+    if len(vehicles) > MAX_BULK_VEHICLES:
+        raise ValueError(f"Selection matches more than {MAX_BULK_VEHICLES} vehicles")
+
+    stamp = datetime.now().isoformat()
+    token = uuid.uuid4().hex
+    operations = []
+    for vehicle in vehicles:
+        update_data = {"status": new_status, "updated_at": stamp, "bulk_op": token}
+        condition = {"vehicle_id": vehicle["vehicle_id"], "status": vehicle.get("status")}
+        if vehicle.get("status") == "charging":
+            condition["charging_port_id"] = vehicle.get("charging_port_id")
+            update_data["charging_port_id"] = None
+            update_data["charging_started_at"] = None
+        operations.append(UpdateOne(condition, {"$set": update_data}))
+    if operations:
+        vehicle_collection.bulk_write(operations, ordered=False)
+
+    applied = {v["vehicle_id"] for v in vehicle_collection.find(
+        {"vehicle_id": {"$in": [vehicle["vehicle_id"] for vehicle in vehicles]}, "bulk_op": token},
+        {"_id": 0, "vehicle_id": 1}
+    )} if vehicles else set()
+
+    # Stop the sessions that were ended and free their ports
+    stopped = [v for v in vehicles
+               if v["vehicle_id"] in applied and v.get("status") == "charging" and v.get("charging_port_id")]
+    if stopped:
+        ports_collection.bulk_write([
+            UpdateOne(
+                {"station_id": vehicle.get("station_id"), "port_id": vehicle["charging_port_id"],
+                 "$or": [{"current_vehicle_id": vehicle["vehicle_id"]}, {"vehicle_id": vehicle["vehicle_id"]}]},
+                PORT_RELEASE
+            )
+            for vehicle in stopped
+        ], ordered=False)
+    freed_at = time.monotonic()
+
+    dequeued = dequeue_many(applied) if applied else 0
+    dispatched = []
+    for station_id in {vehicle.get("station_id") for vehicle in stopped}:
+        dispatched.extend(dispatch(station_id, freed_at))
+    invalidate_station(*{vehicle.get("station_id") for vehicle in vehicles if vehicle["vehicle_id"] in applied})
+
+    results = [
+        {
+            "vehicle_id": vehicle["vehicle_id"],
+            "previous_status": vehicle.get("status"),
+            "status": "updated" if vehicle["vehicle_id"] in applied else "conflict"
+        }
+        for vehicle in vehicles
+    ]
+    found = {vehicle["vehicle_id"] for vehicle in vehicles}
+    results.extend(
+        {"vehicle_id": vehicle_id, "status": "not_found"}
+        for vehicle_id in dict.fromkeys(vehicle_ids or []) if vehicle_id not in found
+    )
+    summary = {
+        "selected": len(vehicles),
+        "updated": len(applied),
+        "conflicts": len(vehicles) - len(applied),
+        "not_found": len(results) - len(vehicles),
+        "sessions_stopped": len(stopped),
+        "dequeued": dequeued,
+        "vehicles_dispatched": len(dispatched)
+    }
+    return summary, results
@@ -0,0 +1,90 @@
+import math
+import random
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vehicles.rebalancing import DEFAULT_MAX_KM, plan_from_snapshot
+
+# Synthetic city: stations spread over a square this many km across
+CITY_KM = 25
+ORIGIN = (12.97, 77.59)
+
+
+def synthetic_network(count, seed):
+    """Station snapshot rows (see rebalancing.station_snapshot) with demand concentrated in a few hubs"""
+    rng = random.Random(seed)
+    hubs = [(rng.random() * CITY_KM, rng.random() * CITY_KM) for _ in range(5)]
+    stations = []
+    for i in range(count):
+        x, y = rng.random() * CITY_KM, rng.random() * CITY_KM
+        near_hub = min(math.hypot(x - hx, y - hy) for hx, hy in hubs)
+        capacity = rng.randint(20, 60)
+        vehicles = rng.randint(0, capacity)
+        stations.append({
+            "station_id": 100000 + i,
+            "station_name": f"Station {i}",
+            "capacity": capacity,
+            "vehicles": vehicles,
+            "ready": rng.randint(0, vehicles),
+            "rides": int(rng.expovariate(1 / 40) * 3 / (1 + near_hub / 3)),
+            "point": (math.radians(ORIGIN[0] + y / 111.0),
+                      math.radians(ORIGIN[1] + x / (111.0 * math.cos(math.radians(ORIGIN[0])))))
+        })
+    return stations
+
+
+class Command(BaseCommand):
+    help = (
+        "Plan rebalancing for synthetic station networks (no database), check the transfers "
+        "respect every surplus and deficit, and fail if a plan takes longer than the budget "
+        "(each network's fastest of --repeat plans, as timeit does, so machine noise does not count)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stations", type=int, default=500)
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--max-km", type=float, default=DEFAULT_MAX_KM)
+        parser.add_argument("--budget-ms", type=float, default=1000)
+
+    def handle(self, *args, **options):
+        if options["stations"] < 2 or options["runs"] < 1 or options["repeat"] < 1:
+            raise CommandError("--stations must be at least 2, --runs and --repeat at least 1")
+
+        timings = []
+        for run in range(options["runs"]):
+            stations = synthetic_network(options["stations"], seed=run)
+            fastest = float("inf")
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                plan = plan_from_snapshot(stations, options["max_km"])
+                fastest = min(fastest, (time.perf_counter() - started) * 1000)
+            timings.append(fastest)
+            summary = plan["summary"]
+            self.stdout.write(
+                f"run {run}: {summary['surplus']} surplus / {summary['deficit']} deficit vehicles, "
+                f"{len(plan['transfers'])} transfers moving {summary['vehicles_moved']} "
+                f"({summary['vehicle_km']} vehicle-km) in {timings[-1]:.0f} ms"
+            )
+
+            rows = {station["station_id"]: station for station in plan["stations"]}
+            sent, received = defaultdict(int), defaultdict(int)
+            for transfer in plan["transfers"]:
+                sent[transfer["from_station"]] += transfer["vehicles"]
+                received[transfer["to_station"]] += transfer["vehicles"]
+                if transfer["distance_km"] > options["max_km"]:
+                    raise CommandError(f"Transfer longer than --max-km: {transfer}")
+            for station_id, vehicles in sent.items():
+                if vehicles > rows[station_id]["ready"] - rows[station_id]["target"]:
+                    raise CommandError(f"Station {station_id} sends more than its surplus")
+            for station_id, vehicles in received.items():
+                if vehicles > rows[station_id]["target"] - rows[station_id]["ready"]:
+                    raise CommandError(f"Station {station_id} receives more than its deficit")
+
+        worst = max(timings)
+        self.stdout.write(f"Plan time (ms): mean {sum(timings) / len(timings):.0f}, max {worst:.0f}")
+        if worst > options["budget_ms"]:
+            raise CommandError(f"Planning {options['stations']} stations took over {options['budget_ms']:.0f} ms")
+        self.stdout.write(self.style.SUCCESS(f"{options['stations']} stations planned within budget"))
@@ -0,0 +1,52 @@
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vehicles.onboarding import onboard_vehicles, parse_csv
+
+
+class Command(BaseCommand):
+    help = "Onboard vehicles from a CSV or JSON file (same validation and report as the import endpoint)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--station", help="Station for every row (otherwise each row needs station_id)")
+        parser.add_argument("--dry-run", action="store_true", help="Validate and report without writing")
+        parser.add_argument("--show", type=int, default=20, help="Failed rows to print")
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        try:
+            text = path.read_text(encoding="utf-8-sig")
+            if path.suffix.lower() == ".csv":
+                rows = parse_csv(text)
+            else:
+                data = json.loads(text)
+                rows = data.get("vehicles") if isinstance(data, dict) else data
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+        if not isinstance(rows, list) or not rows:
+            raise CommandError(f"{path} has no vehicles")
+
+        started = time.perf_counter()
+        summary, results = onboard_vehicles(rows, options["station"], dry_run=options["dry_run"])
+        elapsed = time.perf_counter() - started
+
+        failed = [result for result in results if result["status"] == "error"]
+        for result in failed[:options["show"]]:
+            self.stdout.write(self.style.ERROR(
+                f"row {result['row']} ({result['vehicle_id']}): {result['message']}"
+            ))
+        if len(failed) > options["show"]:
+            self.stdout.write(f"... and {len(failed) - options['show']} more failed rows")
+
+        done = summary["valid"] if options["dry_run"] else summary["created"]
+        self.stdout.write(
+            f"{summary['received']} rows in {elapsed:.2f} s ({summary['received'] / max(elapsed, 1e-9):,.0f} rows/s): "
+            f"{done} {'valid' if options['dry_run'] else 'created'}, {summary['failed']} failed"
+        )
+        if failed:
+            raise CommandError(f"{len(failed)} rows were not imported")
+        self.stdout.write(self.style.SUCCESS("All rows imported" if not options["dry_run"] else "All rows valid"))
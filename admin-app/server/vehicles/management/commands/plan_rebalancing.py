@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from vehicles.rebalancing import (
+    DEFAULT_DEMAND_DAYS, DEFAULT_MAX_KM, DEFAULT_MIN_BATTERY, execute_plan, plan_rebalancing
+)
+
+
+class Command(BaseCommand):
+    help = "Plan (and with --execute carry out) transfers that spread ready vehicles by recent demand"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=DEFAULT_DEMAND_DAYS, help="Demand window in days")
+        parser.add_argument("--min-battery", type=float, default=DEFAULT_MIN_BATTERY,
+                            help="Battery level a vehicle needs to be moved")
+        parser.add_argument("--max-km", type=float, default=DEFAULT_MAX_KM, help="Longest transfer")
+        parser.add_argument("--execute", action="store_true", help="Carry the transfers out")
+        parser.add_argument("--show", type=int, default=20, help="Transfers to print")
+
+    def handle(self, *args, **options):
+        if options["days"] <= 0 or options["max_km"] <= 0 or not 0 <= options["min_battery"] <= 100:
+            raise CommandError("--days and --max-km must be positive and --min-battery between 0 and 100")
+
+        plan = plan_rebalancing(options["days"], options["min_battery"], options["max_km"])
+        summary = plan["summary"]
+        if summary["stations_without_location"]:
+            self.stdout.write(self.style.WARNING(
+                f"{summary['stations_without_location']} stations have no coordinates and were left out"
+            ))
+        self.stdout.write(
+            f"{summary['stations']} stations, {summary['ready_vehicles']} ready vehicles: "
+            f"{summary['surplus']} surplus, {summary['deficit']} short; plan moves {summary['vehicles_moved']} "
+            f"({summary['vehicle_km']} vehicle-km) in {len(plan['transfers'])} transfers, "
+            f"solved in {summary['solve_ms']:.0f} ms"
+        )
+
+        transfers = plan["transfers"]
+        if options["execute"]:
+            moved, transfers = execute_plan(plan, options["min_battery"])
+        for transfer in transfers[:options["show"]]:
+            done = f" ({transfer['moved']} moved)" if options["execute"] else ""
+            self.stdout.write(
+                f"  {transfer['from_station']} -> {transfer['to_station']}: "
+                f"{transfer['vehicles']} vehicles, {transfer['distance_km']} km{done}"
+            )
+        if len(transfers) > options["show"]:
+            self.stdout.write(f"  ... and {len(transfers) - options['show']} more transfers")
+
+        if summary["unmet_deficit"]:
+            self.stdout.write(self.style.WARNING(
+                f"{summary['unmet_deficit']} vehicles short: no surplus station within {options['max_km']} km"
+            ))
+        if options["execute"]:
+            self.stdout.write(self.style.SUCCESS(f"{moved} of {summary['vehicles_moved']} vehicles transferred"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from server.cache import invalidate_station
+from vehicles.occupancy import COUNT_FIELD, reconcile
+
+
+class Command(BaseCommand):
+    help = f"Recompute each station's {COUNT_FIELD} from vehicle_details and report (and fix) drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Only report drift; fail if there is any")
+
+    def handle(self, *args, **options):
+        drift = reconcile(fix=not options["check"])
+        for station_id, stored, actual in drift:
+            if stored is None:
+                action = "needs seeding with" if options["check"] else "seeded with"
+                self.stdout.write(f"station {station_id}: no counter, {action} {actual}")
+            else:
+                self.stdout.write(self.style.WARNING(
+                    f"station {station_id}: counter {stored}, actual {actual} (drift {stored - actual:+d})"
+                ))
+        if options["check"]:
+            if drift:
+                raise CommandError(f"{len(drift)} stations have drifted or missing counters")
+        elif drift:
+            invalidate_station(*[station_id for station_id, _, _ in drift])
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(drift)} stations {'need fixing' if options['check'] else 'fixed'}; all other counters match"
+        ))
@@ -0,0 +1,119 @@
+"""
+Per-station occupancy counters.
+
+Each station document carries vehicle_count, the number of vehicles whose
+station_id is that station. Every write that adds, removes or moves a
+vehicle adjusts it in the same request, and capacity is enforced by the
+counter update itself: claim_slots raises vehicle_count in one conditional
+update that never takes it past vehicle_capacity, so concurrent adds and
+transfers cannot overshoot the way a count-then-insert check could.
+
+Counters are only adjusted on stations that already have one. A station
+without vehicle_count (created before counters, or by a tool that skips
+them) is seeded from a count of its vehicles the first time a slot is
+claimed there; `manage.py reconcile_station_occupancy` seeds them all,
+recomputes every counter from vehicle_details and reports drift.
+"""
+from pymongo import ReturnDocument
+
+from server.db import canonical_station_id, get_collection
+
+station_collection = get_collection("stations")
+vehicle_collection = get_collection("vehicle_details")
+
+COUNT_FIELD = "vehicle_count"
+DEFAULT_CAPACITY = 50
+
+_capacity = {"$ifNull": ["$vehicle_capacity", DEFAULT_CAPACITY]}
+
+
+def vehicle_counts(station_ids=None):
+    """{station_id: vehicles} from vehicle_details, for all stations or the given ones"""
+    pipeline = [{"$group": {"_id": "$station_id", "n": {"$sum": 1}}}]
+    if station_ids is not None:
+        pipeline.insert(0, {"$match": {"station_id": {"$in": list(station_ids)}}})
+    return {group["_id"]: group["n"] for group in vehicle_collection.aggregate(pipeline)}
+
+
+def seed_counters(station_ids):
+    """Give stations that have no counter one counted from their vehicles"""
+    counts = vehicle_counts(station_ids)
+    for station_id in station_ids:
+        station_collection.update_one(
+            {"station_id": station_id, COUNT_FIELD: {"$exists": False}},
+            {"$set": {COUNT_FIELD: counts.get(station_id, 0)}}
+        )
+
+
+def claim_slots(station_id, wanted=1):
+    """
+    Atomically take up to `wanted` free slots at a station. Returns how many
+    were granted (0 when full), or None if the station does not exist.
+    """
+    station_id = canonical_station_id(station_id)
+    count = {"$ifNull": [f"${COUNT_FIELD}", 0]}
+    for attempt in range(2):
+        before = station_collection.find_one_and_update(
+            {"station_id": station_id, COUNT_FIELD: {"$exists": True}},
+            # Never lowers a counter that is already over capacity
+            [{"$set": {COUNT_FIELD: {"$max": [count, {"$min": [_capacity, {"$add": [count, wanted]}]}]}}}],
+            projection={"_id": 0, COUNT_FIELD: 1, "vehicle_capacity": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is not None:
+            capacity = before.get("vehicle_capacity", DEFAULT_CAPACITY)
+            return max(0, min(wanted, capacity - before[COUNT_FIELD]))
+        if attempt == 0:
+            if not station_collection.find_one({"station_id": station_id}, {"_id": 1}):
+                return None
+            seed_counters([station_id])
+    return None
+
+
+def free_slots(station_ids):
+    """{station_id: free slots} for the given stations that exist, without claiming any"""
+    station_ids = [canonical_station_id(station_id) for station_id in station_ids]
+    query = {"station_id": {"$in": station_ids}}
+    projection = {"_id": 0, "station_id": 1, "vehicle_capacity": 1, COUNT_FIELD: 1}
+    stations = list(station_collection.find(query, projection))
+    unseeded = [station["station_id"] for station in stations if COUNT_FIELD not in station]
+    if unseeded:
+        seed_counters(unseeded)
+        stations = list(station_collection.find(query, projection))
+    return {
+        station["station_id"]: max(0, station.get("vehicle_capacity", DEFAULT_CAPACITY) - station[COUNT_FIELD])
+        for station in stations
+    }
+
+
+def release_slots(station_id, count=1):
+    """Give back slots when vehicles leave a station (or a claimed slot goes unused)"""
+    if station_id is None or count <= 0:
+        return
+    station_collection.update_one(
+        {"station_id": canonical_station_id(station_id), COUNT_FIELD: {"$exists": True}},
+        {"$inc": {COUNT_FIELD: -count}}
+    )
+
+
+def reconcile(fix=True):
+    """
+    Recompute every station's counter from vehicle_details. Returns
+    [(station_id, stored, actual)] for the stations that drifted (or had
+    no counter yet, stored None); with fix they are corrected.
+    """
+    counts = vehicle_counts()
+    drift = []
+    for station in station_collection.find({}, {"_id": 0, "station_id": 1, COUNT_FIELD: 1}):
+        stored, actual = station.get(COUNT_FIELD), counts.get(station["station_id"], 0)
+        if stored != actual:
+            drift.append((station["station_id"], stored, actual))
+    if fix:
+        for station_id, stored, actual in drift:
+            # Compare-and-set, so a vehicle moved meanwhile is not overwritten
+            station_collection.update_one(
+                {"station_id": station_id, COUNT_FIELD: stored} if stored is not None
+                else {"station_id": station_id, COUNT_FIELD: {"$exists": False}},
+                {"$set": {COUNT_FIELD: actual}}
+            )
+    return drift
@@ -0,0 +1,178 @@
+"""
+Bulk vehicle onboarding.
+
+A shipment (CSV or a JSON array) is imported in a fixed number of round
+trips however many rows it has:
+
+1. every row is validated and turned into a vehicle document in memory;
+2. existing vehicle ids are found with one $in query;
+3. each target station's free slots are claimed for the whole batch with
+   one occupancy counter update (vehicles/occupancy.py); rows beyond a
+   station's free slots are rejected in order;
+4. the remaining documents are written with one unordered insert_many, so a
+   row that still collides (e.g. a concurrent import) fails alone and its
+   slot is given back.
+
+The result is a per-row report: created / valid (dry run) / error with a
+message.
+"""
+import csv
+import io
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+
+from server.cache import invalidate_station
+from server.db import canonical_station_id, get_collection
+from vehicles.occupancy import claim_slots, free_slots, release_slots
+
+vehicle_collection = get_collection("vehicle_details")
+
+# New vehicles cannot arrive mid-ride or mid-session
+IMPORT_STATUSES = ("available", "maintenance", "out_of_service")
+DUPLICATE_KEY = 11000
+
+
+def _number(value, cast, default, field):
+    if value is None or value == "":
+        return default
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number")
+
+
+def vehicle_document(data, station_id, now):
+    """Validate one vehicle row and build its document, shaped like add_vehicle's"""
+    vehicle_id = str(data.get("vehicle_id") or "").strip()
+    if not vehicle_id:
+        raise ValueError("vehicle_id is required")
+    battery = _number(data.get("battery", data.get("battery_level")), int, 100, "battery")
+    if not 0 <= battery <= 100:
+        raise ValueError("battery must be between 0 and 100")
+    rental_rate = data.get("rental_rate") or {}
+    if not isinstance(rental_rate, dict):
+        raise ValueError("rental_rate must be an object")
+    return {
+        "vehicle_id": vehicle_id,
+        "station_id": station_id,
+        "vehicle_number": data.get("vehicle_number"),
+        "vehicle_name": data.get("vehicle_name", "") or "",
+        "type": data.get("type"),
+        "model": data.get("model"),
+        "battery": battery,
+        "battery_level": battery,  # For charging compatibility
+        "status": data.get("status") or "available",
+        "odometer_reading": _number(data.get("odometer_reading"), int, 0, "odometer_reading"),
+        "rental_rate": {
+            "per_km": _number(rental_rate.get("per_km", data.get("per_km")), float, 0.0, "per_km"),
+            "per_hour": _number(rental_rate.get("per_hour", data.get("per_hour")), float, 0.0, "per_hour")
+        },
+        "last_service": data.get("last_service") or now.isoformat(),
+        "added_on": now.isoformat()
+    }
+
+
+def parse_csv(text):
+    """
+    Rows from CSV with a header line. Column names match the JSON fields;
+    rental rates are per_km / per_hour columns.
+    """
+    return [
+        {key.strip(): value.strip() for key, value in row.items() if key and value is not None}
+        for row in csv.DictReader(io.StringIO(text))
+    ]
+
+
+def onboard_vehicles(rows, station_id=None, dry_run=False):
+    """
+    Import `rows` (dicts). With `station_id` every row goes to that station
+    (a row naming another station is rejected); without it each row must
+    carry its own station_id. Returns (summary, results).
+    """
+    now = datetime.now()
+    station_id = canonical_station_id(station_id)
+    results = [{"row": i + 1, "vehicle_id": row.get("vehicle_id") if isinstance(row, dict) else None,
+                "status": "error"} for i, row in enumerate(rows)]
+    pending = []  # (result, document)
+
+    seen = set()
+    for row, result in zip(rows, results):
+        try:
+            if not isinstance(row, dict):
+                raise ValueError("row must be an object")
+            row_station = canonical_station_id(row.get("station_id")) or station_id
+            if row_station is None:
+                raise ValueError("station_id is required")
+            if station_id is not None and row_station != station_id:
+                raise ValueError(f"row belongs to station {row_station}, not {station_id}")
+            if row.get("status") and row["status"] not in IMPORT_STATUSES:
+                raise ValueError(f"status must be one of {', '.join(IMPORT_STATUSES)}")
+            document = vehicle_document(row, row_station, now)
+            if document["vehicle_id"] in seen:
+                raise ValueError("vehicle_id appears more than once in this import")
+        except ValueError as e:
+            result["message"] = str(e)
+            continue
+        seen.add(document["vehicle_id"])
+        result["vehicle_id"] = document["vehicle_id"]
+        pending.append((result, document))
+
+    if pending:
+        existing = {vehicle["vehicle_id"] for vehicle in vehicle_collection.find(
+            {"vehicle_id": {"$in": list(seen)}}, {"_id": 0, "vehicle_id": 1}
+        )}
+        by_station = defaultdict(list)
+        for result, document in pending:
+            if document["vehicle_id"] in existing:
+                result["message"] = "Vehicle ID already exists"
+            else:
+                by_station[document["station_id"]].append((result, document))
+
+        free = free_slots(by_station) if dry_run else {}
+        accepted = []
+        for station, entries in by_station.items():
+            granted = free.get(station) if dry_run else claim_slots(station, len(entries))
+            if granted is None:
+                for result, _ in entries:
+                    result["message"] = "Station not found"
+                continue
+            accepted.extend(entries[:granted])
+            for result, _ in entries[granted:]:
+                result["message"] = "Station capacity is full"
+        pending = sorted(accepted, key=lambda entry: entry[0]["row"])
+
+    if pending and not dry_run:
+        failed = {}
+        try:
+            # insert_many adds _id to the documents; they are not returned
+            vehicle_collection.insert_many([document for _, document in pending], ordered=False)
+        except BulkWriteError as e:
+            failed = {error["index"]: error for error in e.details.get("writeErrors", [])}
+        unused = Counter()
+        for index, (result, document) in enumerate(pending):
+            error = failed.get(index)
+            if error is None:
+                result["status"] = "created"
+                continue
+            unused[document["station_id"]] += 1
+            if error.get("code") == DUPLICATE_KEY:
+                result["message"] = "Vehicle ID already exists"
+            else:
+                result["message"] = error.get("errmsg", "Insert failed")
+        for station, count in unused.items():
+            release_slots(station, count)
+        invalidate_station(*{document["station_id"] for _, document in pending})
+    else:
+        for result, _ in pending:
+            result["status"] = "valid"
+
+    summary = Counter(result["status"] for result in results)
+    return {
+        "received": len(rows),
+        "created": summary["created"],
+        "valid": summary["valid"],
+        "failed": summary["error"],
+        "dry_run": dry_run
+    }, results
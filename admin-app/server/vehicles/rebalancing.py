@@ -0,0 +1,349 @@
+"""
+Fleet rebalancing planner.
+
+Moves ready vehicles (available, battery >= min_battery) from stations that
+have more than they need to stations that need more, at the lowest total
+vehicle-kilometres:
+
+1. snapshot: every station's capacity, location, vehicles and ready
+   vehicles, and its rides over the last `days` from station_daily_stats
+   (three queries however many stations there are);
+2. targets: the ready vehicles are spread over the stations in proportion
+   to demand (rides + 1), never beyond the room a station has left once
+   its other vehicles are parked (water-filling, as in power_budget.py),
+   then rounded to whole vehicles;
+3. transfers: surpluses and deficits form a transportation problem over
+   every pair of stations within max_km, solved exactly as a min-cost flow
+   (successive shortest paths, Dijkstra with potentials) on distances in
+   100 m steps. Searches stop scanning a station's arcs at the best path
+   found so far, which keeps a 500-station network under a second
+   (`manage.py benchmark_rebalancing`).
+
+Stations without coordinates are left out. execute_plan moves the chosen
+vehicles like transfer_vehicle does, taking target slots from the
+occupancy counters (vehicles/occupancy.py) so capacity still holds.
+"""
+import heapq
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from pymongo import DESCENDING, UpdateOne
+
+from server.cache import invalidate_station
+from server.db import get_collection
+from server.geo import distance_km, distances_km, lat_lng
+from vehicles.occupancy import DEFAULT_CAPACITY, claim_slots, release_slots
+
+station_collection = get_collection("stations")
+vehicle_collection = get_collection("vehicle_details")
+rollups_collection = get_collection("station_daily_stats")
+
+DEFAULT_DEMAND_DAYS = 7
+DEFAULT_MIN_BATTERY = 30
+DEFAULT_MAX_KM = 15.0
+
+_battery = {"$ifNull": ["$battery_level", "$battery"]}
+
+
+def _ready(min_battery):
+    return {"$and": [{"$eq": ["$status", "available"]}, {"$gte": [_battery, min_battery]}]}
+
+
+def station_snapshot(days=DEFAULT_DEMAND_DAYS, min_battery=DEFAULT_MIN_BATTERY):
+    """[{station_id, station_name, capacity, vehicles, ready, rides, point}] for every station"""
+    since = (datetime.now() - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    fleet = {group["_id"]: group for group in vehicle_collection.aggregate([
+        {"$group": {
+            "_id": "$station_id",
+            "vehicles": {"$sum": 1},
+            "ready": {"$sum": {"$cond": [_ready(min_battery), 1, 0]}}
+        }}
+    ])}
+    rides = {group["_id"]: group["rides"] for group in rollups_collection.aggregate([
+        {"$match": {"day": {"$gte": since}}},
+        {"$group": {"_id": "$station_id", "rides": {"$sum": "$rides"}}}
+    ])}
+    stations = []
+    for station in station_collection.find({}, {"_id": 0, "station_id": 1, "station_name": 1, "name": 1,
+                                                "vehicle_capacity": 1, "coordinates": 1}):
+        counts = fleet.get(station["station_id"], {})
+        stations.append({
+            "station_id": station["station_id"],
+            "station_name": station.get("station_name") or station.get("name"),
+            "capacity": station.get("vehicle_capacity", DEFAULT_CAPACITY),
+            "vehicles": counts.get("vehicles", 0),
+            "ready": counts.get("ready", 0),
+            "rides": rides.get(station["station_id"], 0),
+            "point": lat_lng(station.get("coordinates"))
+        })
+    return stations
+
+
+def fill_targets(stations):
+    """{station_id: ready vehicles it should have}, summing to the ready vehicles that fit"""
+    room = {s["station_id"]: max(0, s["capacity"] - (s["vehicles"] - s["ready"])) for s in stations}
+    remaining = sum(s["ready"] for s in stations)
+    shares = {}
+    uncapped = list(stations)
+    while uncapped:
+        weight = sum(s["rides"] + 1 for s in uncapped)
+        capped = [s for s in uncapped if remaining * (s["rides"] + 1) / weight >= room[s["station_id"]]]
+        if not capped:
+            for s in uncapped:
+                shares[s["station_id"]] = remaining * (s["rides"] + 1) / weight
+            break
+        for s in capped:
+            shares[s["station_id"]] = room[s["station_id"]]
+            remaining -= room[s["station_id"]]
+        capped_ids = {s["station_id"] for s in capped}
+        uncapped = [s for s in uncapped if s["station_id"] not in capped_ids]
+
+    # Whole vehicles: round down, then hand out the rest by largest remainder
+    targets = {station_id: int(share) for station_id, share in shares.items()}
+    short = round(sum(shares.values())) - sum(targets.values())
+    for station_id in sorted(shares, key=lambda s: targets[s] - shares[s])[:short]:
+        targets[station_id] += 1
+    return targets
+
+
+def solve_transfers(supply, demand, points, max_km=DEFAULT_MAX_KM):
+    """
+    Min-cost flow from `supply` {station: vehicles} to `demand` {station:
+    vehicles} over great-circle distances between `points` {station:
+    lat_lng}, using every pair no more than max_km apart (None: any).
+    Moves as many vehicles as those pairs allow. Returns [(from, to,
+    vehicles, km)].
+    """
+    sources, sinks = list(supply), list(demand)
+    n_sources, n_sinks = len(sources), len(sinks)
+    heappush, heappop = heapq.heappush, heapq.heappop
+    infinity = float("inf")
+    limit = infinity if max_km is None else max_km
+    # Costs in whole 100 m steps: path lengths stay exact, and the ties this
+    # makes shorten the searches. Pairs beyond max_km have no arc
+    sink_points = [points[sink] for sink in sinks]
+    cost = [
+        [round(km * 10) if km <= limit else infinity for km in distances_km(points[source], sink_points)]
+        for source in sources
+    ]
+    # Each source's sinks nearest first, so a search can stop scanning early
+    nearest = [sorted((c, k) for k, c in enumerate(row) if c < infinity) for row in cost]
+    nearest_cost = [[c for c, _ in arcs] for arcs in nearest]
+
+    left = [supply[source] for source in sources]
+    need = [demand[sink] for sink in sinks]
+    flow = [{} for _ in sinks]  # sink -> {source: vehicles}
+    residual = {u for u in range(n_sources) if left[u] > 0}
+
+    # Sources with vehicles left are the search roots. They all sit at
+    # distance 0 and share one potential (root_potential), so each sink only
+    # needs its nearest such source, refreshed when that source runs out.
+    def nearest_root(k):
+        return min(((cost[u][k], u) for u in residual), default=(infinity, -1))
+
+    roots = [nearest_root(k) for k in range(n_sinks)]
+    root_potential = 0
+    source_potential = [0] * n_sources
+    # Sinks still short of vehicles keep potential 0 (every search leaves
+    # theirs unchanged) and the others only go down, so 0 is the largest:
+    # no path through an arc longer than the best known path to a sink in
+    # need (`bound`) can matter
+    sink_potential = [0] * n_sinks
+
+    while residual:
+        sink_best = [m + root_potential - p for (m, _), p in zip(roots, sink_potential)]
+        sink_parent = [u for _, u in roots]
+        source_best = [infinity] * n_sources
+        source_parent = [-1] * n_sources
+        settled_sinks = [False] * n_sinks
+        settled_sources = [False] * n_sources
+        settled = []
+        bound = min((d for d, n in zip(sink_best, need) if n > 0), default=infinity)
+        # Sinks beyond the bound, or with no need and nothing to pass back, cannot help
+        heap = [(d, k) for k, d in enumerate(sink_best) if d <= bound and d < infinity and (need[k] > 0 or flow[k])]
+        heapq.heapify(heap)
+        target = None
+        while heap:
+            d, node = heappop(heap)
+            if node >= 0:
+                if d > sink_best[node] or settled_sinks[node]:
+                    continue
+                settled_sinks[node] = True
+                settled.append(node)
+                if need[node] > 0:
+                    target = node
+                    break
+                # Back along a used arc to a source that has run out
+                for u, vehicles in flow[node].items():
+                    if vehicles > 0 and u not in residual:
+                        nd = d - cost[u][node] + sink_potential[node] - source_potential[u]
+                        if nd < bound and nd < source_best[u]:
+                            source_best[u] = nd
+                            source_parent[u] = node
+                            heappush(heap, (nd, -1 - u))
+            else:
+                u = -1 - node
+                if d > source_best[u] or settled_sources[u]:
+                    continue
+                settled_sources[u] = True
+                settled.append(node)
+                base = d + source_potential[u]
+                for c, k in nearest[u][:bisect_left(nearest_cost[u], bound - base)]:
+                    nd = c + base - sink_potential[k]
+                    if nd <= bound and nd < sink_best[k]:
+                        sink_best[k] = nd
+                        sink_parent[k] = u
+                        heappush(heap, (nd, k))
+                        if need[k] > 0 and nd < bound:
+                            bound = nd
+        if target is None:
+            break
+
+        # Keep reduced costs non-negative for the next search
+        reach = sink_best[target]
+        for node in settled:
+            if node >= 0:
+                sink_potential[node] += sink_best[node] - reach
+            else:
+                source_potential[-1 - node] += source_best[-1 - node] - reach
+        root_potential -= reach
+
+        path = []
+        amount = need[target]
+        k = target
+        while True:
+            u = sink_parent[k]
+            path.append((u, k))
+            if u in residual:
+                break
+            k = source_parent[u]
+            amount = min(amount, flow[k][u])
+        amount = min(amount, left[u])
+
+        for step, (u, k) in enumerate(path):
+            flow[k][u] = flow[k].get(u, 0) + amount
+            if step + 1 < len(path):
+                back = flow[source_parent[u]]
+                back[u] -= amount
+                if not back[u]:
+                    del back[u]
+        need[target] -= amount
+        left[u] -= amount
+        if not left[u]:
+            residual.discard(u)
+            source_potential[u] = root_potential
+            roots = [nearest_root(k) if root == u else (m, root) for k, (m, root) in enumerate(roots)]
+
+    return [
+        (sources[u], sinks[k], vehicles, distance_km(points[sources[u]], points[sinks[k]]))
+        for k in range(n_sinks) for u, vehicles in flow[k].items() if vehicles > 0
+    ]
+
+
+def plan_from_snapshot(stations, max_km=DEFAULT_MAX_KM):
+    """Targets and transfers for a station snapshot (see station_snapshot)"""
+    started = time.perf_counter()
+    located = [s for s in stations if s["point"]]
+    targets = fill_targets(located)
+    supply = {s["station_id"]: s["ready"] - targets[s["station_id"]]
+              for s in located if s["ready"] > targets[s["station_id"]]}
+    demand = {s["station_id"]: targets[s["station_id"]] - s["ready"]
+              for s in located if s["ready"] < targets[s["station_id"]]}
+    points = {s["station_id"]: s["point"] for s in located}
+    transfers = solve_transfers(supply, demand, points, max_km)
+    transfers.sort(key=lambda t: (str(t[0]), t[3]))
+
+    moved = sum(t[2] for t in transfers)
+    return {
+        "summary": {
+            "stations": len(stations),
+            "stations_without_location": len(stations) - len(located),
+            "ready_vehicles": sum(s["ready"] for s in located),
+            "surplus": sum(supply.values()),
+            "deficit": sum(demand.values()),
+            "vehicles_moved": moved,
+            "unmet_deficit": sum(demand.values()) - moved,
+            "vehicle_km": round(sum(t[2] * t[3] for t in transfers), 2),
+            "max_km": max_km,
+            "solve_ms": round((time.perf_counter() - started) * 1000, 1)
+        },
+        "transfers": [
+            {"from_station": source, "to_station": sink, "vehicles": vehicles, "distance_km": round(km, 2)}
+            for source, sink, vehicles, km in transfers
+        ],
+        "stations": [
+            {"station_id": s["station_id"], "station_name": s["station_name"], "capacity": s["capacity"],
+             "vehicles": s["vehicles"], "ready": s["ready"], "rides": s["rides"],
+             "target": targets.get(s["station_id"])}
+            for s in stations
+        ]
+    }
+
+
+def plan_rebalancing(days=DEFAULT_DEMAND_DAYS, min_battery=DEFAULT_MIN_BATTERY, max_km=DEFAULT_MAX_KM):
+    """Rebalancing plan for the current fleet"""
+    return plan_from_snapshot(station_snapshot(days, min_battery), max_km)
+
+
+def execute_plan(plan, min_battery=DEFAULT_MIN_BATTERY):
+    """
+    Carry out a plan's transfers, highest battery vehicles first. A transfer
+    moves fewer vehicles if its target filled up or its vehicles were taken
+    meanwhile. Returns (vehicles moved, [transfer with "moved" added]).
+    """
+    transfers = [dict(t, moved=0) for t in plan["transfers"]]
+    if not transfers:
+        return 0, transfers
+
+    pools = defaultdict(list)
+    for vehicle in vehicle_collection.find(
+        {"station_id": {"$in": list({t["from_station"] for t in transfers})}, "status": "available",
+         "$expr": {"$gte": [_battery, min_battery]}},
+        {"_id": 0, "vehicle_id": 1, "station_id": 1}
+    ).sort([("battery_level", DESCENDING)]):
+        pools[vehicle["station_id"]].append(vehicle["vehicle_id"])
+
+    stamp = datetime.now().isoformat()
+    operations, claimed, chosen = [], defaultdict(int), {}
+    for index, transfer in enumerate(transfers):
+        source, target = transfer["from_station"], transfer["to_station"]
+        wanted = min(transfer["vehicles"], len(pools[source]))
+        granted = claim_slots(target, wanted) if wanted else 0
+        if not granted:
+            continue
+        claimed[target] += granted
+        vehicle_ids, pools[source] = pools[source][:granted], pools[source][granted:]
+        for vehicle_id in vehicle_ids:
+            chosen[vehicle_id] = index
+            operations.append(UpdateOne(
+                {"vehicle_id": vehicle_id, "station_id": source, "status": "available"},
+                {
+                    "$set": {"station_id": target, "transferred_at": stamp},
+                    "$push": {"transfer_history": {
+                        "from_station": source,
+                        "to_station": target,
+                        "transferred_at": stamp,
+                        "reason": "rebalancing"
+                    }}
+                }
+            ))
+    if operations:
+        vehicle_collection.bulk_write(operations, ordered=False)
+
+    moved = [v["vehicle_id"] for v in vehicle_collection.find(
+        {"vehicle_id": {"$in": list(chosen)}, "transferred_at": stamp}, {"_id": 0, "vehicle_id": 1}
+    )] if chosen else []
+    left = defaultdict(int)
+    for vehicle_id in moved:
+        transfer = transfers[chosen[vehicle_id]]
+        transfer["moved"] += 1
+        left[transfer["from_station"]] += 1
+        claimed[transfer["to_station"]] -= 1
+    for station_id, count in left.items():
+        release_slots(station_id, count)
+    for station_id, unused in claimed.items():
+        release_slots(station_id, unused)
+    invalidate_station(*left, *claimed)
+    return len(moved), transfers
@@ -1,3 +1,291 @@
-from django.test import TestCase
+import json
+import random
+from unittest import mock
 
-# Create your tests here.
+from django.test import RequestFactory, TestCase
+
+from server.db import get_collection, track_round_trips
+from server.geo import distance_km, geo_point, lat_lng
+from server.testing import MongoTestCase
+from vehicles import bulk_status
+from vehicles.onboarding import onboard_vehicles
+from vehicles.rebalancing import solve_transfers
+from vehicles.views import bulk_update_vehicle_status, fetch_vehicles, get_nearby_stations
+
+STATION = 1001
+
+
+def consume(response):
+    """Read a (possibly streaming) response so every query it makes is counted"""
+    if getattr(response, "streaming", False):
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+class VehicleListQueryCountTests(MongoTestCase):
+    """The vehicle list takes a fixed number of round trips however many vehicles are charging"""
+
+    VEHICLES = 40
+    CHARGING = 30
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        get_collection("stations").insert_one(
+            {"station_id": STATION, "name": "Query count", "vehicle_capacity": self.VEHICLES * 2}
+        )
+        get_collection("charging_ports").insert_many([
+            {"station_id": STATION, "port_id": f"P{i:03d}",
+             "status": "occupied" if i < self.CHARGING else "available",
+             "current_vehicle_id": f"V{i:03d}" if i < self.CHARGING else None, "power_rating": "22kW"}
+            for i in range(self.CHARGING + 5)
+        ])
+        get_collection("vehicle_details").insert_many([
+            {"station_id": STATION, "vehicle_id": f"V{i:03d}",
+             "status": "charging" if i < self.CHARGING else "available",
+             "charging_port_id": f"P{i:03d}" if i < self.CHARGING else None, "battery_level": 40,
+             "added_on": "2024-01-01T00:00:00", "last_service": "2024-06-01T00:00:00"}
+            for i in range(self.VEHICLES)
+        ])
+
+    def assert_round_trips(self, request, budget):
+        with track_round_trips() as counter:
+            response = consume(fetch_vehicles(request, str(STATION)))
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(counter["round_trips"], budget, counter["commands"])
+
+    def test_list(self):
+        self.assert_round_trips(self.factory.get("/"), 3)
+
+    def test_ndjson_stream(self):
+        self.assert_round_trips(self.factory.get("/", {"stream": "ndjson"}), 3)
+
+
+class NearbyStationsTests(MongoTestCase):
+    """Nearby stations come from one $geoNear aggregation"""
+
+    NEIGHBOURS = 10
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+
+        # Neighbours ~1 km apart going north; every sixth one is full
+        def located(i):
+            coordinates = {"latitude": 12.9716 + i * 0.009, "longitude": 77.5946}
+            return {"coordinates": coordinates, "geo_location": geo_point(coordinates)}
+
+        get_collection("stations").insert_many(
+            [{"station_id": STATION, "name": "Origin", "vehicle_capacity": 5, **located(0)}]
+            + [{"station_id": STATION + i, "name": f"Neighbour {i}", "vehicle_capacity": 5,
+                "vehicle_count": i % 6, **located(i)}
+               for i in range(1, self.NEIGHBOURS + 1)]
+            + [{"station_id": STATION + 100, "name": "No location", "vehicle_capacity": 5}]
+        )
+
+    def nearby(self, **params):
+        with track_round_trips() as counter:
+            response = get_nearby_stations(self.factory.get("/", params), str(STATION))
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.content)
+        self.assertEqual(body["status"], "success", body)
+        return body["stations"], counter
+
+    def test_round_trips(self):
+        _, counter = self.nearby(max_km=20)
+        self.assertLessEqual(counter["round_trips"], 2, counter["commands"])
+
+    def test_nearest_first_with_capacity(self):
+        stations, _ = self.nearby(max_km=20)
+        ids = [station["station_id"] for station in stations]
+        full = {STATION + i for i in range(1, self.NEIGHBOURS + 1) if i % 6 == 5}
+        self.assertEqual(ids, [STATION + i for i in range(1, self.NEIGHBOURS + 1) if STATION + i not in full])
+        distances = [station["distance_km"] for station in stations]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_limit_and_max_km(self):
+        stations, _ = self.nearby(limit=2)
+        self.assertEqual([station["station_id"] for station in stations], [STATION + 1, STATION + 2])
+        stations, _ = self.nearby(max_km=3.5)
+        self.assertEqual([station["station_id"] for station in stations], [STATION + 1, STATION + 2, STATION + 3])
+
+    def test_invalid_params(self):
+        response = get_nearby_stations(self.factory.get("/", {"max_km": "-1"}), str(STATION))
+        self.assertEqual(response.status_code, 400)
+
+
+class VehicleImportTests(MongoTestCase):
+    """A shipment is validated row by row and inserted in a fixed number of round trips"""
+
+    ROWS = 200
+
+    def setUp(self):
+        super().setUp()
+        self.vehicles = get_collection("vehicle_details")
+        # One vehicle already there; room for all valid rows but the last
+        get_collection("stations").insert_one(
+            {"station_id": STATION, "name": "Import", "vehicle_capacity": self.ROWS - 3, "vehicle_count": 1}
+        )
+        self.vehicles.insert_one({"station_id": STATION, "vehicle_id": "IMP-00000", "status": "available"})
+        self.rows = [
+            {"vehicle_id": f"IMP-{i:05d}", "vehicle_number": f"KA01IM{i:05d}", "type": "scooter",
+             "model": "S1", "battery": 80, "per_km": 5, "per_hour": 50}
+            for i in range(self.ROWS)
+        ]
+
+    def errors(self, results):
+        return {result["row"]: result["message"] for result in results if result["status"] == "error"}
+
+    def test_shipment(self):
+        self.rows[1]["battery"] = 150
+        self.rows[2]["vehicle_id"] = self.rows[3]["vehicle_id"]
+        with track_round_trips() as counter:
+            summary, results = onboard_vehicles(self.rows, STATION)
+
+        # Row 1 exists, row 2 is invalid, row 4 repeats row 3, the last row is over capacity
+        self.assertEqual(sorted(self.errors(results)), [1, 2, 4, self.ROWS])
+        self.assertEqual((summary["created"], summary["failed"]), (self.ROWS - 4, 4))
+        self.assertEqual(self.vehicles.count_documents({"station_id": STATION}), self.ROWS - 3)
+        self.assertEqual(get_collection("stations").find_one({"station_id": STATION})["vehicle_count"], self.ROWS - 3)
+        self.assertLessEqual(counter["round_trips"], 3, counter["commands"])
+
+    def test_row_errors(self):
+        self.rows[1]["rental_rate"] = "5/km"
+        self.rows[2]["rental_rate"] = {"per_km": 5, "per_hour": "fifty"}
+        self.rows[3]["status"] = "charging"
+        summary, results = onboard_vehicles(self.rows[1:11], STATION, dry_run=True)
+        self.assertEqual(self.errors(results), {
+            1: "rental_rate must be an object", 2: "per_hour must be a number",
+            3: "status must be one of available, maintenance, out_of_service"
+        })
+        self.assertEqual(summary["valid"], 7)
+
+    def test_dry_run(self):
+        summary, results = onboard_vehicles(self.rows[1:11], STATION, dry_run=True)
+        self.assertEqual(summary["failed"], 0)
+        self.assertEqual({result["status"] for result in results}, {"valid"})
+        self.assertEqual(self.vehicles.count_documents({"station_id": STATION}), 1)
+
+
+class BulkStatusTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        self.vehicles = get_collection("vehicle_details")
+        self.ports = get_collection("charging_ports")
+        self.ports.insert_one({"station_id": STATION, "port_id": "P000", "status": "occupied",
+                               "current_vehicle_id": "V000", "vehicle_id": "V000"})
+        self.vehicles.insert_many([
+            {"station_id": STATION, "vehicle_id": "V000", "status": "charging", "charging_port_id": "P000"},
+            {"station_id": STATION, "vehicle_id": "V001", "status": "available"},
+        ])
+
+    def bulk(self, body):
+        request = self.factory.patch("/", json.dumps(body), content_type="application/json")
+        response = bulk_update_vehicle_status(request)
+        return response.status_code, json.loads(response.content)
+
+    def test_stops_sessions(self):
+        status, body = self.bulk({"status": "maintenance", "filter": {"station_id": str(STATION)}})
+        self.assertEqual(status, 200)
+        self.assertEqual((body["summary"]["updated"], body["summary"]["sessions_stopped"]), (2, 1))
+        self.assertEqual(self.ports.find_one({"port_id": "P000"})["status"], "available")
+
+    def test_concurrent_write_after_update(self):
+        bulk_write = bulk_status.vehicle_collection.bulk_write
+
+        def then_touched(operations, **kwargs):
+            result = bulk_write(operations, **kwargs)
+            # e.g. a status PATCH or queue dispatch landing before the read-back
+            self.vehicles.update_many({}, {"$set": {"updated_at": "2030-01-01T00:00:00"}})
+            return result
+
+        with mock.patch.object(bulk_status.vehicle_collection, "bulk_write", side_effect=then_touched):
+            summary, results = bulk_status.apply_status({"station_id": STATION}, "maintenance")
+        self.assertEqual({result["status"] for result in results}, {"updated"})
+        self.assertEqual(summary["sessions_stopped"], 1)
+        self.assertEqual(self.ports.find_one({"port_id": "P000"})["status"], "available")
+
+    def test_conflict(self):
+        bulk_write = bulk_status.vehicle_collection.bulk_write
+
+        def rented_first(operations, **kwargs):
+            self.vehicles.update_one({"vehicle_id": "V001"}, {"$set": {"status": "in_use"}})
+            return bulk_write(operations, **kwargs)
+
+        with mock.patch.object(bulk_status.vehicle_collection, "bulk_write", side_effect=rented_first):
+            summary, results = bulk_status.apply_status({"station_id": STATION}, "maintenance")
+        self.assertEqual({result["vehicle_id"]: result["status"] for result in results},
+                         {"V000": "updated", "V001": "conflict"})
+        self.assertEqual(self.vehicles.find_one({"vehicle_id": "V001"})["status"], "in_use")
+
+    def test_invalid_selection(self):
+        for body in ({"status": "maintenance", "filter": ["station_id"]},
+                     {"status": "maintenance", "filter": {"battery": 10}},
+                     {"status": "maintenance"}):
+            self.assertEqual(self.bulk(body)[0], 400, body)
+
+
+class RebalancingSolverTests(TestCase):
+    """solve_transfers finds a cheapest largest flow, without arcs longer than max_km"""
+
+    def point(self, rng):
+        return lat_lng({"latitude": 12.9 + rng.uniform(0, 0.2), "longitude": 77.5 + rng.uniform(0, 0.2)})
+
+    def steps(self, km):
+        # The solver's cost unit
+        return round(km * 10)
+
+    def brute_force(self, supply, demand, points, max_km):
+        """(vehicles moved, cost) of the best plan, trying every integer flow"""
+        pairs = [(source, sink) for source in supply for sink in demand
+                 if distance_km(points[source], points[sink]) <= max_km]
+        best = (0, 0)
+
+        def search(index, left, need, moved, cost):
+            nonlocal best
+            if index == len(pairs):
+                best = max(best, (moved, -cost))
+                return
+            source, sink = pairs[index]
+            step = self.steps(distance_km(points[source], points[sink]))
+            for vehicles in range(min(left[source], need[sink]) + 1):
+                left[source] -= vehicles
+                need[sink] -= vehicles
+                search(index + 1, left, need, moved + vehicles, cost + vehicles * step)
+                left[source] += vehicles
+                need[sink] += vehicles
+
+        search(0, dict(supply), dict(demand), 0, 0)
+        return best[0], -best[1]
+
+    def test_optimal_on_small_networks(self):
+        rng = random.Random(3)
+        for _ in range(60):
+            stations = list(range(rng.randint(2, 6)))
+            points = {station: self.point(rng) for station in stations}
+            cut = rng.randint(1, len(stations) - 1)
+            supply = {station: rng.randint(1, 3) for station in stations[:cut]}
+            demand = {station: rng.randint(1, 3) for station in stations[cut:]}
+            max_km = rng.choice([5, 10, 30])
+
+            transfers = solve_transfers(supply, demand, points, max_km)
+            moved = sum(vehicles for _, _, vehicles, _ in transfers)
+            cost = sum(vehicles * self.steps(km) for _, _, vehicles, km in transfers)
+            self.assertEqual((moved, cost), self.brute_force(supply, demand, points, max_km),
+                             (supply, demand, max_km))
+            for source, sink, vehicles, km in transfers:
+                self.assertLessEqual(km, max_km)
+            for source in supply:
+                self.assertLessEqual(sum(t[2] for t in transfers if t[0] == source), supply[source])
+            for sink in demand:
+                self.assertLessEqual(sum(t[2] for t in transfers if t[1] == sink), demand[sink])
+
+    def test_max_km(self):
+        # Two 1 km apart, one 50 km away
+        points = {name: lat_lng({"latitude": latitude, "longitude": 77.5})
+                  for name, latitude in (("a", 12.9), ("b", 12.909), ("far", 13.35))}
+        transfers = solve_transfers({"a": 2}, {"b": 1, "far": 2}, points, max_km=15)
+        self.assertEqual([(source, sink, vehicles) for source, sink, vehicles, _ in transfers], [("a", "b", 1)])
+        self.assertEqual(sum(t[2] for t in solve_transfers({"a": 2}, {"b": 1, "far": 2}, points, None)), 2)
@@ -3,13 +3,20 @@ from . import views
 
 urlpatterns = [
     path('test/', views.test_connection, name='test_connection'),
+    path('db-stats/', views.db_pool_stats, name='db_pool_stats'),
+    path('cache-stats/', views.response_cache_stats, name='response_cache_stats'),
     path('station-login/', views.station_login, name='station_login'),
+    path("vehicles/bulk-status/", views.bulk_update_vehicle_status, name="bulk_update_vehicle_status"),
     path("vehicles/<str:station_id>/", views.fetch_vehicles, name="fetch_vehicles"),
     path("vehicles/add/", views.add_vehicle, name="add_vehicle"),
+    path("vehicles/import/<str:station_id>/", views.import_vehicles, name="import_vehicles"),
     path("vehicles/update/<str:vehicle_id>/", views.update_vehicle, name="update_vehicle"),
     path("vehicles/update-status/<str:vehicle_id>/", views.update_vehicle_status, name="update_vehicle_status"),
     path("vehicles/delete/<str:vehicle_id>/", views.delete_vehicle, name="delete_vehicle"),
     path("vehicles/details/<str:vehicle_id>/", views.get_vehicle_details, name="get_vehicle_details"),
+    path("vehicles/battery-history/<str:vehicle_id>/", views.get_vehicle_battery_history, name="get_vehicle_battery_history"),
     path("nearby-stations/<str:station_id>/", views.get_nearby_stations, name="get_nearby_stations"),
     path("vehicles/transfer/", views.transfer_vehicle, name="transfer_vehicle"),
+    path("rebalancing/plan/", views.get_rebalancing_plan, name="get_rebalancing_plan"),
+    path("rebalancing/execute/", views.execute_rebalancing, name="execute_rebalancing"),
 ]
@@ -2,27 +2,37 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import json
-from pymongo import MongoClient
+import time
 from datetime import datetime
-import os
-from dotenv import load_dotenv
+from functools import lru_cache
+from server.cache import invalidate_station, stats as cache_stats
+from server.db import canonical_station_id, get_collection, pool_stats
+from server.geo import STATION_GEO_FIELD, geo_point
+from server.streaming import stream_format, stream_listing
 from bson import ObjectId
+from pymongo import ReturnDocument
 
 # Import charging functions
-from charging_ports.views import start_charging_process, stop_charging_process
+from charging_ports import clock
+from charging_ports.allocation import charging_fields, claim_port, release_port
+from charging_ports.charging_queue import dequeue, dispatch, enqueue, queue_position
+from charging_ports.model import charging_eta, port_power_kw
+from charging_ports.telemetry import battery_telemetry, parse_history_range
+from vehicles.bulk_status import BULK_STATUSES, apply_status, selection_query
+from vehicles.occupancy import claim_slots, release_slots
+from vehicles.onboarding import onboard_vehicles, parse_csv
+from vehicles.rebalancing import (
+    DEFAULT_DEMAND_DAYS, DEFAULT_MAX_KM, DEFAULT_MIN_BATTERY, execute_plan, plan_rebalancing
+)
 
-# Load environment variables
-load_dotenv()
+# --- MongoDB Collections ---
+vehicle_collection = get_collection("vehicle_details")
+station_collection = get_collection("stations")
+charging_ports_collection = get_collection("charging_ports")
+station_managers_collection = get_collection("station_managers")
 
-# --- MongoDB Connection ---
-MONGO_URI = os.getenv('MONGODB_URI')
-client = MongoClient(MONGO_URI)
-db = client["boltride"]
-
-vehicle_collection = db["vehicle_details"]
-station_collection = db["stations"]
-charging_ports_collection = db["charging_ports"]
-station_managers_collection = db["station_managers"]
+NEARBY_DEFAULT_LIMIT = 10
+NEARBY_MAX_LIMIT = 100
 
 # Add this test view first
 @csrf_exempt
@@ -34,6 +44,21 @@ def test_connection(request):
         "timestamp": datetime.now().isoformat()
     })
 
+@csrf_exempt
+@require_http_methods(["GET"])
+def db_pool_stats(request):
+    """MongoDB connection pool statistics for this worker process"""
+    try:
+        return JsonResponse({"status": "success", "pool": pool_stats()})
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def response_cache_stats(request):
+    """Response cache hit/miss counters for this worker process"""
+    return JsonResponse({"status": "success", "cache": cache_stats.snapshot()})
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def station_login(request):
@@ -42,7 +67,7 @@ def station_login(request):
         data = json.loads(request.body)
         email = data.get("email", "").strip().lower()
         password = data.get("password", "")
-        station_id = data.get("station_id")  # Optional, for backward compatibility
+        station_id = canonical_station_id(data.get("station_id"))  # Optional, for backward compatibility
 
         if not email or not password:
             return JsonResponse({"status": "error", "message": "Email and password are required"})
@@ -80,115 +105,148 @@ def station_login(request):
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)})
 
+@lru_cache(maxsize=4096)
+def _iso_date(value):
+    """YYYY-MM-DD of an ISO timestamp string; listings repeat the same few, so parses are cached"""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).strftime("%Y-%m-%d")
+    except ValueError:
+        return value
+
+def _formatted_date(value):
+    if not value:
+        return "N/A"
+    if isinstance(value, str):
+        return _iso_date(value)
+    return str(value)
+
+def station_ports(station_query, port_ids=None):
+    """{port_id: port} for a station's ports (only port_ids if given), in one query"""
+    query = dict(station_query)
+    if port_ids is not None:
+        query["port_id"] = {"$in": list(port_ids)}
+    return {
+        port["port_id"]: port
+        for port in charging_ports_collection.find(
+            query,
+            {"_id": 0, "port_id": 1, "connector_type": 1, "power_rating": 1, "max_power_kw": 1}
+        )
+    }
+
+def format_vehicle(vehicle, ports, now):
+    """
+    Add display fields and charging port info to a vehicle document. ports
+    maps port_id to the station's ports (station_ports); now is the
+    charging clock's time for the whole listing.
+    """
+    # Ensure all required fields are present
+    vehicle["vehicle_id"] = vehicle.get("vehicle_id", "N/A")
+    vehicle["vehicle_number"] = vehicle.get("vehicle_number", "N/A")
+    vehicle["vehicle_name"] = vehicle.get("vehicle_name", "N/A")
+    vehicle["type"] = vehicle.get("type", "N/A")
+    vehicle["model"] = vehicle.get("model", "N/A")
+    vehicle["battery"] = vehicle.get("battery_level", vehicle.get("battery", 0))
+    vehicle["battery_level"] = vehicle.get("battery_level", vehicle.get("battery", 0))
+    vehicle["status"] = vehicle.get("status", "available")
+    vehicle["odometer_reading"] = vehicle.get("odometer_reading", 0)
+    vehicle["rental_rate"] = vehicle.get("rental_rate", {"per_km": 0, "per_hour": 0})
+
+    # Format dates
+    vehicle["last_service_formatted"] = _formatted_date(vehicle.get("last_service"))
+    vehicle["added_on_formatted"] = _formatted_date(vehicle.get("added_on"))
+
+    # Check if vehicle is charging and get port info
+    vehicle["charging_port_info"] = None
+    if vehicle["status"] == "charging":
+        charging_port_id = vehicle.get("charging_port_id")
+        if charging_port_id:
+            port_info = ports.get(charging_port_id)
+            if port_info:
+                # Calculate charging duration
+                charging_started = vehicle.get("charging_started_at")
+                duration_text = "N/A"
+                if charging_started:
+                    if isinstance(charging_started, str):
+                        try:
+                            charging_started = datetime.fromisoformat(charging_started.replace('Z', '+00:00'))
+                        except:
+                            pass
+                    if isinstance(charging_started, datetime):
+                        duration = now - charging_started
+                        duration_minutes = int(duration.total_seconds() / 60)
+                        hours = duration_minutes // 60
+                        minutes = duration_minutes % 60
+                        if hours > 0:
+                            duration_text = f"{hours}h {minutes}m"
+                        else:
+                            duration_text = f"{minutes}m"
+
+                port_power = vehicle.get("port_power_kw") or port_power_kw(port_info)
+                eta = charging_eta(vehicle, port_power, now)
+                vehicle["charging_port_info"] = {
+                    "port_id": port_info.get("port_id"),
+                    "connector_type": port_info.get("connector_type", "Type2"),
+                    "power_rating": port_info.get("power_rating", "22kW"),
+                    "max_power_kw": port_power,
+                    "charging_duration": duration_text,
+                    "charging_started_at": vehicle.get("charging_started_at", "N/A"),
+                    **eta,
+                    "estimated_completion": eta["estimated_completion"] if vehicle["battery_level"] < 100 else "Complete"
+                }
+    return vehicle
+
+def station_capacity_info(station_query, current_count):
+    station = station_collection.find_one(station_query, {"_id": 0})
+    total_capacity = station.get("vehicle_capacity", 50) if station else 50
+    return {
+        "current_count": current_count,
+        "total_capacity": total_capacity,
+        "is_full": current_count >= total_capacity,
+        "available_slots": max(0, total_capacity - current_count)
+    }
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def fetch_vehicles(request, station_id):
     try:
-        # Convert station_id to integer for querying
+        station_query = {"station_id": canonical_station_id(station_id)}
+
         try:
-            station_id_int = int(station_id)
-        except ValueError:
-            station_id_int = station_id
+            fmt = stream_format(request)
+        except ValueError as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
 
-        # Query with both integer and string station_id
-        station_query = {"$or": [{"station_id": station_id_int}, {"station_id": station_id}]}
+        now = clock.now()
+        if fmt:
+            # Streamed rows are formatted as they go, so load all of the station's ports up front
+            ports = station_ports(station_query)
+            cursor = vehicle_collection.find(station_query, {"_id": 0})
+            return stream_listing(
+                cursor,
+                lambda vehicle: format_vehicle(vehicle, ports, now),
+                "vehicles",
+                fmt,
+                trailer=lambda count: {"capacity_info": station_capacity_info(station_query, count)}
+            )
         
         # Get vehicles for the station
         vehicles = list(vehicle_collection.find(station_query, {"_id": 0}))
         
         print(f"Found {len(vehicles)} vehicles for station {station_id}")  # Debug log
         
-        # Format vehicles and add charging port info
+        # Format vehicles and add charging port info from one batched port query
+        charging_port_ids = {
+            vehicle["charging_port_id"] for vehicle in vehicles
+            if vehicle.get("status") == "charging" and vehicle.get("charging_port_id")
+        }
+        ports = station_ports(station_query, charging_port_ids) if charging_port_ids else {}
         for vehicle in vehicles:
-            # Ensure all required fields are present
-            vehicle["vehicle_id"] = vehicle.get("vehicle_id", "N/A")
-            vehicle["vehicle_number"] = vehicle.get("vehicle_number", "N/A")
-            vehicle["vehicle_name"] = vehicle.get("vehicle_name", "N/A")
-            vehicle["type"] = vehicle.get("type", "N/A")
-            vehicle["model"] = vehicle.get("model", "N/A")
-            vehicle["battery"] = vehicle.get("battery_level", vehicle.get("battery", 0))
-            vehicle["battery_level"] = vehicle.get("battery_level", vehicle.get("battery", 0))
-            vehicle["status"] = vehicle.get("status", "available")
-            vehicle["odometer_reading"] = vehicle.get("odometer_reading", 0)
-            vehicle["rental_rate"] = vehicle.get("rental_rate", {"per_km": 0, "per_hour": 0})
-            
-            # Format dates
-            if vehicle.get("last_service"):
-                if isinstance(vehicle["last_service"], str):
-                    try:
-                        dt = datetime.fromisoformat(vehicle["last_service"].replace('Z', '+00:00'))
-                        vehicle["last_service_formatted"] = dt.strftime("%Y-%m-%d")
-                    except:
-                        vehicle["last_service_formatted"] = vehicle["last_service"]
-                else:
-                    vehicle["last_service_formatted"] = str(vehicle["last_service"])
-            else:
-                vehicle["last_service_formatted"] = "N/A"
-            
-            if vehicle.get("added_on"):
-                if isinstance(vehicle["added_on"], str):
-                    try:
-                        dt = datetime.fromisoformat(vehicle["added_on"].replace('Z', '+00:00'))
-                        vehicle["added_on_formatted"] = dt.strftime("%Y-%m-%d")
-                    except:
-                        vehicle["added_on_formatted"] = vehicle["added_on"]
-                else:
-                    vehicle["added_on_formatted"] = str(vehicle["added_on"])
-            else:
-                vehicle["added_on_formatted"] = "N/A"
-            
-            # Check if vehicle is charging and get port info
-            vehicle["charging_port_info"] = None
-            if vehicle["status"] == "charging":
-                charging_port_id = vehicle.get("charging_port_id")
-                if charging_port_id:
-                    port_info = charging_ports_collection.find_one(
-                        {"port_id": charging_port_id, "$or": [{"station_id": station_id_int}, {"station_id": station_id}]},
-                        {"_id": 0}
-                    )
-                    if port_info:
-                        # Calculate charging duration
-                        charging_started = vehicle.get("charging_started_at")
-                        duration_text = "N/A"
-                        if charging_started:
-                            if isinstance(charging_started, str):
-                                try:
-                                    charging_started = datetime.fromisoformat(charging_started.replace('Z', '+00:00'))
-                                except:
-                                    pass
-                            if isinstance(charging_started, datetime):
-                                duration = datetime.now() - charging_started
-                                duration_minutes = int(duration.total_seconds() / 60)
-                                hours = duration_minutes // 60
-                                minutes = duration_minutes % 60
-                                if hours > 0:
-                                    duration_text = f"{hours}h {minutes}m"
-                                else:
-                                    duration_text = f"{minutes}m"
-                        
-                        vehicle["charging_port_info"] = {
-                            "port_id": port_info.get("port_id"),
-                            "connector_type": port_info.get("connector_type", "Type2"),
-                            "power_rating": port_info.get("power_rating", "22kW"),
-                            "charging_duration": duration_text,
-                            "charging_started_at": vehicle.get("charging_started_at", "N/A"),
-                            "estimated_completion": "Calculating..." if vehicle["battery_level"] < 100 else "Complete"
-                        }
-        
-        # Get station capacity info
-        station = station_collection.find_one({"$or": [{"station_id": station_id_int}, {"station_id": station_id}]}, {"_id": 0})
-        total_capacity = station.get("vehicle_capacity", 50) if station else 50
-        current_count = len(vehicles)
+            format_vehicle(vehicle, ports, now)
         
         return JsonResponse({
             "status": "success", 
             "vehicles": vehicles,
-            "capacity_info": {
-                "current_count": current_count,
-                "total_capacity": total_capacity,
-                "is_full": current_count >= total_capacity,
-                "available_slots": max(0, total_capacity - current_count)
-            }
+            "capacity_info": station_capacity_info(station_query, len(vehicles))
         })
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)})
@@ -200,25 +258,22 @@ def add_vehicle(request):
         data = json.loads(request.body)
         
         # Check station capacity first
-        station_id = data.get("station_id")
+        station_id = canonical_station_id(data.get("station_id"))
         if not station_id:
             return JsonResponse({"status": "error", "message": "Station ID is required"})
         
-        station = station_collection.find_one({"station_id": station_id})
-        if not station:
-            return JsonResponse({"status": "error", "message": "Station not found"})
-        
-        current_count = vehicle_collection.count_documents({"station_id": station_id})
-        total_capacity = station.get("vehicle_capacity", 50)
-        
-        if current_count >= total_capacity:
-            return JsonResponse({"status": "error", "message": "Station capacity is full"})
-        
         # Check if vehicle_id already exists
         existing_vehicle = vehicle_collection.find_one({"vehicle_id": data.get("vehicle_id")})
         if existing_vehicle:
             return JsonResponse({"status": "error", "message": "Vehicle ID already exists"})
         
+        # Take a slot in the station's occupancy counter (vehicles/occupancy.py)
+        granted = claim_slots(station_id)
+        if granted is None:
+            return JsonResponse({"status": "error", "message": "Station not found"})
+        if not granted:
+            return JsonResponse({"status": "error", "message": "Station capacity is full"})
+        
         # Prepare vehicle data
         vehicle_data = {
             "vehicle_id": data.get("vehicle_id"),
@@ -239,12 +294,49 @@ def add_vehicle(request):
             "added_on": datetime.now().isoformat()
         }
         
-        vehicle_collection.insert_one(vehicle_data)
+        try:
+            vehicle_collection.insert_one(vehicle_data)
+        except Exception:
+            release_slots(station_id)
+            raise
+        invalidate_station(station_id)
         return JsonResponse({"status": "success", "message": "Vehicle added successfully"})
         
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)})
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def import_vehicles(request, station_id):
+    """
+    Onboard many vehicles at once (vehicles/onboarding.py). The body is CSV
+    (text/csv or an uploaded "file"), a JSON array or {"vehicles": [...]};
+    ?dry_run=1 validates without writing. Returns a per-row report.
+    """
+    try:
+        if "file" in request.FILES:
+            rows = parse_csv(request.FILES["file"].read().decode("utf-8-sig"))
+        elif request.content_type == "text/csv":
+            rows = parse_csv(request.body.decode("utf-8-sig"))
+        else:
+            data = json.loads(request.body)
+            rows = data.get("vehicles") if isinstance(data, dict) else data
+        if not isinstance(rows, list) or not rows:
+            raise ValueError("Expected a non-empty list of vehicles")
+    except (ValueError, UnicodeDecodeError) as e:
+        return JsonResponse({"status": "error", "message": f"Invalid import: {e}"}, status=400)
+
+    try:
+        summary, results = onboard_vehicles(rows, station_id, dry_run=request.GET.get("dry_run") in ("1", "true"))
+        if not summary["failed"]:
+            status = "success"
+        else:
+            status = "partial" if summary["created"] or summary["valid"] else "error"
+        return JsonResponse({"status": status, "summary": summary, "results": results})
+
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)})
+
 @csrf_exempt
 @require_http_methods(["PUT", "PATCH"])  # Allow both PUT and PATCH
 def update_vehicle(request, vehicle_id):
@@ -253,18 +345,43 @@ def update_vehicle(request, vehicle_id):
         
         # Remove None values and prepare update data
         update_data = {k: v for k, v in data.items() if v is not None and k != "vehicle_id"}
+        if "station_id" in update_data:
+            update_data["station_id"] = canonical_station_id(update_data["station_id"])
         
         if not update_data:
             return JsonResponse({"status": "error", "message": "No data to update"})
         
-        result = vehicle_collection.update_one(
-            {"vehicle_id": vehicle_id}, 
-            {"$set": update_data}
+        vehicle_query = {"vehicle_id": vehicle_id}
+        moved_from = None
+        if "station_id" in update_data:
+            current = vehicle_collection.find_one(vehicle_query, {"_id": 0, "station_id": 1})
+            if current is None:
+                return JsonResponse({"status": "error", "message": "Vehicle not found"})
+            if current.get("station_id") != update_data["station_id"]:
+                # Moving the vehicle needs a slot at the new station
+                granted = claim_slots(update_data["station_id"])
+                if granted is None:
+                    return JsonResponse({"status": "error", "message": "Station not found"})
+                if not granted:
+                    return JsonResponse({"status": "error", "message": "Station capacity is full"})
+                moved_from = current.get("station_id")
+                vehicle_query["station_id"] = moved_from
+        
+        previous = vehicle_collection.find_one_and_update(
+            vehicle_query, 
+            {"$set": update_data},
+            projection={"_id": 0, "station_id": 1}
         )
         
-        if result.matched_count == 0:
+        if "station_id" in vehicle_query:
+            # Give back the slot the vehicle left, or the claimed one if it was moved meanwhile
+            release_slots(moved_from if previous is not None else update_data["station_id"])
+        
+        if previous is None:
             return JsonResponse({"status": "error", "message": "Vehicle not found"})
         
+        invalidate_station(previous.get("station_id"), update_data.get("station_id"))
+        
         return JsonResponse({"status": "success", "message": "Vehicle updated successfully"})
         
     except Exception as e:
@@ -291,7 +408,9 @@ def delete_vehicle(request, vehicle_id):
                     }
                 )
         
-        vehicle_collection.delete_one({"vehicle_id": vehicle_id})
+        if vehicle_collection.delete_one({"vehicle_id": vehicle_id}).deleted_count:
+            release_slots(vehicle.get("station_id"))
+        invalidate_station(vehicle.get("station_id"))
         return JsonResponse({"status": "success", "message": "Vehicle deleted successfully"})
         
     except Exception as e:
@@ -310,27 +429,88 @@ def get_vehicle_details(request, vehicle_id):
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)})
 
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_vehicle_battery_history(request, vehicle_id):
+    """
+    Battery level history of a vehicle. ?from=&to= (ISO) or ?hours= select
+    the range; the resolution is picked to suit it.
+    """
+    try:
+        now = clock.now()
+        try:
+            start, end = parse_history_range(request.GET, now)
+        except ValueError as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+        resolution, points = battery_telemetry.vehicle_history(vehicle_id, start, end, now)
+        return JsonResponse({
+            "status": "success",
+            "vehicle_id": vehicle_id,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "resolution": resolution,
+            "points": points
+        })
+
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_nearby_stations(request, station_id):
+    """
+    Closest stations with free capacity, nearest first, from one
+    aggregation: $geoNear on the stations' 2dsphere index filtered on each
+    station's occupancy counter. ?limit= (default 10) caps the result and
+    ?max_km= the distance. $geoNear only sees stations with a location (see
+    server/geo.py), so others are left out; if the origin station itself has
+    none, stations with capacity are listed unordered and without distance.
+    """
     try:
-        # Get all stations except current one
-        stations = list(station_collection.find(
-            {"station_id": {"$ne": station_id}}, 
-            {"_id": 0, "station_id": 1, "name": 1, "location": 1, "capacity": 1}
-        ))
-        
-        # Add current vehicle count for each station
+        station_id = canonical_station_id(station_id)
+        try:
+            limit = min(int(request.GET.get("limit", NEARBY_DEFAULT_LIMIT)), NEARBY_MAX_LIMIT)
+            max_km = float(request.GET["max_km"]) if request.GET.get("max_km") else None
+            if limit <= 0 or (max_km is not None and max_km <= 0):
+                raise ValueError
+        except ValueError:
+            return JsonResponse({"status": "error", "message": "limit and max_km must be positive numbers"}, status=400)
+
+        origin = station_collection.find_one({"station_id": station_id}, {"_id": 0, STATION_GEO_FIELD: 1, "coordinates": 1})
+        near = origin and (origin.get(STATION_GEO_FIELD) or geo_point(origin.get("coordinates")))
+
+        others = {"station_id": {"$ne": station_id}}
+        if near:
+            geo_near = {"near": near, "key": STATION_GEO_FIELD, "distanceField": "distance_m",
+                        "spherical": True, "query": others}
+            if max_km is not None:
+                geo_near["maxDistance"] = max_km * 1000
+            first_stage = {"$geoNear": geo_near}
+        else:
+            first_stage = {"$match": others}
+
+        stations = list(station_collection.aggregate([
+            first_stage,
+            # Occupancy counter kept by every vehicle move (vehicles/occupancy.py)
+            {"$addFields": {
+                "vehicle_capacity": {"$ifNull": ["$vehicle_capacity", 50]},
+                "current_vehicles": {"$ifNull": ["$vehicle_count", 0]}
+            }},
+            # Filter only stations with available capacity
+            {"$match": {"$expr": {"$lt": ["$current_vehicles", "$vehicle_capacity"]}}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "station_id": 1, "station_name": 1, "name": 1, "location": 1, "capacity": 1,
+                          "vehicle_capacity": 1, "current_vehicles": 1, "distance_m": 1}}
+        ]))
+
         for station in stations:
-            current_count = vehicle_collection.count_documents({"station_id": station["station_id"]})
-            station["current_vehicles"] = current_count
-            station["available_capacity"] = max(0, station.get("vehicle_capacity", 50) - current_count)
-            station["is_full"] = current_count >= station.get("vehicle_capacity", 50)
-        
-        # Filter only stations with available capacity
-        available_stations = [s for s in stations if not s["is_full"]]
-        
-        return JsonResponse({"status": "success", "stations": available_stations})
+            station["available_capacity"] = station["vehicle_capacity"] - station["current_vehicles"]
+            station["is_full"] = False
+            distance = station.pop("distance_m", None)
+            station["distance_km"] = round(distance / 1000, 2) if distance is not None else None
+
+        return JsonResponse({"status": "success", "stations": stations})
         
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)})
@@ -341,8 +521,8 @@ def transfer_vehicle(request):
     try:
         data = json.loads(request.body)
         vehicle_id = data.get("vehicle_id")
-        source_station_id = data.get("source_station_id")
-        target_station_id = data.get("target_station_id")
+        source_station_id = canonical_station_id(data.get("source_station_id"))
+        target_station_id = canonical_station_id(data.get("target_station_id"))
         
         if not all([vehicle_id, source_station_id, target_station_id]):
             return JsonResponse({"status": "error", "message": "Missing required fields"})
@@ -356,20 +536,19 @@ def transfer_vehicle(request):
         if vehicle.get("status") in ["in_use", "charging"]:
             return JsonResponse({"status": "error", "message": "Vehicle is currently in use or charging"})
         
-        # Check target station capacity
-        target_station = station_collection.find_one({"station_id": target_station_id})
-        if not target_station:
-            return JsonResponse({"status": "error", "message": "Target station not found"})
-        
-        current_count = vehicle_collection.count_documents({"station_id": target_station_id})
-        target_capacity = target_station.get("vehicle_capacity", 50)
+        if source_station_id == target_station_id:
+            return JsonResponse({"status": "error", "message": "Vehicle is already at the target station"})
         
-        if current_count >= target_capacity:
+        # Take a slot at the target station
+        granted = claim_slots(target_station_id)
+        if granted is None:
+            return JsonResponse({"status": "error", "message": "Target station not found"})
+        if not granted:
             return JsonResponse({"status": "error", "message": "Target station is at full capacity"})
         
-        # Transfer the vehicle
-        vehicle_collection.update_one(
-            {"vehicle_id": vehicle_id},
+        # Transfer the vehicle, unless it left the source station meanwhile
+        transferred = vehicle_collection.update_one(
+            {"vehicle_id": vehicle_id, "station_id": source_station_id},
             {
                 "$set": {
                     "station_id": target_station_id,
@@ -382,13 +561,109 @@ def transfer_vehicle(request):
                 }
             }
         )
+        if not transferred.modified_count:
+            release_slots(target_station_id)
+            return JsonResponse({"status": "error", "message": "Vehicle not found in source station"})
+        release_slots(source_station_id)
         
+        invalidate_station(source_station_id, target_station_id)
         return JsonResponse({"status": "success", "message": "Vehicle transferred successfully"})
         
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)})
 
+def _rebalancing_params(params):
+    """(days, min_battery, max_km) from request params; raises ValueError if out of range"""
+    days = int(params.get("days", DEFAULT_DEMAND_DAYS))
+    min_battery = float(params.get("min_battery", DEFAULT_MIN_BATTERY))
+    max_km = float(params.get("max_km", DEFAULT_MAX_KM))
+    if days <= 0 or not 0 <= min_battery <= 100 or max_km <= 0:
+        raise ValueError("days and max_km must be positive and min_battery between 0 and 100")
+    return days, min_battery, max_km
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_rebalancing_plan(request):
+    """
+    Transfers that bring every station's ready vehicles to its share of
+    recent demand at the fewest vehicle-km (vehicles/rebalancing.py).
+    ?days= (default 7) sets the demand window, ?min_battery= (default 30)
+    which vehicles count as ready and ?max_km= (default 15) the longest
+    transfer. Nothing is moved.
+    """
+    try:
+        try:
+            days, min_battery, max_km = _rebalancing_params(request.GET)
+        except ValueError as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+        plan = plan_rebalancing(days, min_battery, max_km)
+        return JsonResponse({"status": "success", **plan})
+
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def execute_rebalancing(request):
+    """
+    Plan as get_rebalancing_plan does (same options, in the JSON body) and
+    carry the transfers out as one batch. Transfers shrink when a target
+    fills up or vehicles are rented meanwhile; each reports how many moved.
+    """
+    try:
+        try:
+            days, min_battery, max_km = _rebalancing_params(json.loads(request.body or b"{}"))
+        except ValueError as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+        plan = plan_rebalancing(days, min_battery, max_km)
+        moved, transfers = execute_plan(plan, min_battery)
+        planned = plan["summary"]["vehicles_moved"]
+        return JsonResponse({
+            "status": "success" if moved == planned else "partial",
+            "message": f"{moved} of {planned} planned vehicles transferred",
+            "summary": {**plan["summary"], "vehicles_transferred": moved},
+            "transfers": transfers
+        })
+
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
 # --- Update Vehicle Status ---
+@csrf_exempt
+@require_http_methods(["PATCH"])
+def bulk_update_vehicle_status(request):
+    """
+    Set the status of many vehicles (vehicles/bulk_status.py), selected by
+    "vehicle_ids" and/or "filter" (station_id, model, type, status), with
+    the same port release and queue handling as update_vehicle_status.
+    Returns one outcome per vehicle.
+    """
+    try:
+        data = json.loads(request.body)
+        new_status = data.get("status")
+        if new_status not in BULK_STATUSES:
+            return JsonResponse({
+                "status": "error",
+                "message": f"Invalid status. Valid options: {', '.join(BULK_STATUSES)}"
+            }, status=400)
+        vehicle_ids = data.get("vehicle_ids")
+        query = selection_query(vehicle_ids, data.get("filter"))
+        summary, results = apply_status(query, new_status, vehicle_ids)
+
+    except json.JSONDecodeError:
+        return JsonResponse({"status": "error", "message": "Invalid JSON data"}, status=400)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+    return JsonResponse({
+        "status": "success" if summary["updated"] == len(results) else "partial",
+        "message": f"{summary['updated']} of {len(results)} vehicles updated to {new_status}",
+        "summary": summary,
+        "results": results
+    })
+
 @csrf_exempt
 @require_http_methods(["PATCH"])
 def update_vehicle_status(request, vehicle_id):
@@ -418,6 +693,8 @@ def update_vehicle_status(request, vehicle_id):
         # Get vehicle's station_id
         vehicle_station_id = vehicle.get("station_id")
         
+        freed_at = None
+        
         # Prepare update data
         update_data = {
             "status": new_status,
@@ -433,60 +710,43 @@ def update_vehicle_status(request, vehicle_id):
                     "message": "Vehicle is already charging"
                 }, status=400)
             
-            # Find an available charging port at the vehicle's station
-            charging_port = charging_ports_collection.find_one({
-                "station_id": vehicle_station_id,
-                "status": "available"
-            })
+            # Claim an available charging port at the vehicle's station
+            charging_port = claim_port(vehicle_station_id, vehicle_id)
             
             if not charging_port:
+                # Wait in the station's queue; a port freed meanwhile is handed out straight away
+                entry = enqueue(vehicle)
+                started = dict(dispatch(vehicle_station_id))
+                if vehicle_id in started:
+                    invalidate_station(vehicle_station_id)
+                    return JsonResponse({
+                        "status": "success",
+                        "message": f"Vehicle status updated to charging. Assigned to charging port {started[vehicle_id]}. Battery charging will begin automatically."
+                    })
+                position = queue_position(entry)
                 return JsonResponse({
-                    "status": "error", 
-                    "message": "No charging ports available at this station. Please try again later."
-                }, status=400)
+                    "status": "queued",
+                    "message": f"No charging ports available at this station. Vehicle queued for charging at position {position}.",
+                    "position": position
+                }, status=202)
             
             # Assign the charging port
-            port_id = charging_port.get("port_id")
-            update_data["charging_port_id"] = port_id
-            update_data["charging_started_at"] = datetime.now().isoformat()
-            
-            # Mark the port as occupied
-            charging_ports_collection.update_one(
-                {"port_id": port_id},
-                {
-                    "$set": {
-                        "status": "occupied",
-                        "vehicle_id": vehicle_id,
-                        "occupied_at": datetime.now().isoformat()
-                    },
-                    "$inc": {"usage_count": 1}
-                }
-            )
-            
-            # Start the automatic charging process
-            start_charging_process(vehicle_id, port_id, vehicle_station_id)
+            update_data.update(charging_fields(charging_port))
             
         # Handle status change from charging to something else
         elif vehicle.get("status") == "charging" and new_status != "charging":
-            # Stop the charging process
-            stop_charging_process(vehicle_id)
-            
-            # Free up the charging port
+            # The session ends with the status change; free up the charging port
             current_port_id = vehicle.get("charging_port_id")
             if current_port_id:
-                charging_ports_collection.update_one(
-                    {"port_id": current_port_id},
-                    {
-                        "$set": {
-                            "status": "available",
-                            "vehicle_id": None,
-                            "occupied_at": None
-                        }
-                    }
-                )
+                release_port(vehicle_station_id, current_port_id, vehicle_id)
+                freed_at = time.monotonic()
                 update_data["charging_port_id"] = None
                 update_data["charging_started_at"] = None
         
+        # Any other status takes the vehicle out of the charging queue
+        if new_status != "charging":
+            dequeue(vehicle_id)
+        
         # Add any additional data from the request
         if "battery_level" in data:
             update_data["battery_level"] = data["battery_level"]
@@ -495,17 +755,30 @@ def update_vehicle_status(request, vehicle_id):
         if "charging_port_id" in data and new_status != "charging":
             update_data["charging_port_id"] = data["charging_port_id"]
         
-        # Update the vehicle in the database
-        result = vehicle_collection.update_one(
-            {"vehicle_id": vehicle_id},
-            {"$set": update_data}
+        # Update the vehicle in the database; a charging request only applies
+        # if no concurrent request started charging it first
+        vehicle_query = {"vehicle_id": vehicle_id}
+        if new_status == "charging":
+            vehicle_query["status"] = {"$ne": "charging"}
+        updated_vehicle = vehicle_collection.find_one_and_update(
+            vehicle_query,
+            {"$set": update_data},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
         )
         
-        if result.modified_count == 0:
+        if not updated_vehicle:
+            if new_status == "charging":
+                # Undo the port claim
+                release_port(vehicle_station_id, update_data["charging_port_id"], vehicle_id)
+                return JsonResponse({"status": "error", "message": "Vehicle is already charging"}, status=400)
             return JsonResponse({"status": "error", "message": "Failed to update vehicle status"}, status=500)
         
-        # Get the updated vehicle data
-        updated_vehicle = vehicle_collection.find_one({"vehicle_id": vehicle_id}, {"_id": 0})
+        if freed_at is not None:
+            # Hand the freed port to the next queued vehicle
+            dispatch(vehicle_station_id, freed_at)
+        
+        invalidate_station(vehicle_station_id)
         
         # Prepare response message
         if new_status == "charging" and "charging_port_id" in update_data:
@@ -28,6 +28,11 @@ const parkingStationSchema = new mongoose.Schema({
     type: Number,
     required: true
   },
+  // Vehicles parked here, kept by every write that moves a vehicle
+  // (admin-app vehicles/occupancy.py); left unset until seeded
+  vehicle_count: {
+    type: Number
+  },
   password: {
     type: String,
     required: true // Admin authentication
@@ -41,10 +46,31 @@ const parkingStationSchema = new mongoose.Schema({
       type: Number,
       required: true
     }
+  },
+  // GeoJSON copy of coordinates for the admin app's nearby-station search
+  geo_location: {
+    type: {
+      type: String,
+      enum: ['Point'],
+      default: 'Point'
+    },
+    coordinates: [Number] // [longitude, latitude]
   }
 }, {
   timestamps: true,
   collection: 'stations' // Match admin-app collection name
 });
 
+parkingStationSchema.index({ geo_location: '2dsphere' });
+
+parkingStationSchema.pre('validate', function (next) {
+  if (this.coordinates && this.coordinates.latitude != null && this.coordinates.longitude != null) {
+    this.geo_location = {
+      type: 'Point',
+      coordinates: [this.coordinates.longitude, this.coordinates.latitude]
+    };
+  }
+  next();
+});
+
 module.exports = mongoose.model('ParkingStation', parkingStationSchema);
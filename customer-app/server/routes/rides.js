@@ -5,6 +5,7 @@ const Customer = require('../models/Customer');
 const ParkingStation = require('../models/ParkingStation');
 const ActiveRideSession = require('../models/ActiveRideSession');
 const auth = require('../middleware/auth');
+const { applyRideChange } = require('../services/stationDailyStats');
 const router = express.Router();
 
 // Debug route to check request data
@@ -78,6 +79,10 @@ router.post('/start', auth, async (req, res) => {
     await ride.save();
     console.log('Ride saved successfully');
 
+    // Keep the admin station_daily_stats rollups current
+    await applyRideChange(null, ride.toObject())
+      .catch((err) => console.error('Station daily stats update failed:', err.message));
+
     // Update vehicle status
     await Vehicle.findOneAndUpdate(
       { vehicle_id },
@@ -160,6 +165,8 @@ router.post('/end', auth, async (req, res) => {
       return res.status(400).json({ message: 'Insufficient wallet balance' });
     }
 
+    const rideBefore = ride.toObject();
+
     // Update ride with end station information
     ride.drop_station_id = endStationId; // End station ID (different from start station)
     ride.distance_km = distance || 0;
@@ -178,6 +185,9 @@ router.post('/end', auth, async (req, res) => {
     await ride.save();
     console.log('Ride updated successfully');
 
+    await applyRideChange(rideBefore, ride.toObject())
+      .catch((err) => console.error('Station daily stats update failed:', err.message));
+
     // Update customer wallet
     await Customer.findOneAndUpdate(
       { customer_id },
@@ -186,15 +196,28 @@ router.post('/end', auth, async (req, res) => {
     console.log('Customer wallet updated');
 
     // Update vehicle status and move to end station
-    await Vehicle.findOneAndUpdate(
+    const dropStationId = Number(endStationId || ride.station_id);
+    const vehicleBefore = await Vehicle.findOneAndUpdate(
       { vehicle_id: ride.vehicle_id },
       { 
         status: 'available',
-        station_id: endStationId || ride.station_id // Move to end station or keep at start station
+        station_id: dropStationId // Move to end station or keep at start station
       }
     );
     console.log('Vehicle status and location updated');
 
+    // Move the vehicle between the stations' occupancy counters. A ride always
+    // ends, so the drop station may go over capacity; only seeded counters move.
+    if (vehicleBefore && vehicleBefore.station_id !== dropStationId) {
+      await ParkingStation.bulkWrite([
+        { updateOne: { filter: { station_id: vehicleBefore.station_id, vehicle_count: { $exists: true } },
+                       update: { $inc: { vehicle_count: -1 } } } },
+        { updateOne: { filter: { station_id: dropStationId, vehicle_count: { $exists: true } },
+                       update: { $inc: { vehicle_count: 1 } } } }
+      ], { ordered: false })
+        .catch((err) => console.error('Station occupancy update failed:', err.message));
+    }
+
     // Deactivate the ride session
     await ActiveRideSession.findOneAndUpdate(
       { customer_id, ride_id, session_active: true },
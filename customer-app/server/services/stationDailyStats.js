@@ -0,0 +1,78 @@
+const mongoose = require('mongoose');
+
+// Keeps the admin app's station_daily_stats rollups in step with ride writes.
+// Must match ride_contribution() in admin-app/server/reports/rollups.py.
+
+const NO_PAYMENT_STATUS = 'none';
+
+const fieldKey = (value) => String(value).replace(/\./g, '_').replace(/^\$+/, '');
+
+const number = (value) => (typeof value === 'number' && Number.isFinite(value) ? value : 0);
+
+// UTC midnight of the ride's start_time, or null
+const rideDay = (ride) => {
+  const start = ride.start_time instanceof Date ? ride.start_time : null;
+  if (!start) return null;
+  return new Date(Date.UTC(start.getUTCFullYear(), start.getUTCMonth(), start.getUTCDate()));
+};
+
+const rideContribution = (ride) => {
+  const paymentKey = fieldKey(ride.payment_status || NO_PAYMENT_STATUS);
+  const amount = number(ride.amount);
+  const distance = number(ride.distance_km);
+  const duration = number(ride.duration_minutes);
+
+  const counters = {
+    rides: 1,
+    [`by_status.${fieldKey(ride.status)}`]: 1,
+    [`by_payment_status.${paymentKey}.count`]: 1,
+    [`by_payment_status.${paymentKey}.amount`]: amount
+  };
+  if (ride.payment_status === 'paid') {
+    counters.revenue = amount;
+  }
+  if (ride.status === 'completed') {
+    counters.completed = 1;
+    counters.distance = distance;
+    counters.duration = duration;
+    counters.fare = number(ride.fare);
+  }
+  if (ride.vehicle_id !== undefined && ride.vehicle_id !== null) {
+    const vehicle = `vehicles.${fieldKey(ride.vehicle_id)}`;
+    counters[`${vehicle}.rides`] = 1;
+    counters[`${vehicle}.distance`] = distance;
+    counters[`${vehicle}.duration`] = duration;
+  }
+  return counters;
+};
+
+// Apply the difference between two versions of a ride (plain objects).
+// Pass before = null for a new ride.
+const applyRideChange = async (before, after) => {
+  const deltas = new Map();
+  for (const [ride, sign] of [[before, -1], [after, 1]]) {
+    if (!ride) continue;
+    const day = rideDay(ride);
+    const key = `${ride.station_id}|${day ? day.getTime() : ''}`;
+    if (!deltas.has(key)) {
+      deltas.set(key, { station_id: ride.station_id, day, counters: {} });
+    }
+    const { counters } = deltas.get(key);
+    for (const [field, value] of Object.entries(rideContribution(ride))) {
+      counters[field] = (counters[field] || 0) + sign * value;
+    }
+  }
+
+  const ops = [];
+  for (const { station_id, day, counters } of deltas.values()) {
+    const inc = Object.fromEntries(Object.entries(counters).filter(([, value]) => value !== 0));
+    if (Object.keys(inc).length) {
+      ops.push({ updateOne: { filter: { station_id, day }, update: { $inc: inc }, upsert: true } });
+    }
+  }
+  if (ops.length) {
+    await mongoose.connection.collection('station_daily_stats').bulkWrite(ops, { ordered: false });
+  }
+};
+
+module.exports = { applyRideChange, rideContribution, rideDay };